@@ -14,18 +14,19 @@ from utils.evaluation import (
     evaluate_model,
     print_evaluation_report
 )
+from utils.message_table import load_messages
 
 # Model paths
 SAFETY_CLASSIFIER_PATH = "./models/safety_classifier"
 INTENT_CLASSIFIER_PATH = "./models/intent_classifier"
 
-def load_test_data():
-    """Load test data"""
-    # TODO: Load from test_sets directory
-    # For now, use seed dialogues as example
-    with open('../SEED_DIALOGUES.json', 'r') as f:
-        data = json.load(f)
-    return data.get('dialogues', [])
+# TODO: Load from test_sets directory
+# For now, use seed dialogues as example
+TEST_DATA_FILE = '../SEED_DIALOGUES.json'
+
+def load_test_data(role=None, columns=None):
+    """Load test messages (optionally one role) from the cached message table"""
+    return load_messages(TEST_DATA_FILE, role=role, columns=columns)
 
 def evaluate_safety_classifier():
     """Evaluate safety classifier"""
@@ -42,25 +43,23 @@ def evaluate_safety_classifier():
     model = AutoModelForSequenceClassification.from_pretrained(SAFETY_CLASSIFIER_PATH)
     
     # Load test data
-    test_data = load_test_data()
+    test_data = load_test_data(role='user', columns=['text', 'risk_level'])
     
     # Evaluate
     y_true = []
     y_pred = []
     
-    for dialogue in test_data:
-        for message in dialogue.get('messages', []):
-            if message.get('role') == 'user':
-                true_risk = message.get('risk_level', 'none')
-                y_true.append(true_risk)
-                
-                # Predict
-                inputs = tokenizer(message['text'], return_tensors='pt', truncation=True, max_length=128)
-                with torch.no_grad():
-                    outputs = model(**inputs)
-                    predicted_label = torch.argmax(outputs.logits, dim=1).item()
-                    risk_levels = ['none', 'low', 'medium', 'high']
-                    y_pred.append(risk_levels[predicted_label])
+    for message in test_data:
+        true_risk = message['risk_level'] or 'none'
+        y_true.append(true_risk)
+        
+        # Predict
+        inputs = tokenizer(message['text'], return_tensors='pt', truncation=True, max_length=128)
+        with torch.no_grad():
+            outputs = model(**inputs)
+            predicted_label = torch.argmax(outputs.logits, dim=1).item()
+            risk_levels = ['none', 'low', 'medium', 'high']
+            y_pred.append(risk_levels[predicted_label])
     
     # Calculate metrics
     high_risk_recall = calculate_safety_recall(y_true, y_pred, 'high')
@@ -92,24 +91,22 @@ def evaluate_intent_classifier():
     reverse_label_map = {v: k for k, v in label_map.items()}
     
     # Load test data
-    test_data = load_test_data()
+    test_data = load_test_data(role='assistant', columns=['text', 'intent'])
     
     # Evaluate
     y_true = []
     y_pred = []
     
-    for dialogue in test_data:
-        for message in dialogue.get('messages', []):
-            if message.get('role') == 'assistant':
-                true_intent = message.get('intent', 'other')
-                y_true.append(true_intent)
-                
-                # Predict
-                inputs = tokenizer(message['text'], return_tensors='pt', truncation=True, max_length=128)
-                with torch.no_grad():
-                    outputs = model(**inputs)
-                    predicted_label = torch.argmax(outputs.logits, dim=1).item()
-                    y_pred.append(reverse_label_map[predicted_label])
+    for message in test_data:
+        true_intent = message['intent'] or 'other'
+        y_true.append(true_intent)
+        
+        # Predict
+        inputs = tokenizer(message['text'], return_tensors='pt', truncation=True, max_length=128)
+        with torch.no_grad():
+            outputs = model(**inputs)
+            predicted_label = torch.argmax(outputs.logits, dim=1).item()
+            y_pred.append(reverse_label_map[predicted_label])
     
     # Calculate metrics
     accuracy = accuracy_score(y_true, y_pred)
@@ -130,17 +127,10 @@ def evaluate_validation_rate():
     print("Validation Rate Evaluation")
     print("=" * 50)
     
-    test_data = load_test_data()
-    
-    predictions = []
-    sentiments = []
+    test_data = load_test_data(columns=['role', 'text', 'sentiment'])
     
-    for dialogue in test_data:
-        for message in dialogue.get('messages', []):
-            if message.get('role') == 'assistant':
-                predictions.append(message['text'])
-            elif message.get('role') == 'user':
-                sentiments.append(message.get('sentiment', 'neutral'))
+    predictions = [m['text'] for m in test_data if m['role'] == 'assistant']
+    sentiments = [m['sentiment'] or 'neutral' for m in test_data if m['role'] == 'user']
     
     validation_rate = calculate_validation_rate(predictions, None, sentiments)
     print(f"\nValidation rate: {validation_rate:.4f}")
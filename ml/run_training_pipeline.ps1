@@ -14,6 +14,8 @@ $TARGET_DIALOGUES = 500
 $SEED_FILE = Join-Path $PROJECT_ROOT "SEED_DIALOGUES.json"
 $EXPANDED_FILE = Join-Path $PROJECT_ROOT "data\SEED_DIALOGUES_EXPANDED.json"
 $DATA_DIR = Join-Path $PROJECT_ROOT "data"
+$VALIDATION_SAMPLE = 2000
+$MAX_ERROR_RATE = 0.01
 
 # Create data directory
 if (-not (Test-Path $DATA_DIR)) {
@@ -37,12 +39,26 @@ if ($LASTEXITCODE -ne 0) {
 # Step 2: Validate
 Write-Host ""
 Write-Host "✅ Step 2: Validating dialogues..." -ForegroundColor Yellow
+# A sample check takes seconds; the full pass runs if the sample has any bad dialogue or can't rule out too many
 python "$SCRIPT_DIR\tools\validate_dialogues.py" `
-  --input $EXPANDED_FILE
-
-if ($LASTEXITCODE -ne 0) {
-    Write-Host "❌ Validation failed" -ForegroundColor Red
-    exit 1
+  --input $EXPANDED_FILE `
+  --sample $VALIDATION_SAMPLE `
+  --stratify concern session_type `
+  --max-error-rate $MAX_ERROR_RATE
+
+if ($LASTEXITCODE -eq 0) {
+    Write-Host "Sample check passed, skipping full validation"
+} else {
+    python "$SCRIPT_DIR\tools\validate_dialogues.py" `
+      --input $EXPANDED_FILE `
+      --workers $env:NUMBER_OF_PROCESSORS `
+      --diagnostics "$DATA_DIR\validation_diagnostics.jsonl" `
+      --max-diagnostics 10000
+
+    if ($LASTEXITCODE -ne 0) {
+        Write-Host "❌ Validation failed" -ForegroundColor Red
+        exit 1
+    }
 }
 
 # Step 3: Train safety classifier
@@ -15,6 +15,8 @@ TARGET_DIALOGUES=500
 SEED_FILE="$PROJECT_ROOT/SEED_DIALOGUES.json"
 EXPANDED_FILE="$PROJECT_ROOT/data/SEED_DIALOGUES_EXPANDED.json"
 DATA_DIR="$PROJECT_ROOT/data"
+VALIDATION_SAMPLE=2000
+MAX_ERROR_RATE=0.01
 
 # Create data directory
 mkdir -p "$DATA_DIR"
@@ -36,12 +38,22 @@ fi
 # Step 2: Validate
 echo ""
 echo "✅ Step 2: Validating dialogues..."
-python "$SCRIPT_DIR/tools/validate_dialogues.py" \
-  --input "$EXPANDED_FILE"
-
-if [ $? -ne 0 ]; then
-  echo "❌ Validation failed"
-  exit 1
+# A sample check takes seconds; the full pass runs if the sample has any bad dialogue or can't rule out too many
+if python "$SCRIPT_DIR/tools/validate_dialogues.py" \
+  --input "$EXPANDED_FILE" \
+  --sample "$VALIDATION_SAMPLE" \
+  --stratify concern session_type \
+  --max-error-rate "$MAX_ERROR_RATE"; then
+  echo "Sample check passed, skipping full validation"
+else
+  python "$SCRIPT_DIR/tools/validate_dialogues.py" \
+    --input "$EXPANDED_FILE" \
+    --workers "$(nproc 2>/dev/null || echo 1)" \
+    --diagnostics "$DATA_DIR/validation_diagnostics.jsonl" \
+    --max-diagnostics 10000 || {
+    echo "❌ Validation failed"
+    exit 1
+  }
 fi
 
 # Step 3: Train safety classifier
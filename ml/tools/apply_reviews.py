@@ -4,123 +4,143 @@ Apply Reviews Tool
 Applies clinician reviews to filter and update training data
 """
 
-import json
 import sys
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence
 import argparse
 
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.dialogue_store import DialogueWriter
+from utils.external_sort import DEFAULT_BUFFER_SIZE
+from utils.review_join import LATEST, PARTITIONS, PRIORITY, RESOLUTIONS, UNREVIEWED, join_reviews
+from utils.schemas import SchemaError
+
 class ReviewApplier:
-    """Apply clinician reviews to training data"""
+    """Apply clinician reviews to training data
+
+    The corpus and the review files are streamed, never loaded whole: see
+    ``utils.review_join.join_reviews``.
+    """
     
-    def __init__(self, data_file: str, reviews_file: str):
+    def __init__(self, data_file: str, reviews_files: Sequence[str], resolution: str = LATEST,
+                 reviewer_priority: Sequence[str] = (), buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 tmp_dir: Optional[str] = None):
         self.data_file = Path(data_file)
-        self.reviews_file = Path(reviews_file)
-        self.data = self._load_data()
-        self.reviews = self._load_reviews()
-    
-    def _load_data(self) -> Dict:
-        """Load training data"""
-        with open(self.data_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        self.reviews_files = [Path(path) for path in reviews_files]
+        self.resolution = resolution
+        self.reviewer_priority = list(reviewer_priority)
+        self.buffer_size = buffer_size
+        self.tmp_dir = tmp_dir
     
-    def _load_reviews(self) -> Dict:
-        """Load reviews"""
-        with open(self.reviews_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def _header(self, description: str) -> Dict:
+        return {
+            'version': '1.0',
+            'description': description,
+            'source_file': str(self.data_file),
+            'reviews_files': [str(path) for path in self.reviews_files],
+            'resolution': self.resolution,
+        }
     
-    def apply_reviews(self, include_revision: bool = False) -> Dict:
-        """Apply reviews to filter data"""
-        dialogues = self.data.get('dialogues', [])
-        reviews_dict = {r['dialogue_id']: r for r in self.reviews.get('reviews', [])}
-        
-        approved_dialogues = []
-        rejected_dialogues = []
-        needs_revision_dialogues = []
-        unreviewed_dialogues = []
-        
-        for dialogue in dialogues:
-            dialogue_id = dialogue.get('dialogue_id')
-            review = reviews_dict.get(dialogue_id)
+    def apply_reviews(self, output_file: Optional[str] = None, include_revision: bool = False,
+                      partition_dir: Optional[str] = None, partition_suffix: str = '.jsonl') -> Dict[str, int]:
+        """Write reviewed dialogues to their outputs in one pass, returning each partition's size
+
+        ``output_file`` gets the approved dialogues (plus those needing
+        revision with ``include_revision``); ``partition_dir`` gets one file
+        per partition: approved, needs_revision, rejected and unreviewed.
+        Partition sizes are stored as statistics in every output.
+        """
+        with ExitStack() as stack:
+            writers: List[DialogueWriter] = []
+            outputs: Dict[str, List[DialogueWriter]] = {partition: [] for partition in PARTITIONS}
             
-            if not review:
-                unreviewed_dialogues.append(dialogue)
-                continue
+            def open_writer(path, description: str, partitions: List[str]):
+                writer = stack.enter_context(DialogueWriter(path, self._header(description)))
+                writers.append(writer)
+                for partition in partitions:
+                    outputs[partition].append(writer)
             
-            status = review['status']
+            if output_file:
+                partitions = ['approved', 'needs_revision'] if include_revision else ['approved']
+                open_writer(output_file, 'Clinician-reviewed training dialogues', partitions)
+            if partition_dir:
+                for partition in PARTITIONS:
+                    path = Path(partition_dir) / f'{partition}{partition_suffix}'
+                    open_writer(path, f'Dialogues with review status: {partition}', [partition])
             
-            if status == 'approved':
-                # Mark as reviewed and approved
-                dialogue['labels']['clinician_reviewed'] = True
-                dialogue['labels']['clinician_approved'] = True
-                dialogue['labels']['review_status'] = 'approved'
-                if 'reviewed_at' in review:
-                    dialogue['labels']['reviewed_at'] = review['reviewed_at']
-                approved_dialogues.append(dialogue)
-            elif status == 'needs_revision':
-                if include_revision:
-                    dialogue['labels']['clinician_reviewed'] = True
-                    dialogue['labels']['clinician_approved'] = False
-                    dialogue['labels']['review_status'] = 'needs_revision'
-                    needs_revision_dialogues.append(dialogue)
-                else:
-                    rejected_dialogues.append(dialogue)
-            elif status == 'rejected':
-                rejected_dialogues.append(dialogue)
-        
-        return {
-            'approved': approved_dialogues,
-            'needs_revision': needs_revision_dialogues,
-            'rejected': rejected_dialogues,
-            'unreviewed': unreviewed_dialogues
-        }
+            counts = join_reviews(
+                self.data_file, self.reviews_files,
+                {partition: _Fanout(targets) for partition, targets in outputs.items() if targets},
+                self.resolution, self.reviewer_priority, self.buffer_size, self.tmp_dir
+            )
+            for writer in writers:
+                writer.close(statistics=counts)
+        return counts
     
-    def save_filtered(self, filtered_data: Dict, output_file: str, include_revision: bool = False):
-        """Save filtered data"""
-        approved = filtered_data['approved']
-        if include_revision:
-            approved.extend(filtered_data['needs_revision'])
-        
-        output_data = {
-            'version': '1.0',
-            'description': 'Clinician-reviewed training dialogues',
-            'source_file': str(self.data_file),
-            'reviews_file': str(self.reviews_file),
-            'total_dialogues': len(approved),
-            'approved': len(filtered_data['approved']),
-            'needs_revision': len(filtered_data['needs_revision']),
-            'rejected': len(filtered_data['rejected']),
-            'unreviewed': len(filtered_data['unreviewed']),
-            'dialogues': approved
-        }
-        
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"\n✅ Filtered data saved to: {output_file}")
-        print(f"   Approved: {len(filtered_data['approved'])}")
-        if include_revision:
-            print(f"   Needs Revision (included): {len(filtered_data['needs_revision'])}")
-        print(f"   Rejected: {len(filtered_data['rejected'])}")
-        print(f"   Unreviewed: {len(filtered_data['unreviewed'])}")
+    def print_summary(self, counts: Dict[str, int], include_revision: bool = False):
+        print(f"   Approved: {counts['approved']}")
+        state = 'included' if include_revision else 'excluded'
+        print(f"   Needs Revision ({state}): {counts['needs_revision']}")
+        print(f"   Rejected: {counts['rejected']}")
+        print(f"   Unreviewed: {counts[UNREVIEWED]}")
+        if counts['orphaned']:
+            print(f"   ⚠️  Reviews of dialogues not in the corpus: {counts['orphaned']}")
+
+class _Fanout:
+    """Write each dialogue to one or more writers"""
+    
+    def __init__(self, writers: List[DialogueWriter]):
+        self.writers = writers
+    
+    def write(self, dialogue: Dict):
+        for writer in self.writers:
+            writer.write(dialogue)
+    
+    def write_encoded(self, line: str):
+        for writer in self.writers:
+            writer.write_encoded(line)
 
 def main():
     parser = argparse.ArgumentParser(description='Apply clinician reviews to training data')
     parser.add_argument('--data', '-d', required=True, help='Training data file')
-    parser.add_argument('--reviews', '-r', required=True, help='Reviews file')
-    parser.add_argument('--output', '-o', required=True, help='Output file')
-    parser.add_argument('--include-revision', action='store_true', 
-                       help='Include dialogues that need revision')
+    parser.add_argument('--reviews', '-r', required=True, nargs='+',
+                       help='Reviews files (JSON or JSONL); a dialogue reviewed in several is resolved by --resolution')
+    parser.add_argument('--output', '-o', help='Output file for approved dialogues')
+    parser.add_argument('--include-revision', action='store_true',
+                       help='Include dialogues that need revision in --output')
+    parser.add_argument('--partition-dir',
+                       help='Also write approved, needs_revision, rejected and unreviewed dialogues to separate files here')
+    parser.add_argument('--partition-suffix', default='.jsonl',
+                       help='Suffix of the partition files (default: .jsonl; e.g. .jsonl.zst to compress)')
+    parser.add_argument('--resolution', choices=RESOLUTIONS, default=LATEST,
+                       help='Keep the latest review of a dialogue, or the one by the highest-priority reviewer')
+    parser.add_argument('--reviewer-priority', nargs='+', default=[], metavar='REVIEWER',
+                       help='Reviewers, highest priority first (for --resolution priority)')
+    parser.add_argument('--sort-buffer', type=int, default=DEFAULT_BUFFER_SIZE,
+                       help=f'Records sorted in memory before spilling to disk (default: {DEFAULT_BUFFER_SIZE})')
+    parser.add_argument('--tmp-dir', help='Directory for sort spill files (default: system temp directory)')
     
     args = parser.parse_args()
+    if not args.output and not args.partition_dir:
+        parser.error('give --output, --partition-dir or both')
+    if args.resolution == PRIORITY and not args.reviewer_priority:
+        parser.error('--resolution priority needs --reviewer-priority')
     
-    applier = ReviewApplier(args.data, args.reviews)
-    filtered = applier.apply_reviews(include_revision=args.include_revision)
-    applier.save_filtered(filtered, args.output, include_revision=args.include_revision)
+    applier = ReviewApplier(args.data, args.reviews, args.resolution, args.reviewer_priority,
+                            args.sort_buffer, args.tmp_dir)
+    try:
+        counts = applier.apply_reviews(args.output, args.include_revision,
+                                       args.partition_dir, args.partition_suffix)
+    except SchemaError as e:
+        print(f"❌ Invalid reviews file: {e}")
+        sys.exit(1)
+    
+    if args.output:
+        print(f"\n✅ Filtered data saved to: {args.output}")
+    if args.partition_dir:
+        print(f"\n✅ Partitions saved to: {args.partition_dir}")
+    applier.print_summary(counts, include_revision=args.include_revision)
 
 if __name__ == '__main__':
     main()
-
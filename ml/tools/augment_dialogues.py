@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Augment Dialogues Tool
+Paraphrases the conversation pairs of a corpus into an augmented training table
+"""
+
+import sys
+import time
+from pathlib import Path
+import argparse
+
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent))
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.augmentation import (
+    DEFAULT_CACHE_DIR, DEFAULT_PARAPHRASE_MODEL, LexicalSubstitution, Seq2SeqParaphraser, TemplateReslot,
+    augment_frame,
+)
+from utils.data_preprocessing import load_conversations
+from expand_seed_dialogues import ASSISTANT_RESPONSE_PATTERNS, SLOT_FILLERS, USER_MESSAGE_TEMPLATES, USER_RESPONSES
+
+STRATEGY_NAMES = ['lexical', 'reslot', 'seq2seq']
+
+
+def build_strategies(names, paraphrase_model: str = DEFAULT_PARAPHRASE_MODEL, batch_size: int = 32):
+    """Strategy objects for the given names, with the generator tables for re-slotting"""
+    strategies = []
+    for name in names:
+        if name == 'lexical':
+            strategies.append(LexicalSubstitution())
+        elif name == 'reslot':
+            strategies.append(TemplateReslot([USER_MESSAGE_TEMPLATES, ASSISTANT_RESPONSE_PATTERNS, USER_RESPONSES],
+                                             SLOT_FILLERS))
+        elif name == 'seq2seq':
+            strategies.append(Seq2SeqParaphraser(paraphrase_model, batch_size=batch_size))
+    return strategies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Augment corpus conversation pairs with paraphrases')
+    parser.add_argument('--input', '-i', required=True, help='Dialogue corpus (JSONL or legacy JSON)')
+    parser.add_argument('--output', '-o', required=True, help='Output table (.parquet or .jsonl)')
+    parser.add_argument('--num-augmentations', '-n', type=int, default=3, help='Paraphrases per text per strategy')
+    parser.add_argument('--strategies', nargs='+', choices=STRATEGY_NAMES, default=['lexical', 'reslot'],
+                        help='Augmentation strategies to apply')
+    parser.add_argument('--column', default='user', help='Text column to paraphrase (user or assistant)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (part of the cache key)')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Worker processes for rule-based strategies')
+    parser.add_argument('--paraphrase-model', default=DEFAULT_PARAPHRASE_MODEL, help='Seq2seq model for seq2seq')
+    parser.add_argument('--batch-size', type=int, default=32, help='Texts per seq2seq forward pass')
+    parser.add_argument('--cache-dir', default=str(DEFAULT_CACHE_DIR), help='Augmentation cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute every augmentation')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pairs = pd.DataFrame(load_conversations(args.input))
+    print(f"📂 Loaded {len(pairs)} conversation pairs ({time.perf_counter() - start:.1f}s)")
+
+    start = time.perf_counter()
+    augmented = augment_frame(
+        pairs, args.num_augmentations, build_strategies(args.strategies, args.paraphrase_model, args.batch_size),
+        text_column=args.column, seed=args.seed, workers=args.workers,
+        cache_dir=Path(args.cache_dir), use_cache=not args.no_cache,
+    )
+    elapsed = time.perf_counter() - start
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix == '.parquet':
+        augmented.to_parquet(output_path, index=False)
+    else:
+        augmented.to_json(output_path, orient='records', lines=True, force_ascii=False)
+
+    print(f"\n✅ Augmented {len(pairs)} pairs to {len(augmented)} rows in {elapsed:.1f}s")
+    for name, count in augmented['augmentation'].value_counts().items():
+        print(f"   {name}: {count}")
+    print(f"   Saved to: {output_path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark Schema Decoding
+Compares json.load + field-by-field validation against typed decode-while-validate
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+import argparse
+
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.dialogue_store import iter_dialogues
+from utils.schemas import iter_checked_dialogues
+from validate_dialogues import DialogueValidator
+
+class SchemaDecodingBenchmark:
+    """Time both validation strategies over the same corpus"""
+
+    def __init__(self, dialogues_file: str, repeat: int = 3):
+        self.dialogues_file = Path(dialogues_file)
+        self.repeat = repeat
+        self.validator = DialogueValidator(str(self.dialogues_file))
+
+    def two_pass(self) -> int:
+        """Parse into dicts, then walk every field again"""
+        count = 0
+        for i, dialogue in enumerate(iter_dialogues(self.dialogues_file)):
+            self.validator.rules._validate_dialogue(dialogue, i)
+            count += 1
+        return count
+
+    def decode_and_validate(self) -> int:
+        """Typed decode that validates while parsing"""
+        count = 0
+        for i, (raw, dialogue, error) in enumerate(iter_checked_dialogues(self.dialogues_file)):
+            if error is None:
+                self.validator.rules._check_warnings(dialogue, i)
+            count += 1
+        return count
+
+    def _time(self, fn) -> float:
+        """Best wall-clock time of several runs, in seconds"""
+        best = float('inf')
+        for _ in range(self.repeat):
+            self.validator.rules.report.clear()
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def run(self) -> dict:
+        """Run both strategies and return dialogues/sec for each"""
+        count = self.two_pass()
+        two_pass = self._time(self.two_pass)
+        typed = self._time(self.decode_and_validate)
+        return {
+            'file': str(self.dialogues_file),
+            'dialogues': count,
+            'two_pass_per_sec': count / two_pass if two_pass else 0,
+            'typed_per_sec': count / typed if typed else 0,
+            'speedup': two_pass / typed if typed else 0,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dialogue decode + validation throughput')
+    parser.add_argument('--input', '-i', required=True, help='Dialogues file to decode')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per strategy (best is reported)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    results = SchemaDecodingBenchmark(args.input, args.repeat).run()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n📊 Decode + validate: {results['dialogues']} dialogues from {results['file']}")
+    print(f"   json.load + field checks: {results['two_pass_per_sec']:,.0f} dialogues/sec")
+    print(f"   typed schema decode:      {results['typed_per_sec']:,.0f} dialogues/sec")
+    print(f"   Speedup: {results['speedup']:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -4,36 +4,70 @@ Clinician Review Tool
 Tool for clinicians to review and approve synthetic training data
 """
 
-import json
 import sys
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 import argparse
 
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.dialogue_index import DialogueIndex, IndexedView
+from utils.compression import load_json
+from utils.journal import Journal, journal_path
+
 class ClinicianReviewTool:
     """Tool for clinician review of synthetic data"""
     
-    def __init__(self, data_file: str, output_file: str):
+    def __init__(self, data_file: str, output_file: str, filters: Optional[Dict[str, str]] = None):
         self.data_file = Path(data_file)
         self.output_file = Path(output_file)
-        self.data = self._load_data()
-        self.reviews = []
-        self.current_index = 0
+        self.dialogues = self._load_data(filters or {})
+        self.journal = Journal(journal_path(self.output_file))
+        self.reviews = self._resume()
+        self.current_index = self._first_unreviewed()
     
-    def _load_data(self) -> Dict:
-        """Load data to review"""
+    def _load_data(self, filters: Dict[str, str]) -> IndexedView:
+        """Open the data to review; dialogues are read on demand via the index"""
         if not self.data_file.exists():
             print(f"Error: Data file not found: {self.data_file}")
             sys.exit(1)
         
-        with open(self.data_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        index = DialogueIndex.open(self.data_file)
+        return IndexedView(index, index.lookup(**filters))
+    
+    def _resume(self) -> Dict[Optional[str], Dict]:
+        """Reviews from the output file and any journal a previous session left, by dialogue id
+        
+        Journal records are newer, so they replace earlier reviews of the same dialogue.
+        """
+        reviews = {}
+        if self.output_file.exists():
+            for review in load_json(self.output_file).get('reviews', []):
+                reviews[review.get('dialogue_id')] = review
+        journaled = self.journal.replay()
+        for review in journaled:
+            reviews[review.get('dialogue_id')] = review
+        if reviews:
+            print(f"↩️  Resuming with {len(reviews)} reviewed dialogues ({len(journaled)} from the journal)")
+        return reviews
+    
+    def _first_unreviewed(self) -> int:
+        """Position of the first dialogue without a review (the end if all are reviewed)"""
+        if not self.reviews:
+            return 0
+        ids = self.dialogues.index.ids
+        return next((i for i, position in enumerate(self.dialogues.positions) if ids[position] not in self.reviews),
+                    len(self.dialogues))
+    
+    def _record(self, review: Dict):
+        """Keep a review, journaling it before anything else happens"""
+        self.journal.append(review)
+        self.reviews[review['dialogue_id']] = review
     
     def _display_dialogue(self, dialogue: Dict):
         """Display dialogue for review"""
         print("\n" + "="*80)
-        print(f"Dialogue {self.current_index + 1} of {len(self.data.get('dialogues', []))}")
+        print(f"Dialogue {self.current_index + 1} of {len(self.dialogues)}")
         print("="*80)
         
         print(f"\nDialogue ID: {dialogue.get('dialogue_id', 'N/A')}")
@@ -122,16 +156,18 @@ class ClinicianReviewTool:
     
     def run(self):
         """Run review tool"""
-        dialogues = self.data.get('dialogues', [])
+        dialogues = self.dialogues
         
         print(f"\n👨‍⚕️  Clinician Review Tool")
         print(f"File: {self.data_file}")
         print(f"Total dialogues: {len(dialogues)}")
+        print(f"Journal: {self.journal.path}")
         print("\nCommands:")
         print("  - Press Enter to review current dialogue")
         print("  - Type 'skip' to skip")
         print("  - Type 'save' to save and exit")
-        print("  - Type 'quit' to exit without saving")
+        print("  - Type 'compact' to write the output file and keep reviewing")
+        print("  - Type 'quit' to exit without writing the output file (reviews stay in the journal)")
         print("  - Type 'prev' to go to previous")
         print("  - Type 'next' to go to next")
         
@@ -141,12 +177,16 @@ class ClinicianReviewTool:
             command = input(f"\n[Dialogue {self.current_index + 1}/{len(dialogues)}] Command (Enter to review): ").strip().lower()
             
             if command == 'quit':
-                if input("Exit without saving? (y/n): ").lower() == 'y':
+                if input(f"Exit without writing {self.output_file}? Reviews are kept in the journal (y/n): ").lower() == 'y':
+                    self.journal.close()
                     sys.exit(0)
             elif command == 'save':
                 self._save_reviews()
                 print("Exiting...")
                 break
+            elif command == 'compact':
+                self._save_reviews()
+                continue
             elif command == 'skip':
                 self.current_index += 1
                 continue
@@ -158,16 +198,12 @@ class ClinicianReviewTool:
                 self.current_index += 1
                 continue
             elif command == '' or command == 'review':
+                # A review is on disk once recorded
                 review = self.review_dialogue(dialogue)
                 if review:
-                    self.reviews.append(review)
+                    self._record(review)
                 
                 self.current_index += 1
-                
-                # Auto-save every 10 reviews
-                if len(self.reviews) % 10 == 0:
-                    self._save_reviews()
-                    print(f"\n💾 Auto-saved ({len(self.reviews)} reviews)")
             else:
                 print(f"Unknown command: {command}")
         
@@ -177,27 +213,25 @@ class ClinicianReviewTool:
             self._generate_summary()
     
     def _save_reviews(self):
-        """Save reviews to file"""
+        """Compact the journal into the reviews file"""
         output_data = {
             'version': '1.0',
             'source_file': str(self.data_file),
             'reviewed_at': datetime.now().isoformat(),
             'total_reviews': len(self.reviews),
-            'reviews': self.reviews
+            'reviews': list(self.reviews.values())
         }
         
-        self.output_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        self.journal.compact(self.output_file, output_data)
         
         print(f"\n✅ Reviews saved to: {self.output_file}")
     
     def _generate_summary(self):
         """Generate review summary"""
-        approved = sum(1 for r in self.reviews if r['status'] == 'approved')
-        needs_revision = sum(1 for r in self.reviews if r['status'] == 'needs_revision')
-        rejected = sum(1 for r in self.reviews if r['status'] == 'rejected')
+        reviews = self.reviews.values()
+        approved = sum(1 for r in reviews if r['status'] == 'approved')
+        needs_revision = sum(1 for r in reviews if r['status'] == 'needs_revision')
+        rejected = sum(1 for r in reviews if r['status'] == 'rejected')
         
         print("\n" + "="*80)
         print("REVIEW SUMMARY")
@@ -210,12 +244,20 @@ class ClinicianReviewTool:
 
 def main():
     parser = argparse.ArgumentParser(description='Clinician Review Tool')
-    parser.add_argument('--input', '-i', required=True, help='Input data file (JSON)')
-    parser.add_argument('--output', '-o', required=True, help='Output reviews file (JSON)')
+    parser.add_argument('--input', '-i', required=True, help='Input data file (JSON/JSONL, optionally .gz/.zst)')
+    parser.add_argument('--output', '-o', required=True, help='Output reviews file (JSON; .gz/.zst to compress)')
+    parser.add_argument('--concern', help='Only review dialogues with this concern')
+    parser.add_argument('--session-type', help='Only review dialogues of this session type')
+    parser.add_argument('--risk-level', help='Only review dialogues with this max risk level')
     
     args = parser.parse_args()
     
-    tool = ClinicianReviewTool(args.input, args.output)
+    filters = {
+        'concern': args.concern,
+        'session_type': args.session_type,
+        'max_risk_level': args.risk_level,
+    }
+    tool = ClinicianReviewTool(args.input, args.output, {k: v for k, v in filters.items() if v})
     tool.run()
 
 if __name__ == '__main__':
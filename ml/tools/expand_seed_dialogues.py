@@ -5,17 +5,30 @@ Expands seed dialogues from 20 to 500+ examples using templates and patterns
 """
 
 import json
-import os
+import math
 import sys
 import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime, timedelta
 import argparse
-from collections import Counter
+
+import numpy as np
 
 # Import synthetic generator components
 sys.path.append(str(Path(__file__).parent))
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.dialogue_store import DialogueWriter
+from utils.dialogue_model import Dialogue, load_compact_dialogues
+from utils.corpus_stats import CorpusStats, corpus_stats, record_corpus_stats
+from utils.template_sampler import AliasTable, SlotTable, gc_paused, object_array
+from utils.near_duplicates import NearDuplicateIndex, dialogue_text, print_near_duplicate_report
+from utils.bloom_filter import BloomFilter, dialogue_fingerprint, fingerprint_array
+from utils.reply_model import ReplyModel
+
 try:
     from generate_synthetic_data import USER_MESSAGE_TEMPLATES, ASSISTANT_RESPONSE_PATTERNS
 except ImportError:
@@ -52,172 +65,513 @@ THERAPEUTIC_TECHNIQUES = [
     'grounding', 'breathing', 'body_scan', 'validation', 'exploration'
 ]
 
+DEFAULT_DISTRIBUTION = {
+    'session_types': {'gentle_deep': 0.5, 'check-in': 0.3, 'micro_practice': 0.2},
+    'concerns': {c: 1.0 / len(CONCERNS) for c in CONCERNS}
+}
+
+# Values substituted into {slot}s of the message templates
+SLOT_FILLERS = {
+    'topic': ['work', 'relationships', 'the future', 'my health', 'family', 'school'],
+    'concern': ['I won\'t be able to handle it', 'something bad will happen', 'I\'ll fail', 'I\'m not good enough'],
+    'person': ['my partner', 'my friend', 'my family', 'my colleague', 'my parent'],
+    'event': ['the breakup', 'the loss', 'what happened', 'the argument'],
+    'situation': ['work', 'family', 'everything', 'my relationships'],
+    'difficulty': ['difficult', 'hard', 'heavy', 'painful', 'challenging'],
+}
+
+# User replies to each assistant intent (others fall back to 'validate')
+USER_RESPONSES = {
+    'validate': [
+        "Yes, I think so.",
+        "I'm not sure.",
+        "Maybe.",
+        "I guess I could try.",
+        "That makes sense."
+    ],
+    'probe_story': [
+        "It happened last week.",
+        "I'm not sure when it started.",
+        "It's been going on for a while.",
+        "Recently, I guess.",
+        "I can't remember exactly."
+    ],
+    'probe_root': [
+        "I think it started when I was younger.",
+        "I'm not sure where it comes from.",
+        "Maybe from my childhood?",
+        "I don't know.",
+        "It's hard to say."
+    ],
+    'reframe': [
+        "I never thought about it that way.",
+        "That's an interesting perspective.",
+        "I'm not sure I see it that way.",
+        "Maybe you're right.",
+        "I'll think about that."
+    ]
+}
+
+TECHNIQUE_FOR_INTENT = {
+    'validate': 'validation',
+    'probe_story': 'exploration',
+    'probe_root': 'exploration',
+    'reframe': 'cognitive_reframing',
+    'suggest_experiment': 'behavioral_experiment',
+    'offer_mindfulness': 'mindfulness',
+}
+
+# Assistant turns: validate, probe_story, one of THIRD_INTENTS, then LATER_INTENTS
+THIRD_INTENTS = ['probe_root', 'reframe']
+LATER_INTENTS = ['probe_root', 'reframe', 'suggest_experiment', 'offer_mindfulness']
+ASSISTANT_SENTIMENTS = ['negative', 'very_negative', 'neutral']
+
+# Inclusive range of turns per session type (anything else is a gentle_deep session)
+TURN_RANGES = {'check-in': (2, 4), 'micro_practice': (2, 3)}
+DEFAULT_TURN_RANGE = (4, 8)
+
+# Dialogues generated per shard; shards (not workers) fix the random streams
+DEFAULT_SHARD_SIZE = 10000
+
+# Timestamp origin for seeded runs, so a seed reproduces the same bytes on any day
+SEEDED_REFERENCE_TIME = datetime(2024, 2, 1)
+
+
+# Dialogues drawn per vectorized batch within a shard
+BATCH_SIZE = 4096
+
+# Stop topping up once fewer than this share of a round's dialogues are new
+MIN_ACCEPTANCE = 0.01
+
+# Top-up rounds ask for this much more than the expected shortfall
+TOP_UP_MARGIN = 1.2
+
+
+def shard_rng(master_seed: int, shard: int) -> np.random.Generator:
+    """Independent random stream for one shard, derived from the master seed"""
+    return np.random.default_rng(np.random.SeedSequence(master_seed, spawn_key=(shard,)))
+
+
+def shard_plan(needed: int, shard_size: int) -> List[Tuple[int, int, int]]:
+    """``(shard, start, count)`` for each shard covering ``needed`` dialogues"""
+    return [
+        (shard, start, min(shard_size, needed - start))
+        for shard, start in enumerate(range(0, needed, shard_size))
+    ]
+
+
+class BatchDialogueSampler:
+    """Generate dialogues N at a time from precompiled slot and alias tables
+
+    Every categorical choice for a batch (session type, concern, turns,
+    template, filler, intent, sentiment, ...) is one NumPy draw, texts are
+    pre-rendered and shared, and timestamps come from a precomputed table.
+    Only the final dict assembly runs per dialogue. With a reply model, user
+    replies are drawn from it a word per step instead of from ``USER_RESPONSES``.
+    """
+    
+    def __init__(self, rng: np.random.Generator, reference_time: datetime,
+                 distribution: Optional[Dict] = None, reply_model: Optional[ReplyModel] = None):
+        self.rng = rng
+        distribution = distribution or DEFAULT_DISTRIBUTION
+        
+        self.session_types = list(distribution['session_types'])
+        self.session_table = AliasTable.single(list(distribution['session_types'].values()))
+        self.concerns = list(distribution['concerns'])
+        self.concern_table = AliasTable.single(list(distribution['concerns'].values()))
+        
+        turn_ranges = [TURN_RANGES.get(t, DEFAULT_TURN_RANGE) for t in self.session_types]
+        self.min_turns = np.array([low for low, _ in turn_ranges], dtype=np.int64)
+        self.max_turns = np.array([high for _, high in turn_ranges], dtype=np.int64)
+        
+        self.first_messages = SlotTable(USER_MESSAGE_TEMPLATES, SLOT_FILLERS, fallback='anxiety')
+        self.first_codes = np.array([self.first_messages.code(c) for c in self.concerns], dtype=np.int64)
+        
+        self.intents = ['validate', 'probe_story'] + [i for i in LATER_INTENTS if i not in ('validate', 'probe_story')]
+        intent_codes = {intent: code for code, intent in enumerate(self.intents)}
+        self.third_intents = np.array([intent_codes[i] for i in THIRD_INTENTS], dtype=np.int64)
+        self.later_intents = np.array([intent_codes[i] for i in LATER_INTENTS], dtype=np.int64)
+        self.techniques = [TECHNIQUE_FOR_INTENT.get(i, 'other') for i in self.intents]
+        
+        self.assistant_texts = SlotTable(ASSISTANT_RESPONSE_PATTERNS, SLOT_FILLERS, fallback='probe_root')
+        self.assistant_codes = np.array([self.assistant_texts.code(i) for i in self.intents], dtype=np.int64)
+        self.replies = SlotTable(USER_RESPONSES, fallback='validate')
+        self.reply_codes = np.array([self.replies.code(i) for i in self.intents], dtype=np.int64)
+        self.reply_model = reply_model
+        if reply_model is not None:
+            # reply_contexts[intent, concern]: the model context a reply is drawn from
+            self.reply_contexts = np.array([[reply_model.context(i, c) for c in self.concerns]
+                                            for i in self.intents], dtype=np.int64)
+        
+        # Label values as object arrays, so a batch is gathered with one fancy index
+        self.session_objects = np.array(self.session_types, dtype=object)
+        self.concern_objects = np.array(self.concerns, dtype=object)
+        self.age_objects = np.array(AGE_RANGES, dtype=object)
+        self.intent_objects = np.array(self.intents, dtype=object)
+        self.sentiment_objects = np.array(ASSISTANT_SENTIMENTS, dtype=object)
+        self.technique_objects = np.array(self.techniques, dtype=object)
+        
+        # stamps[(day - 1) * positions + position]: the opening message at the
+        # base time, then assistant turns at +5s and user replies at +10s, 30s apart
+        self.positions = 2 * int(self.max_turns.max()) - 2
+        offsets = [0] + [5 + 30 * ((p - 1) // 2) if p % 2 else 10 + 30 * ((p - 2) // 2)
+                         for p in range(1, self.positions)]
+        self.stamps = np.array([
+            (reference_time - timedelta(days=day) + timedelta(seconds=offset)).isoformat() + 'Z'
+            for day in range(1, 31) for offset in offsets
+        ], dtype=object)
+    
+    def sample(self, dialogue_ids: List[str]) -> List[Dict]:
+        """Generate one dialogue per ID"""
+        rng = self.rng
+        n = len(dialogue_ids)
+        if not n:
+            return []
+        
+        session = self.session_table.sample_one(rng, n)
+        concern = self.concern_table.sample_one(rng, n)
+        turns = rng.integers(self.min_turns[session], self.max_turns[session], endpoint=True)
+        days = rng.integers(1, 30, n, endpoint=True)
+        first = self.first_messages.sample(rng, self.first_codes[concern])
+        ages = rng.integers(0, len(AGE_RANGES), n)
+        moods = rng.integers(3, 7, n, endpoint=True)
+        
+        # One row per assistant turn, across the whole batch
+        replies_per = turns - 1
+        total = int(replies_per.sum())
+        owner = np.repeat(np.arange(n), replies_per)
+        starts = np.cumsum(replies_per) - replies_per
+        turn = np.arange(total) - starts[owner]
+        intent = np.where(turn == 0, 0, np.where(
+            turn == 1, 1, np.where(
+                turn == 2,
+                self.third_intents[rng.integers(0, len(self.third_intents), total)],
+                self.later_intents[rng.integers(0, len(self.later_intents), total)])))
+        assistant = self.assistant_texts.sample(rng, self.assistant_codes[intent])
+        sentiment = rng.integers(0, len(ASSISTANT_SENTIMENTS), total)
+        if self.reply_model is None:
+            reply = self.replies.sample(rng, self.reply_codes[intent])
+        
+        # Most common sentiment per dialogue, ties going to the one seen first
+        counts = np.zeros((n, len(ASSISTANT_SENTIMENTS)), dtype=np.int64)
+        np.add.at(counts, (owner, sentiment), 1)
+        first_seen = np.full(counts.shape, total, dtype=np.int64)
+        np.minimum.at(first_seen, (owner, sentiment), turn)
+        overall = np.argmax(counts * (total + 1) - first_seen, axis=1)
+        primary = intent[starts + replies_per - 1]
+        
+        # Message layout per dialogue: opening user message, then assistant
+        # turns, each followed by a user reply except the last
+        lengths = 2 * turns - 2
+        message_start = np.cumsum(lengths) - lengths
+        assistant_at = message_start[owner] + 1 + 2 * turn
+        has_reply = turn < turns[owner] - 2
+        stamp_base = (days - 1) * self.positions
+        assistant_stamp = stamp_base[owner] + 1 + 2 * turn
+        if self.reply_model is None:
+            replies = self.replies.objects[reply[has_reply]].tolist()
+        else:
+            replies = self.reply_model.sample(
+                rng, self.reply_contexts[intent[has_reply], concern[owner[has_reply]]])
+        
+        # Gather every field as object arrays, then build dicts in flat passes
+        with gc_paused():
+            return self._build(dialogue_ids, session, concern, ages, moods, first, assistant, replies,
+                               intent, sentiment, primary, overall, has_reply, lengths,
+                               message_start, assistant_at, stamp_base, assistant_stamp)
+    
+    def _build(self, dialogue_ids, session, concern, ages, moods, first, assistant, replies,
+               intent, sentiment, primary, overall, has_reply, lengths,
+               message_start, assistant_at, stamp_base, assistant_stamp) -> List[Dict]:
+        """Build dialogue dicts (same layout as the benchmark's ``DialogueGenerator``) from drawn indices
+
+        Records are shallow copies of layout templates with their values filled
+        in, which keeps key order and is cheaper than a dict literal per record.
+        """
+        user_message = {'role': 'user', 'text': None, 'timestamp': None}
+        assistant_message = {'role': 'assistant', 'text': None, 'timestamp': None,
+                             'intent': None, 'sentiment': None, 'risk_level': 'none'}
+        
+        first_messages = []
+        append = first_messages.append
+        for text, stamp in zip(self.first_messages.objects[first].tolist(),
+                               self.stamps[stamp_base].tolist()):
+            message = user_message.copy()
+            message['text'] = text
+            message['timestamp'] = stamp
+            append(message)
+        
+        assistant_messages = []
+        append = assistant_messages.append
+        for text, stamp, name, feeling in zip(self.assistant_texts.objects[assistant].tolist(),
+                                              self.stamps[assistant_stamp].tolist(),
+                                              self.intent_objects[intent].tolist(),
+                                              self.sentiment_objects[sentiment].tolist()):
+            message = assistant_message.copy()
+            message['text'] = text
+            message['timestamp'] = stamp
+            message['intent'] = name
+            message['sentiment'] = feeling
+            append(message)
+        
+        reply_messages = []
+        append = reply_messages.append
+        for text, stamp in zip(replies, self.stamps[assistant_stamp[has_reply] + 1].tolist()):
+            message = user_message.copy()
+            message['text'] = text
+            message['timestamp'] = stamp
+            append(message)
+        
+        messages = np.empty(int(lengths.sum()), dtype=object)
+        messages[message_start] = object_array(first_messages)
+        messages[assistant_at] = object_array(assistant_messages)
+        messages[assistant_at[has_reply] + 1] = object_array(reply_messages)
+        messages = messages.tolist()
+        
+        layout = {'dialogue_id': None, 'session_type': None, 'user_profile': None, 'messages': None, 'labels': None}
+        profile_layout = {'age_range': None, 'concern': None, 'mood_score': None}
+        # Generated assistant turns are never risky
+        labels_layout = {'primary_intent': None, 'overall_sentiment': None,
+                         'max_risk_level': 'none', 'therapeutic_technique': None}
+        
+        dialogues = []
+        append = dialogues.append
+        for dialogue_id, session_type, age_range, concern_name, mood, start, end, \
+                primary_intent, overall_sentiment, technique in zip(
+                    dialogue_ids,
+                    self.session_objects[session].tolist(),
+                    self.age_objects[ages].tolist(),
+                    self.concern_objects[concern].tolist(),
+                    moods.tolist(),
+                    message_start.tolist(),
+                    (message_start + lengths).tolist(),
+                    self.intent_objects[primary].tolist(),
+                    self.sentiment_objects[overall].tolist(),
+                    self.technique_objects[primary].tolist()):
+            profile = profile_layout.copy()
+            profile['age_range'] = age_range
+            profile['concern'] = concern_name
+            profile['mood_score'] = mood
+            
+            labels = labels_layout.copy()
+            labels['primary_intent'] = primary_intent
+            labels['overall_sentiment'] = overall_sentiment
+            labels['therapeutic_technique'] = technique
+            
+            dialogue = layout.copy()
+            dialogue['dialogue_id'] = dialogue_id
+            dialogue['session_type'] = session_type
+            dialogue['user_profile'] = profile
+            dialogue['messages'] = messages[start:end]
+            dialogue['labels'] = labels
+            append(dialogue)
+        return dialogues
+
+
+def dialogue_id_for(number: int) -> str:
+    """Dialogue ID from its position in the expanded corpus (1-based)"""
+    return f"seed_{number:03d}"
+
+
+@lru_cache(maxsize=None)
+def load_reply_model(path: str) -> ReplyModel:
+    """Reply model loaded once per process"""
+    return ReplyModel.load(path)
+
+
+def generate_shard(master_seed: int, shard: int, start: int, count: int, first_number: int,
+                   reference_time: datetime, distribution: Optional[Dict] = None,
+                   reply_model: Optional[str] = None) -> Iterator[Dict]:
+    """Dialogues of one shard
+
+    IDs come from each dialogue's global position, so shards never need a
+    shared counter to stay unique. ``reply_model`` is the path of a saved
+    ``ReplyModel``, which workers load once and reuse for every shard.
+    """
+    model = load_reply_model(reply_model) if reply_model else None
+    sampler = BatchDialogueSampler(shard_rng(master_seed, shard), reference_time, distribution, model)
+    for batch_start in range(0, count, BATCH_SIZE):
+        numbers = range(first_number + start + batch_start,
+                        first_number + start + min(batch_start + BATCH_SIZE, count))
+        yield from sampler.sample([dialogue_id_for(number) for number in numbers])
+
+
+def basic_errors(dialogue: Dict, index: int) -> List[str]:
+    """Structural checks run on every output dialogue, seeds included, with --validate"""
+    errors = []
+    if not dialogue.get('dialogue_id'):
+        errors.append(f"Dialogue {index}: Missing dialogue_id")
+    if not dialogue.get('messages'):
+        errors.append(f"Dialogue {index}: Missing messages")
+    if len(dialogue.get('messages') or ()) < 2:
+        errors.append(f"Dialogue {index}: Too few messages")
+    return errors
+
+
+def _write_shard(task: Dict) -> Tuple[int, CorpusStats, List[str], np.ndarray]:
+    """Worker: generate one shard straight to its own JSONL file
+
+    Also returns each dialogue's fingerprint, for the uniqueness filter.
+    """
+    errors = []
+    fingerprints = []
+    dialogues = generate_shard(task['seed'], task['shard'], task['start'], task['count'],
+                               task['first_number'], task['reference_time'], task['distribution'],
+                               task['reply_model'])
+    
+    def written(writer: DialogueWriter) -> Iterator[Dict]:
+        for offset, dialogue in enumerate(dialogues):
+            if task['validate']:
+                errors.extend(basic_errors(dialogue, task['first_number'] - 1 + task['start'] + offset))
+            fingerprints.append(dialogue_fingerprint(dialogue))
+            writer.write(dialogue)
+            yield dialogue
+    
+    with DialogueWriter(task['path']) as writer:
+        stats = CorpusStats.from_dialogues(written(writer))
+    return task['shard'], stats, errors, fingerprint_array(fingerprints)
+
+
+def drop_near_duplicates(index: NearDuplicateIndex, dialogues: Sequence[Dict], keep: np.ndarray,
+                         limit: int) -> np.ndarray:
+    """Narrow ``keep`` to dialogues that aren't near-duplicates, adding them to ``index``
+
+    Candidates are checked in order until ``limit`` are kept; later ones are
+    left out unchecked, so dialogues beyond the target never enter the index.
+    """
+    candidates = np.flatnonzero(keep)
+    kept = np.zeros(len(keep), dtype=bool)
+    checked = 0
+    while limit > 0 and checked < len(candidates):
+        batch = candidates[checked:checked + limit]
+        checked += len(batch)
+        matches = index.add_batch([dialogues[i]['dialogue_id'] for i in batch],
+                                  [dialogue_text(dialogues[i]) for i in batch])
+        new = batch[[match is None for match in matches]]
+        kept[new] = True
+        limit -= len(new)
+    return kept
+
+
+def top_up_plan(last: Tuple[int, int, int], deficit: int, acceptance: float,
+                shard_size: int) -> List[Tuple[int, int, int]]:
+    """Shards following ``last`` that should yield about ``deficit`` more unique dialogues"""
+    shard, start, count = last
+    wanted = math.ceil(deficit / acceptance * TOP_UP_MARGIN)
+    return [(shard + 1 + i, start + count + offset, size)
+            for i, offset, size in shard_plan(wanted, shard_size)]
+
+
 class SeedDialogueExpander:
     """Expand seed dialogues using patterns and templates"""
     
-    def __init__(self, seed_file: str):
+    def __init__(self, seed_file: str, seed: Optional[int] = None,
+                 reference_time: Optional[datetime] = None, unique: bool = True,
+                 fingerprint_error_rate: float = 0.001, reply_model: Optional[str] = None):
         self.seed_file = Path(seed_file)
-        self.seed_data = self._load_seed_data()
-        self.existing_dialogues = self.seed_data.get('dialogues', [])
-        self.next_id = len(self.existing_dialogues) + 1
+        self.existing_dialogues = self._load_seed_data()
+        self.new_dialogues = []
+        self.new_stats = None
+        # Without a seed, draw one so the run can still be reproduced from its header
+        self.seed = seed if seed is not None else random.SystemRandom().getrandbits(63)
+        if reference_time is None:
+            reference_time = SEEDED_REFERENCE_TIME if seed is not None else datetime.now()
+        self.reference_time = reference_time
+        self.unique = unique
+        self.fingerprint_error_rate = fingerprint_error_rate
+        self.uniqueness = None
+        self.near_duplicates = None
+        self.reply_model = str(reply_model) if reply_model else None
     
-    def _load_seed_data(self) -> Dict:
-        """Load existing seed dialogues"""
+    def _load_seed_data(self) -> List[Dialogue]:
+        """Load existing seed dialogues as compact records"""
         if not self.seed_file.exists():
             print(f"Error: Seed file not found: {self.seed_file}")
             sys.exit(1)
         
-        with open(self.seed_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
-    def _generate_dialogue_id(self) -> str:
-        """Generate unique dialogue ID"""
-        dialogue_id = f"seed_{self.next_id:03d}"
-        self.next_id += 1
-        return dialogue_id
+        return load_compact_dialogues(self.seed_file)
     
-    def _create_multi_turn_dialogue(self, concern: str, session_type: str, num_turns: int = 4) -> Dict:
-        """Create a multi-turn dialogue"""
-        messages = []
-        base_time = datetime.now() - timedelta(days=random.randint(1, 30))
-        
-        # First user message
-        user_templates = USER_MESSAGE_TEMPLATES.get(concern, USER_MESSAGE_TEMPLATES['anxiety'])
-        first_user_msg = random.choice(user_templates).format(
-            topic=random.choice(['work', 'relationships', 'the future', 'my health', 'family', 'school']),
-            concern=random.choice(['I won\'t be able to handle it', 'something bad will happen', 'I\'ll fail', 'I\'m not good enough']),
-            person=random.choice(['my partner', 'my friend', 'my family', 'my colleague', 'my parent']),
-            event=random.choice(['the breakup', 'the loss', 'what happened', 'the argument']),
-            situation=random.choice(['work', 'family', 'everything', 'my relationships']),
-        )
-        
-        messages.append({
-            'role': 'user',
-            'text': first_user_msg,
-            'timestamp': base_time.isoformat() + 'Z'
-        })
-        
-        # Generate conversation turns
-        current_intent = 'validate'
-        for i in range(num_turns - 1):
-            # Assistant response
-            if i == 0:
-                # First response: validate
-                intent = 'validate'
-                patterns = ASSISTANT_RESPONSE_PATTERNS['validate']
-            elif i == 1:
-                # Second response: probe story
-                intent = 'probe_story'
-                patterns = ASSISTANT_RESPONSE_PATTERNS['probe_story']
-            elif i == 2:
-                # Third response: probe root or reframe
-                intent = random.choice(['probe_root', 'reframe'])
-                patterns = ASSISTANT_RESPONSE_PATTERNS.get(intent, ASSISTANT_RESPONSE_PATTERNS['probe_root'])
-            else:
-                # Later responses: mix of techniques
-                intent = random.choice(['probe_root', 'reframe', 'suggest_experiment', 'offer_mindfulness'])
-                patterns = ASSISTANT_RESPONSE_PATTERNS.get(intent, ASSISTANT_RESPONSE_PATTERNS['probe_root'])
-            
-            assistant_text = random.choice(patterns).format(
-                difficulty=random.choice(['difficult', 'hard', 'heavy', 'painful', 'challenging'])
-            )
-            
-            messages.append({
-                'role': 'assistant',
-                'text': assistant_text,
-                'timestamp': (base_time + timedelta(seconds=5 + i * 30)).isoformat() + 'Z',
-                'intent': intent,
-                'sentiment': random.choice(['negative', 'very_negative', 'neutral']),
-                'risk_level': 'none'
-            })
+    def _generate(self, needed: int, shard_size: int,
+                  run_round: Callable[[List[Tuple[int, int, int]]], Iterator[Tuple[object, np.ndarray]]],
+                  read: Optional[Callable[[object], Sequence[Dict]]] = None,
+                  near_duplicate_threshold: Optional[float] = None) -> List:
+        """Generate shards until there are ``needed`` new dialogues, repeats excluded
+
+        ``run_round`` generates a list of shards and yields ``(shard output,
+        fingerprints)`` for each, in order. Fingerprints go through a Bloom
+        filter sized for the seeds plus ``needed`` dialogues. Repeats of a seed
+        or of an earlier dialogue are rejected, and more shards are generated
+        until the target is met, or until so few new dialogues turn up that the
+        template space is evidently exhausted. With a near-duplicate threshold,
+        the dialogues left are also checked against a near-duplicate index
+        (``read`` returns a shard output's dialogues) and those dropped are
+        made up the same way. Returns ``(shard, output, keep)`` triples, where
+        ``keep`` is None when every dialogue is kept.
+        """
+        plan = shard_plan(needed, shard_size)
+        if not self.unique and near_duplicate_threshold is None:
+            return [(entry, output, None) for entry, (output, _) in zip(plan, run_round(plan))]
+        
+        seen = None
+        if self.unique:
+            seen = BloomFilter(len(self.existing_dialogues) + needed, self.fingerprint_error_rate)
+            seen.add_new(fingerprint_array([dialogue_fingerprint(d.to_dict()) for d in self.existing_dialogues]))
+        index = None
+        if near_duplicate_threshold is not None:
+            index = self._near_duplicate_index(near_duplicate_threshold)
+        rejected = ' and '.join(name for name, check in (('repeats', seen), ('near-duplicates', index))
+                                if check is not None)
+        
+        results = []
+        accepted = generated = repeats = 0
+        while plan:
+            round_generated = round_new = 0
+            for entry, (output, fingerprints) in zip(plan, run_round(plan)):
+                keep = seen.add_new(fingerprints) if seen is not None else np.ones(len(fingerprints), dtype=bool)
+                round_generated += len(keep)
+                repeats += len(keep) - int(keep.sum())
+                if index is not None:
+                    keep = drop_near_duplicates(index, read(output), keep, needed - accepted)
+                round_new += int(keep.sum())
+                # Dialogues beyond the target are new but not needed
+                keep &= np.cumsum(keep) <= needed - accepted
+                accepted += int(keep.sum())
+                results.append((entry, output, keep))
+            generated += round_generated
             
-            # User response (if not last turn)
-            if i < num_turns - 2:
-                user_responses = self._generate_user_response(concern, intent)
-                messages.append({
-                    'role': 'user',
-                    'text': user_responses,
-                    'timestamp': (base_time + timedelta(seconds=10 + i * 30)).isoformat() + 'Z'
-                })
-        
-        # Determine labels
-        intents_used = [m.get('intent') for m in messages if m.get('role') == 'assistant' and m.get('intent')]
-        primary_intent = intents_used[-1] if intents_used else 'validate'
-        
-        sentiments = [m.get('sentiment') for m in messages if m.get('sentiment')]
-        overall_sentiment = max(set(sentiments), key=sentiments.count) if sentiments else 'negative'
-        
-        risk_levels = [m.get('risk_level') for m in messages if m.get('risk_level')]
-        max_risk = max(risk_levels, key=RISK_LEVEL_LABELS.index) if risk_levels else 'none'
-        
-        technique = self._map_intent_to_technique(primary_intent)
-        
-        return {
-            'dialogue_id': self._generate_dialogue_id(),
-            'session_type': session_type,
-            'user_profile': {
-                'age_range': random.choice(AGE_RANGES),
-                'concern': concern,
-                'mood_score': random.randint(3, 7)
-            },
-            'messages': messages,
-            'labels': {
-                'primary_intent': primary_intent,
-                'overall_sentiment': overall_sentiment,
-                'max_risk_level': max_risk,
-                'therapeutic_technique': technique
-            }
-        }
-    
-    def _generate_user_response(self, concern: str, last_intent: str) -> str:
-        """Generate contextual user response"""
-        responses = {
-            'validate': [
-                "Yes, I think so.",
-                "I'm not sure.",
-                "Maybe.",
-                "I guess I could try.",
-                "That makes sense."
-            ],
-            'probe_story': [
-                "It happened last week.",
-                "I'm not sure when it started.",
-                "It's been going on for a while.",
-                "Recently, I guess.",
-                "I can't remember exactly."
-            ],
-            'probe_root': [
-                "I think it started when I was younger.",
-                "I'm not sure where it comes from.",
-                "Maybe from my childhood?",
-                "I don't know.",
-                "It's hard to say."
-            ],
-            'reframe': [
-                "I never thought about it that way.",
-                "That's an interesting perspective.",
-                "I'm not sure I see it that way.",
-                "Maybe you're right.",
-                "I'll think about that."
-            ]
-        }
+            deficit = needed - accepted
+            if deficit <= 0:
+                break
+            acceptance = round_new / max(round_generated, 1)
+            if acceptance < MIN_ACCEPTANCE:
+                print(f"⚠️  Only {acceptance:.1%} of the last round was new: the template space looks exhausted. "
+                      f"Stopping {deficit} short of the target.")
+                break
+            plan = top_up_plan(plan[-1], deficit, acceptance, shard_size)
+            print(f"🔁 {deficit} short after rejecting {rejected}; generating {sum(c for _, _, c in plan)} more")
         
-        return random.choice(responses.get(last_intent, responses['validate']))
-    
-    def _map_intent_to_technique(self, intent: str) -> str:
-        """Map intent to therapeutic technique"""
-        mapping = {
-            'validate': 'validation',
-            'probe_story': 'exploration',
-            'probe_root': 'exploration',
-            'reframe': 'cognitive_reframing',
-            'suggest_experiment': 'behavioral_experiment',
-            'offer_mindfulness': 'mindfulness',
-        }
-        return mapping.get(intent, 'other')
+        if seen is not None:
+            self.uniqueness = {
+                'generated': generated,
+                'rejected_repeats': repeats,
+                'rejection_rate': repeats / max(generated, 1),
+                'filter_bytes': seen.memory_bytes,
+                'filter_false_positive_rate': seen.false_positive_rate(),
+            }
+            print(f"🔁 Rejected {repeats} repeats of {generated} generated dialogues "
+                  f"({self.uniqueness['rejection_rate']:.1%}); Bloom filter {seen.memory_bytes / 1024:.0f} KB")
+        if index is not None:
+            self.near_duplicates = index.report()
+            print_near_duplicate_report(self.near_duplicates)
+        return results
     
-    def expand(self, target_count: int = 500, distribution: Dict = None) -> List[Dict]:
-        """Expand dialogues to target count"""
+    def expand(self, target_count: int = 500, distribution: Dict = None,
+               shard_size: int = DEFAULT_SHARD_SIZE,
+               near_duplicate_threshold: Optional[float] = None) -> List[Dialogue]:
+        """Expand dialogues to target count in memory
+
+        Produces the same dialogues as ``expand_to_file`` for the same seed.
+        """
         current_count = len(self.existing_dialogues)
         needed = target_count - current_count
         
@@ -227,44 +581,26 @@ class SeedDialogueExpander:
         
         print(f"Expanding from {current_count} to {target_count} dialogues ({needed} new dialogues)")
         
-        # Default distribution
-        if not distribution:
-            distribution = {
-                'session_types': {'gentle_deep': 0.5, 'check-in': 0.3, 'micro_practice': 0.2},
-                'concerns': {c: 1.0 / len(CONCERNS) for c in CONCERNS}
-            }
-        
-        new_dialogues = []
+        def run_round(plan):
+            for shard, start, count in plan:
+                dialogues = list(generate_shard(self.seed, shard, start, count, current_count + 1,
+                                                self.reference_time, distribution, self.reply_model))
+                yield dialogues, fingerprint_array([dialogue_fingerprint(d) for d in dialogues])
+                print(f"Generated shard {shard + 1}...")
         
         # Generate new dialogues
-        for i in range(needed):
-            # Select session type based on distribution
-            session_type = random.choices(
-                list(distribution['session_types'].keys()),
-                weights=list(distribution['session_types'].values())
-            )[0]
-            
-            # Select concern based on distribution
-            concern = random.choices(
-                list(distribution['concerns'].keys()),
-                weights=list(distribution['concerns'].values())
-            )[0]
-            
-            # Determine number of turns based on session type
-            if session_type == 'check-in':
-                num_turns = random.randint(2, 4)
-            elif session_type == 'micro_practice':
-                num_turns = random.randint(2, 3)
-            else:  # gentle_deep
-                num_turns = random.randint(4, 8)
-            
-            dialogue = self._create_multi_turn_dialogue(concern, session_type, num_turns)
-            new_dialogues.append(dialogue)
-            
-            if (i + 1) % 50 == 0:
-                print(f"Generated {i + 1}/{needed} dialogues...")
+        generated = self._generate(needed, shard_size, run_round, lambda dialogues: dialogues,
+                                   near_duplicate_threshold)
+        new_dialogues = [
+            Dialogue.from_dict(dialogue)
+            for _, dialogues, keep in generated
+            for i, dialogue in enumerate(dialogues)
+            if keep is None or keep[i]
+        ]
         
         # Combine with existing
+        self.new_dialogues = new_dialogues
+        self.new_stats = None
         all_dialogues = self.existing_dialogues + new_dialogues
         
         print(f"✅ Generated {len(new_dialogues)} new dialogues")
@@ -272,58 +608,161 @@ class SeedDialogueExpander:
         
         return all_dialogues
     
-    def calculate_statistics(self, dialogues: List[Dict]) -> Dict:
-        """Calculate statistics for dialogues"""
-        stats = {
-            'total_dialogues': len(dialogues),
-            'session_types': Counter(d.get('session_type') for d in dialogues),
-            'concerns': Counter(d.get('user_profile', {}).get('concern') for d in dialogues),
-            'intent_distribution': Counter(),
-            'sentiment_distribution': Counter(),
-            'risk_level_distribution': Counter(),
-            'therapeutic_techniques': Counter()
-        }
+    def expand_to_file(self, output_file: str, target_count: int = 500, distribution: Dict = None,
+                       workers: int = 1, shard_size: int = DEFAULT_SHARD_SIZE,
+                       validate: bool = False, near_duplicate_threshold: Optional[float] = None) -> List[str]:
+        """Expand dialogues to target count, streaming shards to disk
+
+        Shards are generated in a process pool, each into its own file, then
+        concatenated in shard order behind the seed dialogues. The output is
+        byte-identical for any number of workers. Repeated dialogues, and with
+        a near-duplicate threshold dialogues too similar to a seed or an
+        earlier dialogue, are skipped when concatenating, and more are
+        generated to make up for them. With
+        ``validate`` the seed dialogues are checked first, then each generated
+        one as it is written. Returns validation errors; nothing is written to
+        ``output_file`` if there are any.
+        """
+        output_path = Path(output_file)
+        current_count = len(self.existing_dialogues)
+        needed = max(target_count - current_count, 0)
         
-        for dialogue in dialogues:
-            # Count intents from messages
-            for msg in dialogue.get('messages', []):
-                if msg.get('intent'):
-                    stats['intent_distribution'][msg['intent']] += 1
-                if msg.get('sentiment'):
-                    stats['sentiment_distribution'][msg['sentiment']] += 1
-                if msg.get('risk_level'):
-                    stats['risk_level_distribution'][msg['risk_level']] += 1
-            
-            # Count labels
-            labels = dialogue.get('labels', {})
-            if labels.get('therapeutic_technique'):
-                stats['therapeutic_techniques'][labels['therapeutic_technique']] += 1
+        if validate:
+            errors = [error for index, dialogue in enumerate(self.existing_dialogues)
+                      for error in basic_errors(dialogue.to_dict(), index)]
+            if errors:
+                # The output can't be saved, so don't spend time generating it
+                return errors
+        
+        print(f"Expanding from {current_count} to {current_count + needed} dialogues "
+              f"({needed} new dialogues in {len(shard_plan(needed, shard_size))} shards, "
+              f"{workers} workers, seed {self.seed})")
         
-        # Convert Counters to dicts
-        for key in stats:
-            if isinstance(stats[key], Counter):
-                stats[key] = dict(stats[key])
+        shard_dir = output_path.parent / f".{output_path.name}.shards"
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        shard_stats = {}
+        errors = []
         
-        return stats
+        def run_round(plan):
+            tasks = [{
+                'seed': self.seed,
+                'shard': shard,
+                'start': start,
+                'count': count,
+                'first_number': current_count + 1,
+                'reference_time': self.reference_time,
+                'distribution': distribution,
+                'reply_model': self.reply_model,
+                'validate': validate,
+                'path': str(shard_dir / f"shard-{shard:05d}.jsonl"),
+            } for shard, start, count in plan]
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(_write_shard, tasks))
+            else:
+                results = map(_write_shard, tasks)
+            for done, (task, (shard, stats, shard_errors, fingerprints)) in enumerate(zip(tasks, results), 1):
+                shard_stats[shard] = stats
+                errors.extend(shard_errors)
+                print(f"Generated shard {done}/{len(tasks)}...")
+                yield task['path'], fingerprints
+        
+        try:
+            generated = self._generate(needed, shard_size, run_round, self._read_shard, near_duplicate_threshold)
+            if errors:
+                return errors
+            
+            self.new_dialogues = []
+            self.new_stats = sum((shard_stats[shard] for (shard, _, _), _, _ in generated), CorpusStats())
+            shard_paths = [path for _, path, _ in generated]
+            skip = {}
+            for _, path, keep in generated:
+                if keep is not None and not keep.all():
+                    skip[path] = set(np.flatnonzero(~keep).tolist())
+                    self.new_stats -= CorpusStats.from_dialogues(self._read_lines(path, skip[path]))
+            print(f"✅ Generated {self.new_stats.total} new dialogues")
+            
+            self._assemble(output_path, shard_paths, skip)
+        finally:
+            shutil.rmtree(shard_dir, ignore_errors=True)
+        return errors
     
-    def save(self, dialogues: List[Dict], output_file: str):
-        """Save expanded dialogues"""
-        stats = self.calculate_statistics(dialogues)
+    @staticmethod
+    def _read_shard(shard_path: str) -> List[Dict]:
+        with open(shard_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    
+    @staticmethod
+    def _read_lines(shard_path: str, line_numbers: set) -> Iterator[Dict]:
+        """Decode only the given lines of a shard file"""
+        with open(shard_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f):
+                if line_number in line_numbers:
+                    yield json.loads(line)
+    
+    def _near_duplicate_index(self, threshold: float) -> NearDuplicateIndex:
+        """Near-duplicate index seeded with the seed dialogues, which are always kept"""
+        index = NearDuplicateIndex(threshold)
+        seeds = [d.to_dict() for d in self.existing_dialogues]
+        index.add_batch([d['dialogue_id'] for d in seeds], [dialogue_text(d) for d in seeds])
+        return index
+    
+    def _assemble(self, output_path: Path, shard_paths: List[str], skip: Optional[Dict[str, set]] = None):
+        """Concatenate seed dialogues and shard files into the final corpus, leaving out skipped lines"""
+        skip = skip or {}
+        corpus = self.calculate_statistics()
+        stats = corpus.to_dict()
         
-        output_data = {
+        with DialogueWriter(output_path, self._header(stats['total_dialogues'])) as writer:
+            writer.write_all(d.to_dict() for d in self.existing_dialogues)
+            for shard_path in shard_paths:
+                skipped = skip.get(shard_path, ())
+                with open(shard_path, 'r', encoding='utf-8') as f:
+                    for line_number, line in enumerate(f):
+                        if line_number not in skipped:
+                            writer.write_encoded(line.rstrip('\n'))
+            writer.close(stats)
+        record_corpus_stats(corpus, output_path)
+        self._print_saved(output_path, stats)
+    
+    def calculate_statistics(self) -> CorpusStats:
+        """Statistics of the expanded corpus: cached seed stats merged with the new dialogues"""
+        new_stats = self.new_stats
+        if new_stats is None:
+            new_stats = CorpusStats.from_dialogues(self.new_dialogues)
+        return corpus_stats(self.seed_file) + new_stats
+    
+    def _header(self, total: int) -> Dict:
+        """Corpus header, including what is needed to regenerate it"""
+        header = {
             'version': '1.0',
-            'description': f'Expanded seed dialogues for training the AI Shadow-Self Coach persona ({len(dialogues)} examples)',
-            'expanded_at': datetime.now().isoformat(),
-            'dialogues': dialogues,
-            'statistics': stats
+            'description': f'Expanded seed dialogues for training the AI Shadow-Self Coach persona ({total} examples)',
+            'generation': {
+                'seed': self.seed,
+                'reference_time': self.reference_time.isoformat(),
+                'unique': self.unique,
+            },
         }
+        if self.reply_model is not None:
+            header['generation']['reply_model'] = load_reply_model(self.reply_model).digest
+        if self.uniqueness is not None:
+            header['generation']['uniqueness'] = self.uniqueness
+        if self.near_duplicates is not None:
+            header['generation']['near_duplicates'] = self.near_duplicates
+        return header
+    
+    def save(self, dialogues: List[Dialogue], output_file: str):
+        """Save expanded dialogues"""
+        corpus = self.calculate_statistics()
+        stats = corpus.to_dict()
         
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
-        
+        with DialogueWriter(output_file, self._header(len(dialogues))) as writer:
+            writer.write_all(d.to_dict() for d in dialogues)
+            writer.close(stats)
+        record_corpus_stats(corpus, output_file)
+        self._print_saved(output_file, stats)
+    
+    def _print_saved(self, output_file, stats: Dict):
         print(f"\n✅ Expanded dialogues saved to: {output_file}")
         print(f"\n📊 Statistics:")
         print(f"   Total dialogues: {stats['total_dialogues']}")
@@ -335,38 +774,46 @@ class SeedDialogueExpander:
 def main():
     parser = argparse.ArgumentParser(description='Expand seed dialogues')
     parser.add_argument('--input', '-i', default='../SEED_DIALOGUES.json', help='Input seed dialogues file')
-    parser.add_argument('--output', '-o', default='../SEED_DIALOGUES_EXPANDED.json', help='Output file')
+    parser.add_argument('--output', '-o', default='../SEED_DIALOGUES_EXPANDED.json',
+                        help='Output file (.jsonl writes one dialogue per line plus a .meta.json sidecar; add .gz/.zst to compress)')
     parser.add_argument('--target', '-t', type=int, default=500, help='Target number of dialogues')
-    parser.add_argument('--validate', action='store_true', help='Validate output before saving')
+    parser.add_argument('--validate', action='store_true', help='Validate the whole output (seed and generated dialogues) before saving')
+    parser.add_argument('--seed', type=int, help='Master random seed (output is reproducible for a given seed)')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Worker processes generating shards')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help='Dialogues per shard (changes the output; worker count does not)')
+    parser.add_argument('--allow-repeats', action='store_true',
+                        help='Keep exact repeats instead of generating until the target is unique')
+    parser.add_argument('--fingerprint-error-rate', type=float, default=0.001,
+                        help='Bloom filter false-positive rate for repeat detection (sets its memory)')
+    parser.add_argument('--reply-model',
+                        help='Draw user replies from a model saved by train_reply_model.py')
+    parser.add_argument('--near-duplicate-threshold', type=float,
+                        help='Leave out generated dialogues with MinHash Jaccard >= this to an earlier one')
+    parser.add_argument('--reference-time', type=datetime.fromisoformat,
+                        help='Timestamp origin (ISO format; default: now, or a fixed date with --seed)')
     
     args = parser.parse_args()
     
-    expander = SeedDialogueExpander(args.input)
-    expanded = expander.expand(target_count=args.target)
-    
+    expander = SeedDialogueExpander(args.input, seed=args.seed, reference_time=args.reference_time,
+                                    unique=not args.allow_repeats,
+                                    fingerprint_error_rate=args.fingerprint_error_rate,
+                                    reply_model=args.reply_model)
     if args.validate:
-        # Basic validation
-        print("\n🔍 Validating dialogues...")
-        errors = []
-        for i, dialogue in enumerate(expanded):
-            if not dialogue.get('dialogue_id'):
-                errors.append(f"Dialogue {i}: Missing dialogue_id")
-            if not dialogue.get('messages'):
-                errors.append(f"Dialogue {i}: Missing messages")
-            if len(dialogue.get('messages', [])) < 2:
-                errors.append(f"Dialogue {i}: Too few messages")
-        
-        if errors:
-            print(f"❌ Found {len(errors)} errors:")
-            for error in errors[:10]:  # Show first 10
-                print(f"   - {error}")
-            if len(errors) > 10:
-                print(f"   ... and {len(errors) - 10} more")
-            sys.exit(1)
-        else:
-            print("✅ Validation passed")
+        print("\n🔍 Validating dialogues while generating...")
+    errors = expander.expand_to_file(args.output, target_count=args.target, workers=args.workers,
+                                     shard_size=args.shard_size, validate=args.validate,
+                                     near_duplicate_threshold=args.near_duplicate_threshold)
     
-    expander.save(expanded, args.output)
+    if errors:
+        print(f"❌ Found {len(errors)} errors:")
+        for error in errors[:10]:  # Show first 10
+            print(f"   - {error}")
+        if len(errors) > 10:
+            print(f"   ... and {len(errors) - 10} more")
+        sys.exit(1)
+    elif args.validate:
+        print("✅ Validation passed")
     
     print("\n📋 Next Steps:")
     print("1. Review expanded dialogues for quality")
@@ -376,4 +823,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -4,21 +4,24 @@ Synthetic Data Generation Tool
 Generates synthetic training examples with clinician review support
 """
 
-import json
-import os
+import importlib.util
 import sys
-import random
+import time
 from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 import argparse
 
-# Import OpenAI if available
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.dialogue_store import iter_dialogues, DialogueWriter
+from utils.template_sampler import SlotTable, gc_paused
+from utils.llm_generation import AsyncDialogueGenerator, DEFAULT_MODEL
+
+# Check OpenAI is available (the LLM generator imports it only when used)
+OPENAI_AVAILABLE = importlib.util.find_spec('openai') is not None
+if not OPENAI_AVAILABLE:
     print("⚠️  OpenAI not available. Using template-based generation only.")
 
 # Template patterns for synthetic generation
@@ -91,6 +94,19 @@ ASSISTANT_RESPONSE_PATTERNS = {
     ],
 }
 
+# Values substituted into {slot}s of the templates above
+SLOT_FILLERS = {
+    'topic': ['work', 'relationships', 'the future', 'my health', 'family'],
+    'concern': ['I won\'t be able to handle it', 'something bad will happen', 'I\'ll fail'],
+    'person': ['my partner', 'my friend', 'my family', 'my colleague'],
+    'event': ['the breakup', 'the loss', 'what happened'],
+    'situation': ['work', 'family', 'everything'],
+    'difficulty': ['difficult', 'hard', 'heavy', 'painful', 'challenging'],
+}
+
+TEMPLATE_INTENTS = ['validate', 'probe_story', 'probe_root', 'reframe']
+TEMPLATE_SENTIMENTS = ['negative', 'very_negative', 'neutral']
+
 SESSION_TYPES = ['check-in', 'gentle_deep', 'micro_practice']
 AGE_RANGES = ['18-25', '26-30', '31-35', '36-40', '41-50', '50+']
 CONCERNS = ['self-worth', 'anxiety', 'relationships', 'grief', 'stress', 'depression', 'anger', 'loneliness']
@@ -98,120 +114,125 @@ CONCERNS = ['self-worth', 'anxiety', 'relationships', 'grief', 'stress', 'depres
 class SyntheticDataGenerator:
     """Generate synthetic training dialogues"""
     
-    def __init__(self, seed_file: Optional[str] = None, use_openai: bool = False):
+    def __init__(self, seed_file: Optional[str] = None, use_openai: bool = False,
+                 random_state: Optional[int] = None, llm_options: Optional[Dict] = None):
         self.seed_file = Path(seed_file) if seed_file else None
         self.seed_dialogues = self._load_seed_dialogues() if seed_file else []
         self.use_openai = use_openai and OPENAI_AVAILABLE
-        if self.use_openai:
-            openai.api_key = os.getenv('OPENAI_API_KEY')
+        # Keyword arguments for AsyncDialogueGenerator (model, base_url, concurrency, cache_dir, ...)
+        self.llm_options = dict(llm_options or {})
+        
+        # Templates are rendered once; each batch is then a few vectorized draws
+        self.rng = np.random.default_rng(random_state)
+        self.user_texts = SlotTable(USER_MESSAGE_TEMPLATES, SLOT_FILLERS, fallback='anxiety')
+        self.assistant_texts = SlotTable(ASSISTANT_RESPONSE_PATTERNS, SLOT_FILLERS, fallback='validate')
+        self.assistant_codes = np.array([self.assistant_texts.code(i) for i in TEMPLATE_INTENTS])
     
     def _load_seed_dialogues(self) -> List[Dict]:
         """Load seed dialogues for pattern extraction"""
         if not self.seed_file or not self.seed_file.exists():
             return []
         
-        with open(self.seed_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        return data.get('dialogues', [])
+        return list(iter_dialogues(self.seed_file))
     
     def generate_dialogue_template(self, concern: str, session_type: str) -> Dict:
         """Generate a dialogue using templates"""
-        # Select user message template
-        templates = USER_MESSAGE_TEMPLATES.get(concern, USER_MESSAGE_TEMPLATES['anxiety'])
-        user_msg_template = random.choice(templates)
+        return self.generate_dialogue_templates([concern], [session_type])[0]
+    
+    def generate_dialogue_templates(self, concerns: List[str], session_types: List[str]) -> List[Dict]:
+        """Generate one template dialogue per (concern, session type), drawing all choices at once"""
+        rng = self.rng
+        n = len(concerns)
         
-        # Fill template variables
-        user_msg = user_msg_template.format(
-            topic=random.choice(['work', 'relationships', 'the future', 'my health', 'family']),
-            concern=random.choice(['I won\'t be able to handle it', 'something bad will happen', 'I\'ll fail']),
-            person=random.choice(['my partner', 'my friend', 'my family', 'my colleague']),
-            event=random.choice(['the breakup', 'the loss', 'what happened']),
-            situation=random.choice(['work', 'family', 'everything']),
-        )
+        # Select user message and assistant response templates (slots pre-filled)
+        user = self.user_texts.sample(rng, [self.user_texts.code(c) for c in concerns])
+        intent = rng.integers(0, len(TEMPLATE_INTENTS), n)
+        assistant = self.assistant_texts.sample(rng, self.assistant_codes[intent])
         
-        # Generate assistant response
-        intent = random.choice(['validate', 'probe_story', 'probe_root', 'reframe'])
-        response_patterns = ASSISTANT_RESPONSE_PATTERNS.get(intent, ASSISTANT_RESPONSE_PATTERNS['validate'])
-        assistant_msg = random.choice(response_patterns).format(
-            difficulty=random.choice(['difficult', 'hard', 'heavy', 'painful', 'challenging'])
-        )
+        # Determine sentiment and profile; risk stays 'none' as most synthetic data should be safe
+        sentiment = rng.integers(0, len(TEMPLATE_SENTIMENTS), n)
+        ages = rng.integers(0, len(AGE_RANGES), n)
+        moods = rng.integers(3, 7, n, endpoint=True)
+        suffixes = rng.integers(1000, 9999, n, endpoint=True)
         
-        # Determine sentiment and risk
-        sentiment = random.choice(['negative', 'very_negative', 'neutral'])
-        risk_level = 'none'  # Most synthetic data should be safe
+        now = datetime.now()
+        id_prefix = f"synthetic_{now.strftime('%Y%m%d_%H%M%S')}_"
+        stamp = now.isoformat()
+        reply_stamp = (now + timedelta(seconds=5)).isoformat()
         
-        # Create dialogue structure
-        dialogue = {
-            'dialogue_id': f"synthetic_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{random.randint(1000, 9999)}",
-            'session_type': session_type,
-            'user_profile': {
-                'age_range': random.choice(AGE_RANGES),
-                'concern': concern,
-                'mood_score': random.randint(3, 7)
-            },
-            'messages': [
-                {
-                    'role': 'user',
-                    'text': user_msg,
-                    'timestamp': datetime.now().isoformat()
-                },
+        # Create dialogue structures
+        with gc_paused():
+            return [
                 {
-                    'role': 'assistant',
-                    'text': assistant_msg,
-                    'timestamp': (datetime.now() + timedelta(seconds=5)).isoformat(),
-                    'intent': intent,
-                    'sentiment': sentiment,
-                    'risk_level': risk_level
+                    'dialogue_id': f"{id_prefix}{suffix}",
+                    'session_type': session_type,
+                    'user_profile': {
+                        'age_range': AGE_RANGES[age],
+                        'concern': concern,
+                        'mood_score': mood
+                    },
+                    'messages': [
+                        {
+                            'role': 'user',
+                            'text': self.user_texts.texts[user_text],
+                            'timestamp': stamp
+                        },
+                        {
+                            'role': 'assistant',
+                            'text': self.assistant_texts.texts[assistant_text],
+                            'timestamp': reply_stamp,
+                            'intent': TEMPLATE_INTENTS[intent_code],
+                            'sentiment': TEMPLATE_SENTIMENTS[sentiment_code],
+                            'risk_level': 'none'
+                        }
+                    ],
+                    'labels': {
+                        'primary_intent': TEMPLATE_INTENTS[intent_code],
+                        'overall_sentiment': TEMPLATE_SENTIMENTS[sentiment_code],
+                        'max_risk_level': 'none',
+                        'therapeutic_technique': self._get_technique(TEMPLATE_INTENTS[intent_code]),
+                        'synthetic': True,
+                        'generated_at': stamp
+                    }
                 }
-            ],
-            'labels': {
-                'primary_intent': intent,
-                'overall_sentiment': sentiment,
-                'max_risk_level': risk_level,
-                'therapeutic_technique': self._get_technique(intent),
-                'synthetic': True,
-                'generated_at': datetime.now().isoformat()
-            }
-        }
-        
-        return dialogue
+                for concern, session_type, user_text, assistant_text, intent_code, sentiment_code, age, mood, suffix
+                in zip(concerns, session_types, user.tolist(), assistant.tolist(), intent.tolist(),
+                       sentiment.tolist(), ages.tolist(), moods.tolist(), suffixes.tolist())
+            ]
     
     def generate_with_openai(self, concern: str, session_type: str) -> Optional[Dict]:
         """Generate dialogue using OpenAI API"""
         if not self.use_openai:
             return None
+        return self.generate_many_with_openai([concern], [session_type])[0]
+    
+    def generate_many_with_openai(self, concerns: List[str], session_types: List[str]) -> List[Optional[Dict]]:
+        """Generate dialogues through the API concurrently; None where generation failed"""
+        if not self.use_openai:
+            return [None] * len(concerns)
         
-        try:
-            system_prompt = """You are generating a therapeutic dialogue for training an AI coach. 
-Generate a brief conversation (2-4 messages) where:
-1. User expresses a concern about: {concern}
-2. Assistant responds with compassion and validation
-3. Assistant uses therapeutic techniques (validation, probing, reframing)
-4. Keep responses brief (2-4 sentences)
-5. Use gentle, non-judgmental language
-
-Return JSON format with dialogue_id, session_type, messages array, and labels."""
-            
-            user_prompt = f"Generate a {session_type} session dialogue about {concern}. Include 2-4 messages total."
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt.format(concern=concern)},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            # Parse response (would need JSON parsing)
-            # For now, return None and use template method
-            return None
-            
-        except Exception as e:
-            print(f"⚠️  OpenAI generation failed: {e}")
-            return None
+        # Seeded variants keep each request distinct and make reruns cache hits
+        variants = self.rng.integers(0, 2**31, len(concerns)).tolist()
+        id_prefix = f"synthetic_llm_{datetime.now().strftime('%Y%m%d_%H%M%S')}_"
+        specs = [
+            (f"{id_prefix}{i:04d}", concern, session_type, variant)
+            for i, (concern, session_type, variant) in enumerate(zip(concerns, session_types, variants))
+        ]
+        
+        generator = AsyncDialogueGenerator(**self.llm_options)
+        start = time.perf_counter()
+        dialogues = generator.generate(specs)
+        elapsed = time.perf_counter() - start
+        
+        stats = generator.stats
+        print(f"🤖 LLM: {len(specs) - stats['failed']}/{len(specs)} dialogues in {elapsed:.1f}s "
+              f"({stats['requests']} requests, {stats['cache_hits']} cached, {stats['retries']} retries)")
+        
+        stamp = datetime.now().isoformat()
+        for dialogue in dialogues:
+            if dialogue:
+                dialogue['labels']['generated_at'] = stamp
+        return dialogues
     
     def _get_technique(self, intent: str) -> str:
         """Map intent to therapeutic technique"""
@@ -231,42 +252,40 @@ Return JSON format with dialogue_id, session_type, messages array, and labels.""
         concerns = concerns or CONCERNS
         session_types = session_types or SESSION_TYPES
         
-        dialogues = []
+        picked_concerns = [concerns[i] for i in self.rng.integers(0, len(concerns), count).tolist()]
+        picked_sessions = [session_types[i] for i in self.rng.integers(0, len(session_types), count).tolist()]
+        dialogues = [None] * count
+        
+        # Try OpenAI first if enabled, with all requests in flight together
+        if self.use_openai:
+            chosen = np.flatnonzero(self.rng.random(count) < 0.3).tolist()  # 30% OpenAI, 70% templates
+            generated = self.generate_many_with_openai(
+                [picked_concerns[i] for i in chosen], [picked_sessions[i] for i in chosen])
+            for i, dialogue in zip(chosen, generated):
+                dialogues[i] = dialogue
         
-        for i in range(count):
-            concern = random.choice(concerns)
-            session_type = random.choice(session_types)
-            
-            # Try OpenAI first if enabled
-            if self.use_openai and random.random() < 0.3:  # 30% OpenAI, 70% templates
-                dialogue = self.generate_with_openai(concern, session_type)
-                if dialogue:
-                    dialogues.append(dialogue)
-                    continue
-            
-            # Use template-based generation
-            dialogue = self.generate_dialogue_template(concern, session_type)
-            dialogues.append(dialogue)
+        # Use template-based generation for everything else, in one batch
+        pending = [i for i, dialogue in enumerate(dialogues) if not dialogue]
+        templated = self.generate_dialogue_templates(
+            [picked_concerns[i] for i in pending], [picked_sessions[i] for i in pending])
+        for i, dialogue in zip(pending, templated):
+            dialogues[i] = dialogue
         
         return dialogues
     
     def save_dialogues(self, dialogues: List[Dict], output_file: str, 
                       metadata: Optional[Dict] = None):
         """Save generated dialogues to file"""
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        output_data = {
+        header = {
             'version': '1.0',
             'description': 'Synthetic training dialogues (requires clinician review)',
             'generated_at': datetime.now().isoformat(),
             'total_dialogues': len(dialogues),
             'metadata': metadata or {},
-            'dialogues': dialogues
         }
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        with DialogueWriter(output_file, header) as writer:
+            writer.write_all(dialogues)
         
         print(f"\n✅ Generated {len(dialogues)} dialogues")
         print(f"   Saved to: {output_file}")
@@ -280,12 +299,28 @@ def main():
     parser.add_argument('--concerns', '-c', nargs='+', help='Specific concerns to generate')
     parser.add_argument('--session-types', '-t', nargs='+', help='Session types to generate')
     parser.add_argument('--use-openai', action='store_true', help='Use OpenAI for generation (requires API key)')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='Chat model for LLM generation')
+    parser.add_argument('--base-url', help='OpenAI-compatible API base URL (e.g. a local server)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum LLM requests in flight')
+    parser.add_argument('--rate', type=float, default=5.0, help='Maximum LLM requests started per second')
+    parser.add_argument('--max-retries', type=int, default=4, help='Retries per dialogue on API or parse errors')
+    parser.add_argument('--llm-cache', help='Directory caching LLM responses by request (reruns skip the API)')
+    parser.add_argument('--random-state', type=int, help='Random seed for template and request sampling')
     
     args = parser.parse_args()
     
     generator = SyntheticDataGenerator(
         seed_file=args.seed,
-        use_openai=args.use_openai
+        use_openai=args.use_openai,
+        random_state=args.random_state,
+        llm_options={
+            'model': args.model,
+            'base_url': args.base_url,
+            'concurrency': args.concurrency,
+            'requests_per_second': args.rate,
+            'max_retries': args.max_retries,
+            'cache_dir': args.llm_cache,
+        }
     )
     
     dialogues = generator.generate_batch(
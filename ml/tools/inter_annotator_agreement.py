@@ -4,107 +4,48 @@ Inter-Annotator Agreement Calculator
 Calculates agreement between multiple labelers
 """
 
-import json
 import sys
 from pathlib import Path
-from typing import Dict, List
-from collections import defaultdict
+from typing import List, Optional
 import argparse
-from sklearn.metrics import cohen_kappa_score
+
 import numpy as np
 
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.agreement import LABEL_FIELDS, LabelMatrix, agreement_scores
+
 class InterAnnotatorAgreement:
     """Calculate inter-annotator agreement"""
     
-    def __init__(self, label_files: List[str]):
+    def __init__(self, label_files: List[str], bootstrap: int = 1000, confidence: float = 0.95,
+                 seed: Optional[int] = None):
         self.label_files = [Path(f) for f in label_files]
-        self.label_data = [self._load_labels(f) for f in self.label_files]
+        self.matrix = LabelMatrix.from_files(self.label_files)
+        self.bootstrap = bootstrap
+        self.confidence = confidence
+        self.seed = seed
         self.agreement_scores = {}
     
-    def _load_labels(self, file_path: Path) -> Dict:
-        """Load labels from file"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Convert to dict by item_id
-        labels = {}
-        for label in data.get('labels', []):
-            item_id = label.get('item_id')
-            if item_id:
-                labels[item_id] = label
-        
-        return labels
-    
     def calculate_agreement(self):
-        """Calculate agreement metrics"""
-        if len(self.label_data) < 2:
+        """Calculate agreement metrics for every label type at once
+        
+        Items are compared wherever at least two annotators labeled them;
+        pairwise scores use the items both annotators of the pair labeled.
+        """
+        if len(self.label_files) < 2:
             print("Error: Need at least 2 label files for agreement calculation")
             sys.exit(1)
         
-        # Get common items
-        all_item_ids = set()
-        for labels in self.label_data:
-            all_item_ids.update(labels.keys())
-        
-        common_items = []
-        for item_id in all_item_ids:
-            if all(item_id in labels for labels in self.label_data):
-                common_items.append(item_id)
-        
-        if not common_items:
-            print("Error: No common items found across label files")
+        multiply_labeled = int((self.matrix.annotator_counts() >= 2).sum())
+        if not multiply_labeled:
+            print("Error: No item was labeled by more than one annotator")
             sys.exit(1)
         
-        print(f"\nFound {len(common_items)} common items")
-        
-        # Calculate agreement for each label type
-        for label_type in ['intent', 'sentiment', 'risk_level']:
-            self._calculate_label_agreement(common_items, label_type)
-    
-    def _calculate_label_agreement(self, item_ids: List[str], label_type: str):
-        """Calculate agreement for a specific label type"""
-        # Extract labels for each annotator
-        annotator_labels = []
-        for labels in self.label_data:
-            annotator_labels.append([
-                labels.get(item_id, {}).get(label_type, 'unknown')
-                for item_id in item_ids
-            ])
-        
-        # Calculate pairwise agreement
-        agreements = []
-        for i in range(len(annotator_labels)):
-            for j in range(i + 1, len(annotator_labels)):
-                labels1 = annotator_labels[i]
-                labels2 = annotator_labels[j]
-                
-                # Exact agreement
-                exact_agreement = sum(
-                    1 for l1, l2 in zip(labels1, labels2) if l1 == l2
-                ) / len(labels1)
-                
-                # Cohen's Kappa
-                try:
-                    kappa = cohen_kappa_score(labels1, labels2)
-                except:
-                    kappa = None
-                
-                agreements.append({
-                    'annotator1': i + 1,
-                    'annotator2': j + 1,
-                    'exact_agreement': exact_agreement,
-                    'kappa': kappa
-                })
-        
-        # Calculate average
-        avg_exact = np.mean([a['exact_agreement'] for a in agreements])
-        avg_kappa = np.mean([a['kappa'] for a in agreements if a['kappa'] is not None])
+        print(f"\nFound {len(self.matrix.item_ids)} items, {multiply_labeled} labeled by 2+ annotators")
         
-        self.agreement_scores[label_type] = {
-            'pairwise': agreements,
-            'average_exact_agreement': avg_exact,
-            'average_kappa': avg_kappa
-        }
+        self.agreement_scores = agreement_scores(
+            self.matrix, LABEL_FIELDS, self.bootstrap, self.confidence, np.random.default_rng(self.seed)
+        )
     
     def print_report(self):
         """Print agreement report"""
@@ -113,16 +54,27 @@ class InterAnnotatorAgreement:
         print("="*80)
         
         for label_type, scores in self.agreement_scores.items():
-            print(f"\n{label_type.upper()} Agreement:")
-            print(f"  Average Exact Agreement: {scores['average_exact_agreement']:.3f}")
+            print(f"\n{label_type.upper()} Agreement ({scores['items_multiply_labeled']} items with 2+ labels):")
+            if scores['average_exact_agreement'] is not None:
+                print(f"  Average Exact Agreement: {scores['average_exact_agreement']:.3f}")
             if scores['average_kappa'] is not None:
                 print(f"  Average Cohen's Kappa: {scores['average_kappa']:.3f}")
+            level = f"{scores['confidence']:.0%}"
+            for name, key in (("Fleiss' Kappa", 'fleiss_kappa'), ("Krippendorff's Alpha", 'krippendorff_alpha')):
+                if scores[key] is None:
+                    continue
+                interval = scores[f'{key}_ci']
+                ci = f" ({level} CI {interval[0]:.3f} - {interval[1]:.3f})" if interval else ""
+                print(f"  {name}: {scores[key]:.3f}{ci}")
             
             print(f"\n  Pairwise Agreements:")
             for pair in scores['pairwise']:
+                if not pair['items']:
+                    continue
+                kappa = f"{pair['kappa']:.3f}" if pair['kappa'] is not None else 'N/A'
                 print(f"    Annotator {pair['annotator1']} vs {pair['annotator2']}: "
                       f"{pair['exact_agreement']:.3f} "
-                      f"(κ={pair['kappa']:.3f if pair['kappa'] else 'N/A'})")
+                      f"(κ={kappa}, {pair['items']} items)")
         
         print("\n" + "="*80)
         
@@ -138,11 +90,15 @@ class InterAnnotatorAgreement:
 def main():
     parser = argparse.ArgumentParser(description='Calculate inter-annotator agreement')
     parser.add_argument('--files', '-f', nargs='+', required=True,
-                       help='Label files to compare')
+                       help='Label files to compare (JSON or JSONL), one per annotator')
+    parser.add_argument('--bootstrap', type=int, default=1000,
+                       help='Bootstrap resamples for confidence intervals (0 to skip)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the intervals')
+    parser.add_argument('--seed', type=int, help='Random seed for the bootstrap')
     
     args = parser.parse_args()
     
-    calculator = InterAnnotatorAgreement(args.files)
+    calculator = InterAnnotatorAgreement(args.files, args.bootstrap, args.confidence, args.seed)
     calculator.calculate_agreement()
     calculator.print_report()
 
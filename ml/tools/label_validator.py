@@ -5,98 +5,159 @@ Validates and checks quality of labeled data
 """
 
 import json
+import random
 import sys
 from pathlib import Path
-from typing import Dict, List
-from collections import Counter
+from typing import Dict, List, Optional, Tuple
 import argparse
 
-INTENT_LABELS = [
-    'validate', 'probe_story', 'probe_root', 'reframe',
-    'suggest_experiment', 'offer_mindfulness', 'safety_check',
-    'emergency', 'close', 'other'
-]
+import msgspec
 
-SENTIMENT_LABELS = ['very_negative', 'negative', 'neutral', 'positive']
-RISK_LEVEL_LABELS = ['none', 'low', 'medium', 'high']
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.corpus_stats import CorpusStats
+from utils.compression import dump_json
+from utils.dialogue_model import INTENT_LABELS, SENTIMENT_LABELS, RISK_LEVEL_LABELS
+from utils.schemas import check_label, iter_raw_labels
+from utils.validation import (
+    DEFAULT_CHUNK_SIZE, DiagnosticSink, ErrorRateEstimate, RuleReport, print_diagnostics,
+    print_error_rate_estimate, reservoir_sample, validate_drawn_sample, validate_records,
+)
 
-class LabelValidator:
-    """Validate labeled data"""
+class LabelRules:
+    """Per-label validation rules, run on one chunk of raw labels at a time"""
     
-    def __init__(self, labels_file: str):
-        self.labels_file = Path(labels_file)
-        self.data = self._load_data()
-        self.errors = []
-        self.warnings = []
-        self.stats = {}
+    def __init__(self, keep: Optional[int] = None):
+        self.report = RuleReport(keep)
     
-    def _load_data(self) -> Dict:
-        """Load labels file"""
-        if not self.labels_file.exists():
-            print(f"Error: Labels file not found: {self.labels_file}")
-            sys.exit(1)
-        
-        with open(self.labels_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def check_chunk(self, start: int, records: List[bytes]) -> Tuple[CorpusStats, RuleReport]:
+        """Validate raw labels numbered from ``start``; their stats and diagnostics"""
+        self.report = RuleReport(self.report.keep, start)
+        stats = CorpusStats.from_labels(self.check(raw, start + offset) for offset, raw in enumerate(records))
+        return stats, self.report
     
-    def validate(self) -> bool:
-        """Validate all labels"""
-        labels = self.data.get('labels', [])
+    def check(self, raw: bytes, index: int) -> Dict:
+        """Validate one label while it is decoded; returns it as a dict"""
+        raw, label, error = check_label(raw)
+        if error is None:
+            # Typed decode already checked presence and values of every field
+            self._check_consistency(label.intent, label.risk_level, index)
+            return msgspec.to_builtins(label)
         
-        if not labels:
-            self.errors.append("No labels found in file")
-            return False
-        
-        # Validate each label
-        for i, label in enumerate(labels):
-            self._validate_label(label, i)
-        
-        # Calculate statistics
-        self._calculate_stats(labels)
-        
-        return len(self.errors) == 0
+        data = json.loads(raw)
+        mark = self.report.mark()
+        errors_before = self.report.error_count()
+        try:
+            self._validate_label(data, index)
+        except (TypeError, AttributeError):
+            # Wrong types the field rules can't walk; the schema error says where
+            self.report.drop_since(mark)
+        if self.report.error_count() == errors_before:
+            self.report.error('schema', index, str(error))
+        return data
     
     def _validate_label(self, label: Dict, index: int):
         """Validate a single label"""
+        report = self.report
         # Check required fields
         if 'intent' not in label:
-            self.errors.append(f"Label {index}: Missing 'intent' field")
+            report.error('missing_field', index, "Missing 'intent' field")
         elif label['intent'] not in INTENT_LABELS:
-            self.errors.append(f"Label {index}: Invalid intent '{label['intent']}'")
+            report.error('invalid_value', index, f"Invalid intent '{label['intent']}'")
         
         if 'sentiment' not in label:
-            self.errors.append(f"Label {index}: Missing 'sentiment' field")
+            report.error('missing_field', index, "Missing 'sentiment' field")
         elif label['sentiment'] not in SENTIMENT_LABELS:
-            self.errors.append(f"Label {index}: Invalid sentiment '{label['sentiment']}'")
+            report.error('invalid_value', index, f"Invalid sentiment '{label['sentiment']}'")
         
         if 'risk_level' not in label:
-            self.errors.append(f"Label {index}: Missing 'risk_level' field")
+            report.error('missing_field', index, "Missing 'risk_level' field")
         elif label['risk_level'] not in RISK_LEVEL_LABELS:
-            self.errors.append(f"Label {index}: Invalid risk_level '{label['risk_level']}'")
+            report.error('invalid_value', index, f"Invalid risk_level '{label['risk_level']}'")
         
-        # Check for inconsistencies
-        if label.get('risk_level') == 'high' and label.get('intent') != 'emergency':
-            self.warnings.append(
-                f"Label {index}: High risk but intent is not 'emergency'"
+        self._check_consistency(label.get('intent'), label.get('risk_level'), index)
+    
+    def _check_consistency(self, intent: Optional[str], risk_level: Optional[str], index: int):
+        """Warn about intent/risk combinations that rarely make sense"""
+        if risk_level == 'high' and intent != 'emergency':
+            self.report.warning(
+                'risk_intent_mismatch', index, "High risk but intent is not 'emergency'"
             )
         
-        if label.get('intent') == 'emergency' and label.get('risk_level') != 'high':
-            self.warnings.append(
-                f"Label {index}: Emergency intent but risk_level is not 'high'"
+        if intent == 'emergency' and risk_level != 'high':
+            self.report.warning(
+                'risk_intent_mismatch', index, "Emergency intent but risk_level is not 'high'"
             )
+
+
+def _check_chunk(task: Tuple) -> Tuple[CorpusStats, RuleReport]:
+    """Worker: validate one chunk of raw labels"""
+    start, records, keep, _, _ = task
+    return LabelRules(keep).check_chunk(start, records)
+
+
+class LabelValidator:
+    """Validate labeled data"""
     
-    def _calculate_stats(self, labels: List[Dict]):
-        """Calculate label statistics"""
-        intents = [l.get('intent') for l in labels]
-        sentiments = [l.get('sentiment') for l in labels]
-        risk_levels = [l.get('risk_level') for l in labels]
+    def __init__(self, labels_file: str, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 diagnostics_file: Optional[str] = None, max_diagnostics: Optional[int] = None):
+        self.labels_file = Path(labels_file)
+        self._check_file()
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.sink = DiagnosticSink(diagnostics_file, max_diagnostics, record_name='Label')
+        self.stats = {}
+        self.estimate: Optional[ErrorRateEstimate] = None
+    
+    def _check_file(self):
+        """Make sure the labels file exists"""
+        if not self.labels_file.exists():
+            print(f"Error: Labels file not found: {self.labels_file}")
+            sys.exit(1)
+    
+    @property
+    def errors(self) -> List[str]:
+        """First errors found (all of them are counted in ``sink``)"""
+        return self.sink.errors
+    
+    @property
+    def warnings(self) -> List[str]:
+        return self.sink.warnings
+    
+    def validate(self) -> bool:
+        """Validate all labels while decoding them, a chunk at a time across ``workers`` processes"""
+        with self.sink:
+            labels = validate_records(iter_raw_labels(self.labels_file), _check_chunk, self.sink,
+                                      CorpusStats(kind='labels'), self.workers, self.chunk_size)
+            
+            if not labels.total:
+                self.sink.error('empty', None, "No labels found in file")
+                return False
+        
+        # Calculate statistics
+        self._calculate_stats(labels)
         
-        self.stats = {
-            'total': len(labels),
-            'intent_distribution': dict(Counter(intents)),
-            'sentiment_distribution': dict(Counter(sentiments)),
-            'risk_level_distribution': dict(Counter(risk_levels)),
-        }
+        return self.sink.error_count == 0
+    
+    def validate_sample(self, size: int, confidence: float = 0.95,
+                        seed: Optional[int] = None) -> ErrorRateEstimate:
+        """Validate a random sample of labels and estimate the file's error rate
+
+        Labels are split out of the file undecoded and reservoir-sampled in
+        one pass, so only the sample is kept; only it is decoded and checked.
+        """
+        with self.sink:
+            sample, total = reservoir_sample(iter_raw_labels(self.labels_file), size, random.Random(seed))
+            self.stats = {'total': total}
+            self.estimate = validate_drawn_sample({None: sorted(sample)}, {None: total}, sample.__getitem__,
+                                                  LabelRules(self.sink.retained_per_chunk()), self.sink,
+                                                  confidence)
+            if not total:
+                self.sink.error('empty', None, "No labels found in file")
+        return self.estimate
+    
+    def _calculate_stats(self, labels: CorpusStats):
+        """Calculate label statistics"""
+        self.stats = labels.to_dict()
     
     def print_report(self):
         """Print validation report"""
@@ -107,21 +168,12 @@ class LabelValidator:
         print(f"\nFile: {self.labels_file}")
         print(f"Total Labels: {self.stats.get('total', 0)}")
         
-        # Errors
-        if self.errors:
-            print(f"\n❌ ERRORS ({len(self.errors)}):")
-            for error in self.errors:
-                print(f"  - {error}")
-        else:
-            print("\n✅ No errors found")
-        
-        # Warnings
-        if self.warnings:
-            print(f"\n⚠️  WARNINGS ({len(self.warnings)}):")
-            for warning in self.warnings:
-                print(f"  - {warning}")
-        else:
-            print("\n✅ No warnings")
+        print_diagnostics(self.sink)
+        
+        if self.estimate is not None:
+            print_error_rate_estimate(self.estimate, 'labels')
+            print("\n" + "="*80)
+            return
         
         # Statistics
         print("\n📊 STATISTICS:")
@@ -144,10 +196,10 @@ class LabelValidator:
     
     def export_for_training(self, output_file: str):
         """Export validated labels in training format"""
-        labels = self.data.get('labels', [])
-        
+        # Labels aren't kept after validation, so read them again
         training_data = []
-        for label in labels:
+        for raw in iter_raw_labels(self.labels_file):
+            label = json.loads(raw)
             training_data.append({
                 'text': label.get('text', ''),
                 'intent': label['intent'],
@@ -155,11 +207,7 @@ class LabelValidator:
                 'risk_level': label['risk_level'],
             })
         
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(training_data, f, indent=2, ensure_ascii=False)
+        dump_json(training_data, output_file)
         
         print(f"\n✅ Training data exported to: {output_file}")
 
@@ -167,10 +215,35 @@ def main():
     parser = argparse.ArgumentParser(description='Validate labeled data')
     parser.add_argument('--input', '-i', required=True, help='Labels file to validate')
     parser.add_argument('--export', '-e', help='Export validated data to training format')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Worker processes validating chunks')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Labels per chunk')
+    parser.add_argument('--diagnostics', help='Stream every error and warning to this JSONL file')
+    parser.add_argument('--max-diagnostics', type=int, help='Stop writing diagnostics after this many (all are counted)')
+    parser.add_argument('--sample', type=int,
+                        help='Only validate this many randomly chosen labels and estimate the error rate')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the estimate')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='With --sample, fail if the sample has invalid records or the error rate may exceed this')
+    parser.add_argument('--seed', type=int, help='Random seed for the sample')
     
     args = parser.parse_args()
     
-    validator = LabelValidator(args.input)
+    validator = LabelValidator(args.input, workers=args.workers, chunk_size=args.chunk_size,
+                               diagnostics_file=args.diagnostics, max_diagnostics=args.max_diagnostics)
+    if args.sample:
+        estimate = validator.validate_sample(args.sample, args.confidence, args.seed)
+        validator.print_report()
+        # Any invalid record in the sample means the file has some: only a full pass finds them all
+        if estimate.bad:
+            print(f"\n❌ {estimate.bad} of {estimate.sampled} sampled labels are invalid; run a full validation")
+            sys.exit(1)
+        if estimate.high > args.max_error_rate:
+            print(f"\n❌ Error rate may be up to {estimate.high:.3%} (limit {args.max_error_rate:.3%}); "
+                  f"run a full validation")
+            sys.exit(1)
+        print(f"\n✅ Error rate at most {estimate.high:.3%} (limit {args.max_error_rate:.3%})")
+        sys.exit(0)
+    
     is_valid = validator.validate()
     validator.print_report()
     
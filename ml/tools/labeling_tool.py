@@ -8,10 +8,25 @@ import json
 import os
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import argparse
 
+import pyarrow as pa
+
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.dialogue_index import DialogueIndex
+from utils.compression import load_json
+from utils.journal import Journal, journal_path
+from utils.active_learning import (
+    DEFAULT_MODELS_DIR,
+    DIVERSITY_WINDOW,
+    ENTROPY,
+    UNCERTAINTY_MEASURES,
+    default_classifiers,
+    rank_items,
+)
+
 # Label schemas
 INTENT_LABELS = [
     'validate',
@@ -43,12 +58,29 @@ RISK_LEVEL_LABELS = [
 class LabelingTool:
     """Interactive labeling tool for training data"""
     
-    def __init__(self, data_file: str, output_file: str):
+    def __init__(self, data_file: str, output_file: str, active: bool = False, measure: str = ENTROPY,
+                 models_dir: Path = DEFAULT_MODELS_DIR, batch_size: int = 10, window: int = DIVERSITY_WINDOW,
+                 score_batch_size: int = 32, cache_dir: Optional[str] = None):
         self.data_file = Path(data_file)
         self.output_file = Path(output_file)
         self.data = self._load_data()
-        self.current_index = 0
-        self.labels = []
+        self.journal = Journal(journal_path(self.output_file))
+        self.labels = self._resume()
+        # Positions of the items in the order they are served, and where in that order we are
+        self.order = list(range(len(self.data)))
+        self.ranking = None
+        self.pool_index: Dict[int, int] = {}
+        if active:
+            cache_dir = Path(cache_dir) if cache_dir else self.data_file.parent / '.cache' / 'active_learning'
+            self._rank(measure, models_dir, batch_size, window, score_batch_size, cache_dir)
+            self.cursor = 0
+        else:
+            self.cursor = self._first_unlabeled()
+        
+    @property
+    def current_index(self) -> int:
+        """Position in the data of the item being served"""
+        return self.order[self.cursor]
         
     def _load_data(self) -> List[Dict]:
         """Load data to label"""
@@ -56,8 +88,13 @@ class LabelingTool:
             print(f"Error: Data file not found: {self.data_file}")
             sys.exit(1)
         
-        with open(self.data_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Dialogue corpora are read on demand through the offset index
+        try:
+            return DialogueIndex.open(self.data_file)
+        except (ValueError, pa.ArrowException):
+            pass
+        
+        data = load_json(self.data_file)
         
         # Extract dialogues or messages
         if 'dialogues' in data:
@@ -67,29 +104,93 @@ class LabelingTool:
         else:
             return data if isinstance(data, list) else [data]
     
+    def _resume(self) -> Dict[str, Dict]:
+        """Labels from the output file and any journal a previous session left, by item id
+        
+        Journal records are newer, so they replace earlier labels of the same item.
+        """
+        labels = {}
+        if self.output_file.exists():
+            for label in load_json(self.output_file).get('labels', []):
+                labels[label.get('item_id')] = label
+        journaled = self.journal.replay()
+        for label in journaled:
+            labels[label.get('item_id')] = label
+        if labels:
+            print(f"↩️  Resuming with {len(labels)} labeled items ({len(journaled)} from the journal)")
+        return labels
+    
+    def _item_ids(self) -> List[str]:
+        """Id each item's label is stored under"""
+        if isinstance(self.data, DialogueIndex):
+            ids = self.data.ids
+        else:
+            ids = [item.get('dialogue_id') or item.get('message_id') for item in self.data]
+        return [item_id or f"item_{index}" for index, item_id in enumerate(ids)]
+    
+    def _first_unlabeled(self) -> int:
+        """Position of the first item without a label (the end if all are labeled)"""
+        if not self.labels:
+            return 0
+        return next((index for index, item_id in enumerate(self._item_ids()) if item_id not in self.labels),
+                    len(self.data))
+    
+    def _rank(self, measure: str, models_dir: Path, batch_size: int, window: int, score_batch_size: int,
+              cache_dir: Path):
+        """Serve unlabeled items most uncertain first, scored by the safety and intent classifiers"""
+        item_ids = self._item_ids()
+        pool = [position for position, item_id in enumerate(item_ids) if item_id not in self.labels]
+        classifiers = default_classifiers(models_dir, score_batch_size)
+        if not classifiers:
+            print(f"⚠️  No safety or intent classifier under {models_dir}; serving unlabeled items in file order")
+            self.order = pool
+            return
+        
+        unlabeled = set(pool)
+        items = (item for position, item in enumerate(self.data) if position in unlabeled)
+        print(f"🔎 Ranking {len(pool)} unlabeled items with {', '.join(c.name for c in classifiers)}...")
+        self.ranking = rank_items(items, classifiers, cache_dir, measure, batch_size, window)
+        self.pool_index = {position: i for i, position in enumerate(pool)}
+        self.order = [pool[i] for i in self.ranking.order]
+        for classifier in classifiers:
+            print(f"   {classifier.name}: {self.ranking.scored[classifier.name]} new texts scored, "
+                  f"the rest read from cache (model {classifier.version[:12]})")
+    
+    def _suggestions(self) -> Dict[str, Tuple[str, float]]:
+        """Model-predicted labels for the current item, by field (none outside active mode)"""
+        if self.ranking is None or self.current_index not in self.pool_index:
+            return {}
+        return self.ranking.suggestions(self.pool_index[self.current_index])
+    
+    def _record(self, label: Dict):
+        """Keep a label, journaling it before anything else happens"""
+        self.journal.append(label)
+        self.labels[label['item_id']] = label
+    
     def _save_labels(self):
-        """Save labels to output file"""
+        """Compact the journal into the output file"""
         output_data = {
             'version': '1.0',
             'created_at': datetime.now().isoformat(),
             'source_file': str(self.data_file),
             'total_items': len(self.data),
             'labeled_items': len(self.labels),
-            'labels': self.labels
+            'labels': list(self.labels.values())
         }
         
-        # Create output directory if needed
-        self.output_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(self.output_file, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        self.journal.compact(self.output_file, output_data)
         
         print(f"\n✅ Labels saved to: {self.output_file}")
     
     def _display_item(self, item: Dict):
         """Display item for labeling"""
         print("\n" + "="*80)
-        print(f"Item {self.current_index + 1} of {len(self.data)}")
+        if self.ranking is not None:
+            uncertainty = self.ranking.uncertainty[self.pool_index[self.current_index]]
+            print(f"Queue {self.cursor + 1} of {len(self.order)} (item {self.current_index + 1}, "
+                  f"uncertainty {uncertainty:.2f})")
+        else:
+            print(f"Item {self.current_index + 1} of {len(self.data)}")
         print("="*80)
         
         if 'messages' in item:
@@ -109,9 +210,14 @@ class LabelingTool:
         else:
             print(f"\nItem: {json.dumps(item, indent=2)}")
     
-    def _get_label(self, label_type: str, options: List[str], current: Optional[str] = None) -> str:
-        """Get label from user"""
+    def _get_label(self, label_type: str, options: List[str], current: Optional[str] = None,
+                   suggestion: Optional[Tuple[str, float]] = None) -> str:
+        """Get label from user; Enter keeps the item's label, or else the model's suggestion"""
+        if current is None and suggestion is not None and suggestion[0] in options:
+            current = suggestion[0]
         print(f"\n{label_type.upper()}:")
+        if suggestion is not None and suggestion[0] == current:
+            print(f"  (model suggests {current}, p={suggestion[1]:.2f}; press Enter to accept)")
         for i, option in enumerate(options, 1):
             marker = "←" if option == current else " "
             print(f"  {i}. {marker} {option}")
@@ -137,11 +243,13 @@ class LabelingTool:
         """Label a single item"""
         self._display_item(item)
         
-        # Get labels
+        # Get labels, defaulting to the models' predictions in active mode
+        suggestions = self._suggestions()
         intent = self._get_label(
             'Intent',
             INTENT_LABELS,
-            item.get('intent') if 'intent' in item else None
+            item.get('intent') if 'intent' in item else None,
+            suggestions.get('intent')
         )
         
         sentiment = self._get_label(
@@ -153,7 +261,8 @@ class LabelingTool:
         risk_level = self._get_label(
             'Risk Level',
             RISK_LEVEL_LABELS,
-            item.get('risk_level') if 'risk_level' in item else None
+            item.get('risk_level') if 'risk_level' in item else None,
+            suggestions.get('risk_level')
         )
         
         # Optional notes
@@ -179,50 +288,53 @@ class LabelingTool:
         print(f"Source: {self.data_file}")
         print(f"Output: {self.output_file}")
         print(f"Total items: {len(self.data)}")
+        if self.ranking is not None:
+            print(f"Queue: {len(self.order)} unlabeled items, most uncertain first")
+        print(f"Journal: {self.journal.path}")
         print("\nCommands:")
         print("  - Press Enter to label current item")
         print("  - Type 'skip' to skip current item")
         print("  - Type 'save' to save and exit")
-        print("  - Type 'quit' to exit without saving")
+        print("  - Type 'compact' to write the output file and keep labeling")
+        print("  - Type 'quit' to exit without writing the output file (labels stay in the journal)")
         print("  - Type 'prev' to go to previous item")
         print("  - Type 'next' to go to next item")
         
-        while self.current_index < len(self.data):
+        while self.cursor < len(self.order):
             item = self.data[self.current_index]
             
-            command = input(f"\n[Item {self.current_index + 1}/{len(self.data)}] Command (Enter to label): ").strip().lower()
+            command = input(f"\n[Item {self.cursor + 1}/{len(self.order)}] Command (Enter to label): ").strip().lower()
             
             if command == 'quit':
-                if input("Exit without saving? (y/n): ").lower() == 'y':
+                if input(f"Exit without writing {self.output_file}? Labels are kept in the journal (y/n): ").lower() == 'y':
+                    self.journal.close()
                     sys.exit(0)
             elif command == 'save':
                 self._save_labels()
                 print("Exiting...")
                 break
+            elif command == 'compact':
+                self._save_labels()
+                continue
             elif command == 'skip':
-                self.current_index += 1
+                self.cursor += 1
                 continue
             elif command == 'prev':
-                if self.current_index > 0:
-                    self.current_index -= 1
+                if self.cursor > 0:
+                    self.cursor -= 1
                 else:
                     print("Already at first item")
                 continue
             elif command == 'next':
-                self.current_index += 1
+                self.cursor += 1
                 continue
             elif command == '' or command == 'label':
-                # Label current item
+                # Label current item; it is on disk once recorded
                 label = self.label_item(item)
-                self.labels.append(label)
+                self._record(label)
                 
                 # Move to next
-                self.current_index += 1
-                
-                # Auto-save every 10 items
-                if len(self.labels) % 10 == 0:
-                    self._save_labels()
-                    print(f"\n💾 Auto-saved ({len(self.labels)} items labeled)")
+                self.cursor += 1
             else:
                 print(f"Unknown command: {command}")
         
@@ -233,12 +345,26 @@ class LabelingTool:
 
 def main():
     parser = argparse.ArgumentParser(description='Data Labeling Tool')
-    parser.add_argument('--input', '-i', required=True, help='Input data file (JSON)')
-    parser.add_argument('--output', '-o', required=True, help='Output labels file (JSON)')
+    parser.add_argument('--input', '-i', required=True, help='Input data file (JSON/JSONL, optionally .gz/.zst)')
+    parser.add_argument('--output', '-o', required=True, help='Output labels file (JSON; .gz/.zst to compress)')
+    parser.add_argument('--active', action='store_true',
+                       help='Serve unlabeled items most uncertain first, with model predictions as defaults')
+    parser.add_argument('--uncertainty', choices=UNCERTAINTY_MEASURES, default=ENTROPY,
+                       help='Uncertainty measure for --active (default: entropy)')
+    parser.add_argument('--models-dir', default=str(DEFAULT_MODELS_DIR),
+                       help='Directory holding safety_classifier/ and intent_classifier/')
+    parser.add_argument('--batch-size', type=int, default=10,
+                       help='Items per diversity batch in the --active queue (default: 10)')
+    parser.add_argument('--diversity-window', type=int, default=DIVERSITY_WINDOW,
+                       help=f'Candidates per queued item when diversifying a batch (default: {DIVERSITY_WINDOW}; 1 disables)')
+    parser.add_argument('--score-batch-size', type=int, default=32,
+                       help='Texts per classifier forward pass on CPU (default: 32)')
+    parser.add_argument('--cache-dir', help='Score cache directory (default: .cache/active_learning next to the input)')
     
     args = parser.parse_args()
     
-    tool = LabelingTool(args.input, args.output)
+    tool = LabelingTool(args.input, args.output, args.active, args.uncertainty, Path(args.models_dir),
+                        args.batch_size, args.diversity_window, args.score_batch_size, args.cache_dir)
     tool.run()
 
 if __name__ == '__main__':
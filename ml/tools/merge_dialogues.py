@@ -10,7 +10,13 @@ from pathlib import Path
 from typing import Dict, List
 from datetime import datetime
 import argparse
-from collections import Counter
+
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.dialogue_store import iter_dialogues, DialogueWriter
+from utils.corpus_stats import CorpusStats, corpus_stats, record_corpus_stats
+from utils.near_duplicates import NearDuplicateIndex, dialogue_text, print_near_duplicate_report
+
+NEAR_DUPLICATE_BATCH = 4096
 
 class DialogueMerger:
     """Merge multiple dialogue files"""
@@ -18,7 +24,10 @@ class DialogueMerger:
     def __init__(self, input_files: List[str]):
         self.input_files = [Path(f) for f in input_files]
         self.all_dialogues = []
+        self.dropped = []
         self.seen_ids = set()
+        self.loaded_files = []
+        self.near_duplicate_report = None
     
     def load_all(self) -> List[Dict]:
         """Load dialogues from all files"""
@@ -27,22 +36,22 @@ class DialogueMerger:
                 print(f"Warning: File not found: {file_path}")
                 continue
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            dialogues = data.get('dialogues', [])
-            print(f"Loaded {len(dialogues)} dialogues from {file_path.name}")
-            
-            for dialogue in dialogues:
+            loaded = 0
+            for dialogue in iter_dialogues(file_path):
+                loaded += 1
                 dialogue_id = dialogue.get('dialogue_id')
                 if dialogue_id and dialogue_id in self.seen_ids:
                     print(f"Warning: Duplicate dialogue_id: {dialogue_id}")
+                    self.dropped.append(dialogue)
                     continue
                 
                 if dialogue_id:
                     self.seen_ids.add(dialogue_id)
                 
                 self.all_dialogues.append(dialogue)
+            
+            self.loaded_files.append(file_path)
+            print(f"Loaded {loaded} dialogues from {file_path.name}")
         
         return self.all_dialogues
     
@@ -55,6 +64,7 @@ class DialogueMerger:
             # Create content hash (first user message + first assistant message)
             messages = dialogue.get('messages', [])
             if len(messages) < 2:
+                self.dropped.append(dialogue)
                 continue
             
             user_msg = messages[0].get('text', '').lower().strip()
@@ -65,33 +75,56 @@ class DialogueMerger:
                 seen_content.add(content_hash)
                 unique.append(dialogue)
             else:
+                self.dropped.append(dialogue)
                 print(f"Removed duplicate: {dialogue.get('dialogue_id', 'unknown')}")
         
         return unique
     
+    def deduplicate_near(self, dialogues: List[Dict], threshold: float = 0.8, num_perm: int = 128) -> List[Dict]:
+        """Remove dialogues whose full text is a near-duplicate (MinHash Jaccard >= threshold) of an earlier one"""
+        index = NearDuplicateIndex(threshold, num_perm)
+        unique = []
+        
+        for start in range(0, len(dialogues), NEAR_DUPLICATE_BATCH):
+            batch = dialogues[start:start + NEAR_DUPLICATE_BATCH]
+            keys = [d.get('dialogue_id') or f"#{start + i}" for i, d in enumerate(batch)]
+            matches = index.add_batch(keys, [dialogue_text(d) for d in batch])
+            for dialogue, match in zip(batch, matches):
+                if match is None:
+                    unique.append(dialogue)
+                else:
+                    self.dropped.append(dialogue)
+        
+        self.near_duplicate_report = index.report()
+        print_near_duplicate_report(self.near_duplicate_report)
+        return unique
+    
+    def calculate_statistics(self) -> CorpusStats:
+        """Merge cached per-file statistics, minus every dialogue that was dropped"""
+        merged = CorpusStats()
+        for file_path in self.loaded_files:
+            merged += corpus_stats(file_path)
+        return merged - CorpusStats.from_dialogues(self.dropped)
+    
     def save(self, dialogues: List[Dict], output_file: str):
         """Save merged dialogues"""
-        # Calculate statistics
-        stats = {
-            'total_dialogues': len(dialogues),
-            'session_types': dict(Counter(d.get('session_type') for d in dialogues)),
-            'concerns': dict(Counter(d.get('user_profile', {}).get('concern') for d in dialogues))
-        }
+        corpus = self.calculate_statistics()
+        if corpus.total != len(dialogues):
+            # Dialogues were filtered outside load_all/deduplicate; count them directly
+            corpus = CorpusStats.from_dialogues(dialogues)
+        stats = corpus.to_dict()
         
-        output_data = {
+        header = {
             'version': '1.0',
             'description': f'Merged seed dialogues ({len(dialogues)} examples)',
             'merged_at': datetime.now().isoformat(),
             'source_files': [str(f) for f in self.input_files],
-            'dialogues': dialogues,
-            'statistics': stats
         }
         
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        with DialogueWriter(output_file, header) as writer:
+            writer.write_all(dialogues)
+            writer.close(stats)
+        record_corpus_stats(corpus, output_file)
         
         print(f"\n✅ Merged dialogues saved to: {output_file}")
         print(f"   Total dialogues: {len(dialogues)}")
@@ -102,6 +135,11 @@ def main():
     parser.add_argument('--files', '-f', nargs='+', required=True, help='Input files to merge')
     parser.add_argument('--output', '-o', required=True, help='Output file')
     parser.add_argument('--deduplicate', action='store_true', help='Remove duplicates')
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help='Also remove near-duplicates over full dialogue text (MinHash/LSH)')
+    parser.add_argument('--threshold', type=float, default=0.8, help='Jaccard similarity for near-duplicates')
+    parser.add_argument('--num-perm', type=int, default=128, help='MinHash permutations (accuracy vs speed)')
+    parser.add_argument('--report', help='Write the near-duplicate cluster report to this JSON file')
     
     args = parser.parse_args()
     
@@ -113,6 +151,15 @@ def main():
         dialogues = merger.deduplicate(dialogues)
         print(f"After deduplication: {len(dialogues)} dialogues")
     
+    if args.near_duplicates:
+        print(f"\nRemoving near-duplicates from {len(dialogues)} dialogues...")
+        dialogues = merger.deduplicate_near(dialogues, args.threshold, args.num_perm)
+        print(f"After near-duplicate removal: {len(dialogues)} dialogues")
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(merger.near_duplicate_report, f, indent=2, ensure_ascii=False)
+            print(f"   Cluster report: {args.report}")
+    
     merger.save(dialogues, args.output)
 
 if __name__ == '__main__':
@@ -4,97 +4,130 @@ Merge Labels Tool
 Merges labels from multiple annotators using consensus or majority voting
 """
 
-import json
 import sys
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, Iterator, List, Optional
 from collections import Counter
 import argparse
 
+sys.path.append(str(Path(__file__).parent.parent))
+from utils.agreement import LABEL_FIELDS, LabelMatrix
+from utils.dialogue_model import ABSENT, Label, INTENTS, SENTIMENTS, RISK_LEVELS
+from utils.dialogue_store import LabelWriter
+from utils.label_merge import DawidSkene, merge_label_streams
+
 class LabelMerger:
     """Merge labels from multiple annotators"""
     
-    def __init__(self, label_files: List[str], strategy: str = 'majority'):
+    def __init__(self, label_files: List[str], strategy: str = 'majority',
+                 max_iterations: int = 50, tolerance: float = 1e-6):
         self.label_files = [Path(f) for f in label_files]
-        self.strategy = strategy  # 'majority' or 'consensus'
-        self.label_data = [self._load_labels(f) for f in self.label_files]
+        self.strategy = strategy  # 'majority', 'consensus' or 'dawid-skene'
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.merged_at = datetime.now().isoformat()
+        self.models: Dict[str, DawidSkene] = {}
     
-    def _load_labels(self, file_path: Path) -> Dict:
-        """Load labels from file"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        labels = {}
-        for label in data.get('labels', []):
-            item_id = label.get('item_id')
-            if item_id:
-                labels[item_id] = label
+    def merge(self) -> Iterator[Dict]:
+        """Merge labels using specified strategy, one item at a time in item_id order
         
-        return labels
+        The label files are merged as sorted streams, so voting strategies
+        hold one label per file at a time. Dawid-Skene fits on every label
+        first (as a compact code matrix), then yields the merged labels.
+        """
+        if self.strategy == 'dawid-skene':
+            return self._merge_dawid_skene()
+        if self.strategy not in ('majority', 'consensus'):
+            raise ValueError(f"Unknown strategy: {self.strategy}")
+        return self._merge_votes()
     
-    def merge(self) -> List[Dict]:
-        """Merge labels using specified strategy"""
-        # Get all item IDs
-        all_item_ids = set()
-        for labels in self.label_data:
-            all_item_ids.update(labels.keys())
-        
-        merged_labels = []
-        
-        for item_id in all_item_ids:
-            # Get labels from all annotators
-            item_labels = [
-                labels.get(item_id) for labels in self.label_data
-                if item_id in labels
-            ]
-            
-            if not item_labels:
-                continue
+    def _merge_votes(self) -> Iterator[Dict]:
+        """Majority or consensus vote per item"""
+        for item_id, item_labels in merge_label_streams(self.label_files):
+            labels = [label for _, label in item_labels]
             
             # Merge using strategy
             if self.strategy == 'majority':
-                merged = self._merge_majority(item_id, item_labels)
-            elif self.strategy == 'consensus':
-                merged = self._merge_consensus(item_id, item_labels)
+                merged = self._merge_majority(item_id, labels)
             else:
-                raise ValueError(f"Unknown strategy: {self.strategy}")
+                merged = self._merge_consensus(item_id, labels)
             
             if merged:
-                merged_labels.append(merged)
+                yield merged
+    
+    def _merge_dawid_skene(self) -> Iterator[Dict]:
+        """Fit annotator confusion matrices per label field, then label items by posterior"""
+        item_ids, annotator_counts, notes = [], [], {}
+        entries = {field: ([], [], []) for field in LABEL_FIELDS}
+        for row, (item_id, item_labels) in enumerate(merge_label_streams(self.label_files)):
+            item_ids.append(item_id)
+            annotator_counts.append(len(item_labels))
+            for annotator, label in item_labels:
+                for field, code in zip(LABEL_FIELDS, (label.intent_code, label.sentiment_code, label.risk_code)):
+                    if code != ABSENT:
+                        rows, annotators, codes = entries[field]
+                        rows.append(row)
+                        annotators.append(annotator)
+                        codes.append(code)
+            item_notes = self._notes([label for _, label in item_labels])
+            if item_notes:
+                notes[row] = item_notes
         
-        return merged_labels
+        matrix = LabelMatrix.from_entries(item_ids, [str(f) for f in self.label_files], entries)
+        self.models = {
+            field: DawidSkene.fit(matrix.codes[field], matrix.categories(field),
+                                  self.max_iterations, self.tolerance)
+            for field in LABEL_FIELDS
+        }
+        return self._posterior_labels(item_ids, annotator_counts, notes)
     
-    def _merge_majority(self, item_id: str, labels: List[Dict]) -> Dict:
+    def _posterior_labels(self, item_ids: List[str], annotator_counts: List[int],
+                          notes: Dict[int, str]) -> Iterator[Dict]:
+        for row, item_id in enumerate(item_ids):
+            merged = {'item_id': item_id}
+            probabilities = {}
+            for field, model in self.models.items():
+                merged[field], probabilities[f'{field}_probabilities'] = model.label(row, LABEL_FIELDS[field])
+            merged.update(probabilities)
+            merged['annotator_count'] = annotator_counts[row]
+            merged['merged_at'] = self.merged_at
+            if row in notes:
+                merged['notes'] = notes[row]
+            yield merged
+    
+    def _merge_majority(self, item_id: str, labels: List[Label]) -> Dict:
         """Merge using majority voting"""
-        intents = [l.get('intent') for l in labels if l.get('intent')]
-        sentiments = [l.get('sentiment') for l in labels if l.get('sentiment')]
-        risk_levels = [l.get('risk_level') for l in labels if l.get('risk_level')]
+        intents, sentiments, risk_levels = self._label_codes(labels)
         
         merged = {
             'item_id': item_id,
-            'intent': Counter(intents).most_common(1)[0][0] if intents else None,
-            'sentiment': Counter(sentiments).most_common(1)[0][0] if sentiments else None,
-            'risk_level': Counter(risk_levels).most_common(1)[0][0] if risk_levels else None,
+            'intent': INTENTS.decode(Counter(intents).most_common(1)[0][0]) if intents else None,
+            'sentiment': SENTIMENTS.decode(Counter(sentiments).most_common(1)[0][0]) if sentiments else None,
+            'risk_level': RISK_LEVELS.decode(Counter(risk_levels).most_common(1)[0][0]) if risk_levels else None,
             'annotator_count': len(labels),
-            'merged_at': __import__('datetime').datetime.now().isoformat()
+            'merged_at': self.merged_at
         }
         
         # Add notes if any
-        notes = [l.get('notes') for l in labels if l.get('notes')]
+        notes = self._notes(labels)
         if notes:
-            merged['notes'] = ' | '.join(notes)
+            merged['notes'] = notes
         
         return merged
     
-    def _merge_consensus(self, item_id: str, labels: List[Dict]) -> Optional[Dict]:
+    @staticmethod
+    def _notes(labels: List[Label]) -> Optional[str]:
+        notes = [l.get_extra('notes') for l in labels if l.get_extra('notes')]
+        return ' | '.join(notes) if notes else None
+    
+    def _merge_consensus(self, item_id: str, labels: List[Label]) -> Optional[Dict]:
         """Merge using consensus (all must agree)"""
         if len(labels) < 2:
             return self._merge_majority(item_id, labels)
         
         # Check if all agree
-        intents = [l.get('intent') for l in labels if l.get('intent')]
-        sentiments = [l.get('sentiment') for l in labels if l.get('sentiment')]
-        risk_levels = [l.get('risk_level') for l in labels if l.get('risk_level')]
+        intents, sentiments, risk_levels = self._label_codes(labels)
         
         intent_consensus = len(set(intents)) == 1 if intents else False
         sentiment_consensus = len(set(sentiments)) == 1 if sentiments else False
@@ -106,34 +139,54 @@ class LabelMerger:
         
         return {
             'item_id': item_id,
-            'intent': intents[0] if intents else None,
-            'sentiment': sentiments[0] if sentiments else None,
-            'risk_level': risk_levels[0] if risk_levels else None,
+            'intent': INTENTS.decode(intents[0]) if intents else None,
+            'sentiment': SENTIMENTS.decode(sentiments[0]) if sentiments else None,
+            'risk_level': RISK_LEVELS.decode(risk_levels[0]) if risk_levels else None,
             'annotator_count': len(labels),
             'consensus': True,
-            'merged_at': __import__('datetime').datetime.now().isoformat()
+            'merged_at': self.merged_at
         }
     
-    def save(self, output_file: str, merged_labels: List[Dict]):
-        """Save merged labels"""
-        output_path = Path(output_file)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        output_data = {
+    def _label_codes(self, labels: List[Label]):
+        """Present intent/sentiment/risk codes across annotators"""
+        intents = [l.intent_code for l in labels if l.intent_code != ABSENT and l.intent]
+        sentiments = [l.sentiment_code for l in labels if l.sentiment_code != ABSENT and l.sentiment]
+        risk_levels = [l.risk_code for l in labels if l.risk_code != ABSENT and l.risk_level]
+        return intents, sentiments, risk_levels
+    
+    def save(self, output_file: str, merged_labels: Iterable[Dict]):
+        """Stream merged labels to the output file as they are merged"""
+        header = {
             'version': '1.0',
             'strategy': self.strategy,
             'source_files': [str(f) for f in self.label_files],
-            'total_labels': len(merged_labels),
-            'created_at': __import__('datetime').datetime.now().isoformat(),
-            'labels': merged_labels
+            'created_at': datetime.now().isoformat(),
         }
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        with LabelWriter(output_file, header) as writer:
+            for merged in merged_labels:
+                writer.write(merged)
+            # Fitted while the labels were merged, so they go after them
+            if self.models:
+                writer.close({'annotator_accuracy': self._annotator_accuracy(),
+                              'em_iterations': {field: model.iterations for field, model in self.models.items()}})
         
         print(f"\n✅ Merged labels saved to: {output_file}")
         print(f"   Strategy: {self.strategy}")
-        print(f"   Total labels: {len(merged_labels)}")
+        print(f"   Total labels: {writer.count}")
+        if self.models:
+            print("   Estimated annotator accuracy:")
+            for path, accuracy in self._annotator_accuracy().items():
+                scores = ', '.join(f"{field} {value:.3f}" for field, value in accuracy.items())
+                print(f"     {path}: {scores}")
+    
+    def _annotator_accuracy(self) -> Dict[str, Dict[str, float]]:
+        """Dawid-Skene estimate of how often each annotator gives the true label, per field"""
+        accuracy = {field: model.accuracy() for field, model in self.models.items()}
+        return {
+            str(path): {field: round(float(values[annotator]), 4) for field, values in accuracy.items()}
+            for annotator, path in enumerate(self.label_files)
+        }
 
 def main():
     parser = argparse.ArgumentParser(description='Merge labels from multiple annotators')
@@ -142,12 +195,15 @@ def main():
     parser.add_argument('--output', '-o', required=True,
                        help='Output file for merged labels')
     parser.add_argument('--strategy', '-s', default='majority',
-                       choices=['majority', 'consensus'],
-                       help='Merging strategy')
+                       choices=['majority', 'consensus', 'dawid-skene'],
+                       help='Merging strategy (dawid-skene weights annotators by estimated reliability)')
+    parser.add_argument('--max-iterations', type=int, default=50, help='EM iterations for dawid-skene')
+    parser.add_argument('--tolerance', type=float, default=1e-6,
+                       help='Stop EM once the relative log-likelihood change is below this')
     
     args = parser.parse_args()
     
-    merger = LabelMerger(args.files, args.strategy)
+    merger = LabelMerger(args.files, args.strategy, args.max_iterations, args.tolerance)
     merged = merger.merge()
     merger.save(args.output, merged)
 
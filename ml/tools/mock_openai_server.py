@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI Server
+Local OpenAI-compatible chat completions endpoint for exercising LLM generation offline
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+
+CANNED_DIALOGUES = [
+    {
+        'messages': [
+            {'role': 'user', 'text': "I've been feeling anxious about {concern} lately."},
+            {'role': 'assistant', 'text': "That sounds really hard — I'm glad you told me.",
+             'intent': 'validate', 'sentiment': 'negative', 'risk_level': 'none'},
+        ],
+        'labels': {'primary_intent': 'validate', 'overall_sentiment': 'negative',
+                   'max_risk_level': 'none', 'therapeutic_technique': 'validation'},
+    },
+    {
+        'messages': [
+            {'role': 'user', 'text': "Everything about {concern} feels like too much."},
+            {'role': 'assistant', 'text': "Would you like to tell me more about what that's been like?",
+             'intent': 'probe_story', 'sentiment': 'neutral', 'risk_level': 'none'},
+            {'role': 'user', 'text': "It started a few weeks ago."},
+            {'role': 'assistant', 'text': "What if we looked at this from a different angle together?",
+             'intent': 'reframe', 'sentiment': 'neutral', 'risk_level': 'none'},
+        ],
+        'labels': {'primary_intent': 'probe_story', 'overall_sentiment': 'neutral',
+                   'max_risk_level': 'none', 'therapeutic_technique': 'exploration'},
+    },
+]
+
+
+class MockState:
+    """Server settings and request counters shared by handler threads"""
+
+    def __init__(self, latency: float, error_rate: float, rate_limit_rate: float, malformed_rate: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'malformed': 0}
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    """Answers POST /v1/chat/completions with a dialogue JSON message"""
+
+    state: MockState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send(200, self.state.counts)
+        else:
+            self._send(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send(404, {'error': {'message': 'not found'}})
+            return
+
+        state = self.state
+        state.count('requests')
+        time.sleep(state.latency)
+
+        roll = random.random()
+        if roll < state.rate_limit_rate:
+            state.count('rate_limited')
+            self._send(429, {'error': {'message': 'rate limited', 'type': 'rate_limit_error'}},
+                       {'Retry-After': '0.05'})
+            return
+        if roll < state.rate_limit_rate + state.error_rate:
+            state.count('errors')
+            self._send(500, {'error': {'message': 'internal error', 'type': 'server_error'}})
+            return
+
+        concern = 'things'
+        for message in request.get('messages', []):
+            if message.get('role') == 'user' and ' about ' in message.get('content', ''):
+                concern = message['content'].split(' about ', 1)[1].split('.', 1)[0]
+        rng = random.Random(request.get('seed'))
+        dialogue = json.loads(json.dumps(rng.choice(CANNED_DIALOGUES)).replace('{concern}', concern))
+        content = json.dumps(dialogue)
+
+        if random.random() < state.malformed_rate:
+            state.count('malformed')
+            content = content[:len(content) // 2]
+
+        self._send(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        })
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8765, latency: float = 0.2, error_rate: float = 0.0,
+                rate_limit_rate: float = 0.0, malformed_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Build (but don't start) a mock server; ``server.state.counts`` tracks requests"""
+    state = MockState(latency, error_rate, rate_limit_rate, malformed_rate)
+    handler = type('Handler', (ChatCompletionsHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a mock OpenAI-compatible chat completions server')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to bind')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds to wait before each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction answered with 429')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Fraction with truncated JSON content')
+
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.error_rate,
+                         args.rate_limit_rate, args.malformed_rate)
+    print(f"🧪 Mock OpenAI server on http://{args.host}:{args.port}/v1 (GET /stats for counters)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 {server.state.counts}")
+
+if __name__ == '__main__':
+    main()
@@ -5,151 +5,290 @@ Validates seed dialogues for structure and quality
 """
 
 import json
+import random
 import sys
 from pathlib import Path
-from typing import Dict, List
-from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
 import argparse
 
-INTENT_LABELS = [
-    'validate', 'probe_story', 'probe_root', 'reframe',
-    'suggest_experiment', 'offer_mindfulness', 'safety_check',
-    'emergency', 'close', 'other'
-]
+import msgspec
 
-SENTIMENT_LABELS = ['very_negative', 'negative', 'neutral', 'positive']
-RISK_LEVEL_LABELS = ['none', 'low', 'medium', 'high']
-SESSION_TYPES = ['check-in', 'gentle_deep', 'micro_practice']
+sys.path.append(str(Path(__file__).parent.parent))
+from utils import dialogue_model, schemas
+from utils.corpus_stats import CorpusStats, record_corpus_stats, stats_path
+from utils.dialogue_index import DialogueIndex
+from utils.dialogue_model import INTENT_LABELS, SENTIMENT_LABELS, RISK_LEVEL_LABELS, SESSION_TYPES
+from utils.dialogue_store import corpus_hash
+from utils.schemas import UNSET, Dialogue, check_dialogue, iter_raw_dialogues
+from utils.validation import (
+    DEFAULT_CHUNK_SIZE, DiagnosticSink, ErrorRateEstimate, RuleReport, ValidationCache,
+    print_diagnostics, print_error_rate_estimate, rules_version, validate_records,
+    validate_sample, validation_cache_path,
+)
 
-class DialogueValidator:
-    """Validate dialogue structure and quality"""
+class DialogueRules:
+    """Per-dialogue validation rules, run on one chunk of raw records at a time"""
     
-    def __init__(self, dialogues_file: str):
-        self.dialogues_file = Path(dialogues_file)
-        self.data = self._load_data()
-        self.errors = []
-        self.warnings = []
-        self.stats = {}
+    def __init__(self, keep: Optional[int] = None):
+        self.report = RuleReport(keep)
     
-    def _load_data(self) -> Dict:
-        """Load dialogues file"""
-        if not self.dialogues_file.exists():
-            print(f"Error: File not found: {self.dialogues_file}")
-            sys.exit(1)
-        
-        with open(self.dialogues_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
-    def validate(self) -> bool:
-        """Validate all dialogues"""
-        dialogues = self.data.get('dialogues', [])
-        
-        if not dialogues:
-            self.errors.append("No dialogues found in file")
-            return False
-        
-        # Validate each dialogue
-        for i, dialogue in enumerate(dialogues):
-            self._validate_dialogue(dialogue, i)
+    def check_chunk(self, start: int, records: List[bytes], check: Optional[Set[int]] = None,
+                    with_stats: bool = True) -> Tuple[Optional[CorpusStats], RuleReport]:
+        """Validate raw records numbered from ``start``; their stats and diagnostics
+
+        Only the offsets in ``check`` (all when None) are validated; the rest
+        are decoded just for stats, or skipped without ``with_stats``.
+        Records that aren't JSON objects are left out of the stats.
+        """
+        self.report = RuleReport(self.report.keep, start)
         
-        # Calculate statistics
-        self._calculate_stats(dialogues)
+        def dialogues():
+            for offset, raw in enumerate(records):
+                if check is None or offset in check:
+                    yield self.check(raw, start + offset)
+                elif with_stats:
+                    yield self.decode(raw)
         
-        # Check distribution
-        self._check_distribution(dialogues)
+        if not with_stats:
+            for _ in dialogues():
+                pass
+            return None, self.report
+        return CorpusStats.from_dialogues(d for d in dialogues() if d is not None), self.report
+    
+    @staticmethod
+    def decode(raw: bytes) -> Optional[Dict]:
+        """A dialogue as a dict, without running any rules (None if the record isn't an object)"""
+        try:
+            raw, dialogue, error = check_dialogue(raw)
+        except ValueError:
+            return None
+        if error is None:
+            return msgspec.to_builtins(dialogue)
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else None
+    
+    def check(self, raw: bytes, index: int) -> Optional[Dict]:
+        """Validate one dialogue while it is decoded; returns it as a dict
+
+        Records that decode against the typed schema only need the warning
+        checks. The field-by-field rules run only on records the schema
+        rejected, so every problem with them is reported. Records that
+        aren't JSON, or aren't JSON objects, get a single error and None.
+        """
+        try:
+            raw, dialogue, error = check_dialogue(raw)
+        except ValueError as e:
+            self.report.error('invalid_json', index, str(e))
+            return None
+        if error is None:
+            self._check_warnings(dialogue, index)
+            return msgspec.to_builtins(dialogue)
         
-        return len(self.errors) == 0
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            self.report.error('invalid_type', index, f"Dialogue must be an object, not {type(data).__name__}")
+            return None
+        mark = self.report.mark()
+        errors_before = self.report.error_count()
+        try:
+            self._validate_dialogue(data, index)
+        except (TypeError, AttributeError):
+            # Wrong types the field rules can't walk; the schema error says where
+            self.report.drop_since(mark)
+        if self.report.error_count() == errors_before:
+            # Only the typed schema (e.g. a wrong field type) caught this one
+            self.report.error('schema', index, str(error))
+        return data
+    
+    def _check_warnings(self, dialogue: Dialogue, index: int):
+        """Warnings for a dialogue that already passed schema validation"""
+        if dialogue.user_profile.mood_score is UNSET:
+            self.report.warning('missing_field', index, "Missing 'user_profile.mood_score'")
+        if dialogue.labels is UNSET:
+            self.report.warning('missing_field', index, "Missing 'labels'")
+        elif dialogue.labels.primary_intent is UNSET:
+            self.report.warning('missing_field', index, "Missing 'labels.primary_intent'")
     
     def _validate_dialogue(self, dialogue: Dict, index: int):
         """Validate a single dialogue"""
+        report = self.report
         # Required fields
         if 'dialogue_id' not in dialogue:
-            self.errors.append(f"Dialogue {index}: Missing 'dialogue_id'")
+            report.error('missing_field', index, "Missing 'dialogue_id'")
         
         if 'session_type' not in dialogue:
-            self.errors.append(f"Dialogue {index}: Missing 'session_type'")
+            report.error('missing_field', index, "Missing 'session_type'")
         elif dialogue['session_type'] not in SESSION_TYPES:
-            self.errors.append(f"Dialogue {index}: Invalid session_type '{dialogue['session_type']}'")
+            report.error('invalid_value', index, f"Invalid session_type '{dialogue['session_type']}'")
         
         if 'messages' not in dialogue:
-            self.errors.append(f"Dialogue {index}: Missing 'messages'")
+            report.error('missing_field', index, "Missing 'messages'")
         elif not isinstance(dialogue['messages'], list):
-            self.errors.append(f"Dialogue {index}: 'messages' must be an array")
+            report.error('invalid_type', index, "'messages' must be an array")
         elif len(dialogue['messages']) < 2:
-            self.errors.append(f"Dialogue {index}: Must have at least 2 messages")
+            report.error('too_few_messages', index, "Must have at least 2 messages")
         else:
             # Validate messages
             for j, msg in enumerate(dialogue['messages']):
                 self._validate_message(msg, index, j)
         
         if 'user_profile' not in dialogue:
-            self.errors.append(f"Dialogue {index}: Missing 'user_profile'")
+            report.error('missing_field', index, "Missing 'user_profile'")
         else:
             profile = dialogue['user_profile']
             if 'concern' not in profile:
-                self.errors.append(f"Dialogue {index}: Missing 'user_profile.concern'")
+                report.error('missing_field', index, "Missing 'user_profile.concern'")
             if 'mood_score' not in profile:
-                self.warnings.append(f"Dialogue {index}: Missing 'user_profile.mood_score'")
+                report.warning('missing_field', index, "Missing 'user_profile.mood_score'")
             elif not (1 <= profile['mood_score'] <= 10):
-                self.errors.append(f"Dialogue {index}: Invalid mood_score (must be 1-10)")
+                report.error('mood_score_range', index, "Invalid mood_score (must be 1-10)")
         
         if 'labels' not in dialogue:
-            self.warnings.append(f"Dialogue {index}: Missing 'labels'")
+            report.warning('missing_field', index, "Missing 'labels'")
         else:
             labels = dialogue['labels']
             if 'primary_intent' not in labels:
-                self.warnings.append(f"Dialogue {index}: Missing 'labels.primary_intent'")
+                report.warning('missing_field', index, "Missing 'labels.primary_intent'")
             elif labels['primary_intent'] not in INTENT_LABELS:
-                self.errors.append(f"Dialogue {index}: Invalid primary_intent '{labels['primary_intent']}'")
+                report.error('invalid_value', index, f"Invalid primary_intent '{labels['primary_intent']}'")
     
     def _validate_message(self, message: Dict, dialogue_index: int, message_index: int):
         """Validate a single message"""
+        report = self.report
+        where = f"Message {message_index}"
         if 'role' not in message:
-            self.errors.append(f"Dialogue {dialogue_index}, Message {message_index}: Missing 'role'")
+            report.error('missing_field', dialogue_index, f"{where}: Missing 'role'")
         elif message['role'] not in ['user', 'assistant']:
-            self.errors.append(f"Dialogue {dialogue_index}, Message {message_index}: Invalid role '{message['role']}'")
+            report.error('invalid_value', dialogue_index, f"{where}: Invalid role '{message['role']}'")
         
         if 'text' not in message:
-            self.errors.append(f"Dialogue {dialogue_index}, Message {message_index}: Missing 'text'")
+            report.error('missing_field', dialogue_index, f"{where}: Missing 'text'")
         elif not message['text'] or len(message['text'].strip()) == 0:
-            self.errors.append(f"Dialogue {dialogue_index}, Message {message_index}: Empty text")
+            report.error('empty_text', dialogue_index, f"{where}: Empty text")
         
         if message.get('role') == 'assistant':
             if 'intent' in message and message['intent'] not in INTENT_LABELS:
-                self.errors.append(f"Dialogue {dialogue_index}, Message {message_index}: Invalid intent '{message['intent']}'")
+                report.error('invalid_value', dialogue_index, f"{where}: Invalid intent '{message['intent']}'")
             
             if 'sentiment' in message and message['sentiment'] not in SENTIMENT_LABELS:
-                self.errors.append(f"Dialogue {dialogue_index}, Message {message_index}: Invalid sentiment '{message['sentiment']}'")
+                report.error('invalid_value', dialogue_index, f"{where}: Invalid sentiment '{message['sentiment']}'")
             
             if 'risk_level' in message and message['risk_level'] not in RISK_LEVEL_LABELS:
-                self.errors.append(f"Dialogue {dialogue_index}, Message {message_index}: Invalid risk_level '{message['risk_level']}'")
-    
-    def _calculate_stats(self, dialogues: List[Dict]):
-        """Calculate statistics"""
-        self.stats = {
-            'total': len(dialogues),
-            'session_types': Counter(d.get('session_type') for d in dialogues),
-            'concerns': Counter(d.get('user_profile', {}).get('concern') for d in dialogues),
-            'intents': Counter(),
-            'sentiments': Counter(),
-            'risk_levels': Counter(),
-            'avg_messages_per_dialogue': sum(len(d.get('messages', [])) for d in dialogues) / len(dialogues) if dialogues else 0
-        }
+                report.error('invalid_value', dialogue_index, f"{where}: Invalid risk_level '{message['risk_level']}'")
+
+
+def _check_chunk(task: Tuple) -> Tuple[Optional[CorpusStats], RuleReport]:
+    """Worker: validate one chunk of raw dialogues"""
+    start, records, keep, check, with_stats = task
+    return DialogueRules(keep).check_chunk(start, records, check, with_stats)
+
+
+# Cached results are only reused while the rules, schemas and label sets are unchanged
+RULES_VERSION = rules_version(DialogueRules, schemas, dialogue_model)
+
+
+class DialogueValidator:
+    """Validate dialogue structure and quality"""
+    
+    def __init__(self, dialogues_file: str, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 diagnostics_file: Optional[str] = None, max_diagnostics: Optional[int] = None,
+                 use_cache: bool = True):
+        self.dialogues_file = Path(dialogues_file)
+        self._check_file()
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.use_cache = use_cache
+        self.sink = DiagnosticSink(diagnostics_file, max_diagnostics, record_name='Dialogue')
+        self.rules = DialogueRules()
+        self.stats = {}
+        self.estimate: Optional[ErrorRateEstimate] = None
+    
+    def _check_file(self):
+        """Make sure the dialogues file exists"""
+        if not self.dialogues_file.exists():
+            print(f"Error: File not found: {self.dialogues_file}")
+            sys.exit(1)
+    
+    @property
+    def errors(self) -> List[str]:
+        """First errors found (all of them are counted in ``sink``)"""
+        return self.sink.errors
+    
+    @property
+    def warnings(self) -> List[str]:
+        return self.sink.warnings
+    
+    def validate(self) -> bool:
+        """Validate all dialogues, a chunk at a time, across ``workers`` processes
+
+        Each chunk returns its corpus stats and diagnostics; stats are merged
+        and diagnostics streamed to the sink in corpus order, so the result
+        does not depend on the number of workers. With the cache, only
+        dialogues whose content was not validated under the current rules
+        are checked, and stats of an unchanged corpus come from its stats cache.
+        """
+        cache = corpus = None
+        if self.use_cache:
+            cache = ValidationCache.load(validation_cache_path(self.dialogues_file), RULES_VERSION)
+            corpus = CorpusStats.load(stats_path(self.dialogues_file), corpus_hash(self.dialogues_file))
         
-        for dialogue in dialogues:
-            for msg in dialogue.get('messages', []):
-                if msg.get('intent'):
-                    self.stats['intents'][msg['intent']] += 1
-                if msg.get('sentiment'):
-                    self.stats['sentiments'][msg['sentiment']] += 1
-                if msg.get('risk_level'):
-                    self.stats['risk_levels'][msg['risk_level']] += 1
+        with self.sink:
+            # Statistics are accumulated from the same pass that validates
+            stats = validate_records(iter_raw_dialogues(self.dialogues_file), _check_chunk, self.sink,
+                                     CorpusStats() if corpus is None else None,
+                                     self.workers, self.chunk_size, cache)
+            if corpus is None:
+                corpus = stats
+            self.stats = self._report_stats(corpus)
+            
+            if cache is not None:
+                cache.save()
+                print(f"♻️  Validation cache: {cache.hits} dialogues unchanged, {cache.misses} validated")
+            
+            if not self.stats['total']:
+                self.sink.error('empty', None, "No dialogues found in file")
+                return False
+            
+            if stats is not None:
+                record_corpus_stats(corpus, self.dialogues_file)
+            
+            # Check distribution
+            self._check_distribution()
         
-        # Convert Counters to dicts
-        for key in ['session_types', 'concerns', 'intents', 'sentiments', 'risk_levels']:
-            self.stats[key] = dict(self.stats[key])
+        return self.sink.error_count == 0
+    
+    def validate_sample(self, size: int, stratify: Tuple[str, ...] = (), confidence: float = 0.95,
+                        seed: Optional[int] = None) -> ErrorRateEstimate:
+        """Validate a random sample of dialogues and estimate the corpus' error rate
+
+        Dialogues are read through the corpus index, so only the sampled ones
+        are decoded. With ``stratify`` (e.g. ``('concern', 'session_type')``)
+        the sample is spread over each combination of those fields in
+        proportion to its size, so rare concerns are not missed by chance.
+        """
+        with self.sink, DialogueIndex.open(self.dialogues_file) as index:
+            strata = index.strata(*stratify)
+            self.stats = {'total': len(index)}
+            self.rules = DialogueRules(self.sink.retained_per_chunk())
+            self.estimate = validate_sample(strata, size, index.raw, self.rules, self.sink,
+                                            random.Random(seed), confidence)
+            if not len(index):
+                self.sink.error('empty', None, "No dialogues found in file")
+        return self.estimate
+    
+    def _report_stats(self, corpus: CorpusStats) -> Dict:
+        """Pick the distributions shown in the validation report"""
+        return {
+            'total': corpus.total,
+            'session_types': corpus.distribution('session_type', include_missing=True),
+            'concerns': corpus.distribution('concern', include_missing=True),
+            'intents': corpus.distribution('intent'),
+            'sentiments': corpus.distribution('sentiment'),
+            'risk_levels': corpus.distribution('risk_level'),
+            'avg_messages_per_dialogue': corpus.total_messages / corpus.total if corpus.total else 0,
+        }
     
-    def _check_distribution(self, dialogues: List[Dict]):
+    def _check_distribution(self):
         """Check if distribution is balanced"""
         session_types = self.stats['session_types']
         total = self.stats['total']
@@ -160,9 +299,9 @@ class DialogueValidator:
             percentage = (count / total) * 100 if total > 0 else 0
             
             if percentage < 10:
-                self.warnings.append(f"Low representation of '{session_type}': {percentage:.1f}%")
+                self.sink.warning('distribution', None, f"Low representation of '{session_type}': {percentage:.1f}%")
             elif percentage > 70:
-                self.warnings.append(f"High representation of '{session_type}': {percentage:.1f}%")
+                self.sink.warning('distribution', None, f"High representation of '{session_type}': {percentage:.1f}%")
     
     def print_report(self):
         """Print validation report"""
@@ -173,25 +312,12 @@ class DialogueValidator:
         print(f"\nFile: {self.dialogues_file}")
         print(f"Total Dialogues: {self.stats.get('total', 0)}")
         
-        # Errors
-        if self.errors:
-            print(f"\n❌ ERRORS ({len(self.errors)}):")
-            for error in self.errors[:20]:  # Show first 20
-                print(f"  - {error}")
-            if len(self.errors) > 20:
-                print(f"  ... and {len(self.errors) - 20} more errors")
-        else:
-            print("\n✅ No errors found")
-        
-        # Warnings
-        if self.warnings:
-            print(f"\n⚠️  WARNINGS ({len(self.warnings)}):")
-            for warning in self.warnings[:10]:  # Show first 10
-                print(f"  - {warning}")
-            if len(self.warnings) > 10:
-                print(f"  ... and {len(self.warnings) - 10} more warnings")
-        else:
-            print("\n✅ No warnings")
+        print_diagnostics(self.sink)
+        
+        if self.estimate is not None:
+            print_error_rate_estimate(self.estimate, 'dialogues')
+            print("\n" + "="*80)
+            return
         
         # Statistics
         print("\n📊 STATISTICS:")
@@ -217,10 +343,40 @@ class DialogueValidator:
 def main():
     parser = argparse.ArgumentParser(description='Validate seed dialogues')
     parser.add_argument('--input', '-i', required=True, help='Dialogues file to validate')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Worker processes validating chunks')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Dialogues per chunk')
+    parser.add_argument('--diagnostics', help='Stream every error and warning to this JSONL file')
+    parser.add_argument('--max-diagnostics', type=int, help='Stop writing diagnostics after this many (all are counted)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Revalidate every dialogue instead of reusing cached results')
+    parser.add_argument('--sample', type=int,
+                        help='Only validate this many randomly chosen dialogues and estimate the error rate')
+    parser.add_argument('--stratify', nargs='+', choices=['concern', 'session_type'], default=[],
+                        help='Spread the sample over these fields in proportion to their values')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the estimate')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='With --sample, fail if the sample has invalid records or the error rate may exceed this')
+    parser.add_argument('--seed', type=int, help='Random seed for the sample')
     
     args = parser.parse_args()
     
-    validator = DialogueValidator(args.input)
+    validator = DialogueValidator(args.input, workers=args.workers, chunk_size=args.chunk_size,
+                                  diagnostics_file=args.diagnostics, max_diagnostics=args.max_diagnostics,
+                                  use_cache=not args.no_cache)
+    if args.sample:
+        estimate = validator.validate_sample(args.sample, tuple(args.stratify), args.confidence, args.seed)
+        validator.print_report()
+        # Any invalid record in the sample means the file has some: only a full pass finds them all
+        if estimate.bad:
+            print(f"\n❌ {estimate.bad} of {estimate.sampled} sampled dialogues are invalid; run a full validation")
+            sys.exit(1)
+        if estimate.high > args.max_error_rate:
+            print(f"\n❌ Error rate may be up to {estimate.high:.3%} (limit {args.max_error_rate:.3%}); "
+                  f"run a full validation")
+            sys.exit(1)
+        print(f"\n✅ Error rate at most {estimate.high:.3%} (limit {args.max_error_rate:.3%})")
+        sys.exit(0)
+    
     is_valid = validator.validate()
     validator.print_report()
     
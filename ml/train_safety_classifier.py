@@ -5,25 +5,49 @@ Target: 98%+ recall for suicidal/self-harm content
 """
 
 import os
-import json
+import argparse
 import torch
 from transformers import (
     AutoTokenizer,
     AutoModelForSequenceClassification,
     TrainingArguments,
     Trainer,
+    DataCollatorWithPadding,
+    default_data_collator,
 )
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import precision_recall_fscore_support, accuracy_score
 import pandas as pd
 from datasets import Dataset
 
+from utils.message_table import load_messages
+from utils.tokenized_cache import (
+    examples_hash,
+    tokenization_settings_key,
+    resolve_revision,
+    tokenized_cache_key,
+    tokenize_incremental,
+    load_tokenized_splits,
+    save_tokenized_splits,
+)
+from utils.batching import (
+    LENGTH_COLUMN,
+    padding_policy,
+    add_lengths,
+    TokenCountingCollator,
+    print_token_throughput,
+)
+
 # Configuration
 MODEL_NAME = "bert-base-uncased"
+TOKENIZER_REVISION = "main"  # Resolved to its current commit, which keys the tokenization caches
 OUTPUT_DIR = "./models/safety_classifier"
 BATCH_SIZE = 16
 LEARNING_RATE = 2e-5
 NUM_EPOCHS = 5
+MAX_LENGTH = 128
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
 TARGET_RECALL = 0.98
 
 def load_training_data():
@@ -37,17 +61,13 @@ def load_training_data():
     data_file = expanded_file if os.path.exists(expanded_file) else seed_file
     
     print(f"Loading training data from: {data_file}")
-    with open(data_file, 'r') as f:
-        data = json.load(f)
-    
-    # Extract messages and labels
-    for dialogue in data.get('dialogues', []):
-        for message in dialogue.get('messages', []):
-            if message.get('role') == 'user':
-                examples.append({
-                    'text': message['text'],
-                    'risk_level': message.get('risk_level', 'none'),
-                })
+    
+    # Project user messages and risk labels from the cached message table
+    for message in load_messages(data_file, role='user', columns=['text', 'risk_level']):
+        examples.append({
+            'text': message['text'],
+            'risk_level': message['risk_level'] or 'none',
+        })
     
     # Add synthetic high-risk examples if needed
     high_risk_count = sum(1 for e in examples if e['risk_level'] == 'high')
@@ -80,37 +100,72 @@ def load_training_data():
     
     return examples
 
-def prepare_dataset(examples):
-    """Prepare dataset for training"""
-    # Convert to DataFrame
-    df = pd.DataFrame(examples)
-    
+def prepare_dataset(examples, dynamic_padding=False):
+    """Prepare dataset for training, reusing cached tokenization when possible"""
     # Map risk levels to numeric labels
     label_map = {'none': 0, 'low': 1, 'medium': 2, 'high': 3}
-    df['label'] = df['risk_level'].map(label_map)
     
-    # Split train/test
-    train_df, test_df = train_test_split(df, test_size=0.2, random_state=42)
+    cached, cache_key = _load_cached_splits(examples, label_map, dynamic_padding)
+    if cached:
+        train_dataset, test_dataset = cached
+        return train_dataset, test_dataset, label_map
     
-    # Tokenize
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    # Convert to DataFrame
+    df = pd.DataFrame(examples)
+    df['label'] = df['risk_level'].map(label_map)
     
-    def tokenize_function(examples):
-        return tokenizer(
-            examples['text'],
+    # Tokenize (only texts missing from the token store for these settings)
+    def tokenize_function(texts):
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, revision=resolve_revision(MODEL_NAME, TOKENIZER_REVISION))
+        encoded = tokenizer(
+            texts,
             truncation=True,
-            padding='max_length',
-            max_length=128
+            padding=padding_policy(dynamic_padding),
+            max_length=MAX_LENGTH
         )
+        return add_lengths(encoded) if dynamic_padding else encoded
+    
+    encoded = tokenize_incremental(df['text'].tolist(), tokenize_function, _tokenization_settings(dynamic_padding))
+    for column, values in encoded.items():
+        df[column] = values
+    
+    # Split train/test
+    train_df, test_df = train_test_split(df, test_size=TEST_SIZE, random_state=SPLIT_SEED)
     
     train_dataset = Dataset.from_pandas(train_df)
     test_dataset = Dataset.from_pandas(test_df)
     
-    train_dataset = train_dataset.map(tokenize_function, batched=True)
-    test_dataset = test_dataset.map(tokenize_function, batched=True)
+    save_tokenized_splits(cache_key, train_dataset, test_dataset, metadata={'model_name': MODEL_NAME})
+    print(f"💾 Cached tokenized dataset ({cache_key[:12]})")
     
     return train_dataset, test_dataset, label_map
 
+def _tokenization_settings(dynamic_padding):
+    """Key for the tokenizer settings used by prepare_dataset"""
+    return tokenization_settings_key(
+        MODEL_NAME,
+        resolve_revision(MODEL_NAME, TOKENIZER_REVISION),
+        max_length=MAX_LENGTH,
+        truncation=True,
+        padding=padding_policy(dynamic_padding),
+    )
+
+def _load_cached_splits(examples, label_map, dynamic_padding):
+    """Look up tokenized splits for these examples and tokenizer settings"""
+    cache_key = tokenized_cache_key(
+        examples_hash(examples, ['text', 'risk_level']),
+        _tokenization_settings(dynamic_padding),
+        split_seed=SPLIT_SEED,
+        test_size=TEST_SIZE,
+        label_map=label_map,
+    )
+    cached = load_tokenized_splits(cache_key)
+    if cached:
+        print(f"✅ Tokenized dataset cache hit ({cache_key[:12]}), skipping tokenization")
+    else:
+        print(f"🔄 Tokenized dataset cache miss ({cache_key[:12]}), building splits...")
+    return cached, cache_key
+
 def compute_metrics(eval_pred):
     """Compute evaluation metrics"""
     predictions, labels = eval_pred
@@ -132,21 +187,32 @@ def compute_metrics(eval_pred):
         'high_risk_recall': high_risk_recall,
     }
 
-def train():
+class TokenCountingTrainer(Trainer):
+    """Trainer whose evaluation batches skip the token counts, so throughput covers training only"""
+    
+    def get_eval_dataloader(self, eval_dataset=None):
+        counting = self.data_collator
+        self.data_collator = counting.collate
+        try:
+            return super().get_eval_dataloader(eval_dataset)
+        finally:
+            self.data_collator = counting
+
+def train(dynamic_padding=False):
     """Train safety classifier"""
     print("🔄 Loading training data...")
     examples = load_training_data()
     print(f"✅ Loaded {len(examples)} examples")
     
     print("🔄 Preparing dataset...")
-    train_dataset, test_dataset, label_map = prepare_dataset(examples)
+    train_dataset, test_dataset, label_map = prepare_dataset(examples, dynamic_padding)
     
     print("🔄 Loading model...")
     model = AutoModelForSequenceClassification.from_pretrained(
         MODEL_NAME,
         num_labels=4  # none, low, medium, high
     )
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, revision=resolve_revision(MODEL_NAME, TOKENIZER_REVISION))
     
     print("🔄 Setting up training...")
     training_args = TrainingArguments(
@@ -161,19 +227,29 @@ def train():
         save_steps=500,
         evaluation_strategy="steps",
         load_best_model_at_end=True,
+        # Bucket similar-length sequences together so dynamic padding stays small
+        group_by_length=dynamic_padding,
+        length_column_name=LENGTH_COLUMN,
         metric_for_best_model="high_risk_recall",
     )
     
-    trainer = Trainer(
+    # Pad each batch to its longest sequence, or keep the fixed max_length tensors
+    data_collator = TokenCountingCollator(
+        DataCollatorWithPadding(tokenizer) if dynamic_padding else default_data_collator
+    )
+    
+    trainer = TokenCountingTrainer(
         model=model,
         args=training_args,
         train_dataset=train_dataset,
         eval_dataset=test_dataset,
         compute_metrics=compute_metrics,
+        data_collator=data_collator,
     )
     
-    print("🚀 Starting training...")
-    trainer.train()
+    print(f"🚀 Starting training ({'dynamic' if dynamic_padding else 'max_length'} padding)...")
+    train_output = trainer.train()
+    print_token_throughput(data_collator, train_output.metrics.get('train_runtime', 0))
     
     print("📊 Evaluating...")
     results = trainer.evaluate()
@@ -194,5 +270,10 @@ def train():
     print("✅ Training complete!")
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dynamic-padding', action='store_true',
+                        help='Pad per batch and bucket batches by sequence length instead of padding to MAX_LENGTH')
+    args = parser.parse_args()
+    
+    train(dynamic_padding=args.dynamic_padding)
 
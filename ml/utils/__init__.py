@@ -5,11 +5,161 @@ ML Utilities Package
 from .data_preprocessing import (
     load_seed_dialogues,
     extract_conversations,
+    load_conversations,
     prepare_training_pairs,
     augment_data,
     split_train_test,
 )
 
+from .augmentation import (
+    AugmentationStrategy,
+    LexicalSubstitution,
+    TemplateReslot,
+    Seq2SeqParaphraser,
+    augment_texts,
+)
+
+from .compression import (
+    open_text,
+    load_json,
+    dump_json,
+)
+
+from .dialogue_store import (
+    iter_dialogues,
+    read_header,
+    DialogueWriter,
+    LabelWriter,
+    save_dialogues,
+)
+
+from .message_table import (
+    materialize_message_table,
+    load_message_table,
+    load_messages,
+)
+
+from .tokenized_cache import (
+    examples_hash,
+    tokenization_settings_key,
+    tokenized_cache_key,
+    tokenize_incremental,
+    load_tokenized_splits,
+    save_tokenized_splits,
+)
+
+from .batching import (
+    padding_policy,
+    add_lengths,
+    TokenCountingCollator,
+    print_token_throughput,
+)
+
+from .manifest import (
+    dialogue_content_hash,
+    CorpusManifest,
+    ManifestDelta,
+)
+
+from .dialogue_model import (
+    Vocabulary,
+    Message,
+    UserProfile,
+    DialogueLabels,
+    Dialogue,
+    Label,
+    decode_counts,
+    iter_compact_dialogues,
+    load_compact_dialogues,
+)
+
+from .dialogue_index import (
+    DialogueIndex,
+    IndexedView,
+    build_index,
+)
+
+from .corpus_stats import (
+    CorpusStats,
+    corpus_stats,
+    record_corpus_stats,
+)
+
+from .near_duplicates import (
+    MinHasher,
+    NearDuplicateIndex,
+    dialogue_text,
+)
+
+from .bloom_filter import (
+    BloomFilter,
+    dialogue_fingerprint,
+    fingerprint_array,
+)
+
+from .reply_model import (
+    ReplyModel,
+    reply_examples,
+)
+
+from .schemas import (
+    SchemaError,
+    iter_checked_dialogues,
+    iter_checked_labels,
+    load_reviews,
+    iter_reviews,
+)
+
+from .validation import (
+    RuleReport,
+    DiagnosticSink,
+    chunked,
+    map_chunks,
+    print_diagnostics,
+    ValidationCache,
+    validate_records,
+    ErrorRateEstimate,
+    estimate_error_rate,
+    validate_sample,
+    reservoir_sample,
+)
+
+from .agreement import (
+    LabelMatrix,
+    agreement_scores,
+)
+
+from .label_merge import (
+    DawidSkene,
+    merge_label_streams,
+)
+
+from .journal import (
+    Journal,
+    journal_path,
+)
+
+from .external_sort import (
+    ExternalSorter,
+)
+
+from .review_join import (
+    resolved_reviews,
+    join_reviews,
+)
+
+from .active_learning import (
+    TextClassifier,
+    default_classifiers,
+    rank_items,
+)
+
+from .llm_generation import (
+    TokenBucket,
+    ResponseCache,
+    AsyncDialogueGenerator,
+)
+
 from .evaluation import (
     calculate_validation_rate,
     calculate_safety_recall,
@@ -20,9 +170,93 @@ from .evaluation import (
 __all__ = [
     'load_seed_dialogues',
     'extract_conversations',
+    'load_conversations',
     'prepare_training_pairs',
     'augment_data',
     'split_train_test',
+    'AugmentationStrategy',
+    'LexicalSubstitution',
+    'TemplateReslot',
+    'Seq2SeqParaphraser',
+    'augment_texts',
+    'open_text',
+    'load_json',
+    'dump_json',
+    'iter_dialogues',
+    'read_header',
+    'DialogueWriter',
+    'LabelWriter',
+    'save_dialogues',
+    'materialize_message_table',
+    'load_message_table',
+    'load_messages',
+    'examples_hash',
+    'tokenization_settings_key',
+    'tokenized_cache_key',
+    'tokenize_incremental',
+    'load_tokenized_splits',
+    'save_tokenized_splits',
+    'padding_policy',
+    'add_lengths',
+    'TokenCountingCollator',
+    'print_token_throughput',
+    'dialogue_content_hash',
+    'CorpusManifest',
+    'ManifestDelta',
+    'Vocabulary',
+    'Message',
+    'UserProfile',
+    'DialogueLabels',
+    'Dialogue',
+    'Label',
+    'decode_counts',
+    'iter_compact_dialogues',
+    'load_compact_dialogues',
+    'DialogueIndex',
+    'IndexedView',
+    'build_index',
+    'CorpusStats',
+    'corpus_stats',
+    'record_corpus_stats',
+    'MinHasher',
+    'NearDuplicateIndex',
+    'dialogue_text',
+    'BloomFilter',
+    'dialogue_fingerprint',
+    'fingerprint_array',
+    'ReplyModel',
+    'reply_examples',
+    'SchemaError',
+    'iter_checked_dialogues',
+    'iter_checked_labels',
+    'load_reviews',
+    'iter_reviews',
+    'RuleReport',
+    'DiagnosticSink',
+    'chunked',
+    'map_chunks',
+    'print_diagnostics',
+    'ValidationCache',
+    'validate_records',
+    'ErrorRateEstimate',
+    'estimate_error_rate',
+    'validate_sample',
+    'reservoir_sample',
+    'LabelMatrix',
+    'agreement_scores',
+    'DawidSkene',
+    'merge_label_streams',
+    'Journal',
+    'journal_path',
+    'ExternalSorter',
+    'resolved_reviews',
+    'join_reviews',
+    'TextClassifier',
+    'default_classifiers',
+    'rank_items',
+    'TokenBucket',
+    'ResponseCache',
+    'AsyncDialogueGenerator',
     'calculate_validation_rate',
     'calculate_safety_recall',
     'evaluate_model',
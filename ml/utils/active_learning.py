@@ -0,0 +1,299 @@
+"""
+Active Learning
+Uncertainty-ranked labeling queues scored by the safety and intent classifiers
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from .dialogue_model import INTENT_LABELS, RISK_LEVEL_LABELS
+from .dialogue_store import PathLike
+
+ENTROPY = 'entropy'
+MARGIN = 'margin'
+UNCERTAINTY_MEASURES = [ENTROPY, MARGIN]
+
+# Texts scored between cache saves
+SCORE_CHUNK = 4096
+
+# Candidates considered per queued item when picking a diverse batch
+DIVERSITY_WINDOW = 5
+
+# Items at the head of a queue that are diversified; the rest follow by uncertainty alone
+DIVERSE_HEAD = 2000
+
+DEFAULT_MODELS_DIR = Path(__file__).resolve().parent.parent / 'models'
+
+
+def model_version(model_dir: PathLike) -> str:
+    """Fingerprint of a saved model: the name, size and modification time of each of its files
+
+    Retraining or replacing the model changes it; reading the weights,
+    which can take hundreds of megabytes, is not needed to notice.
+    """
+    digest = hashlib.sha256()
+    root = Path(model_dir)
+    for path in sorted(p for p in root.rglob('*') if p.is_file()):
+        stat = path.stat()
+        digest.update(f"{path.relative_to(root).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TextClassifier:
+    """A fine-tuned sequence classifier run on CPU, ``batch_size`` texts per forward pass
+
+    ``field`` is the label field it predicts (``risk_level`` or ``intent``)
+    and ``role`` the speaker whose messages it reads: the safety classifier
+    is trained on user messages, the intent classifier on assistant replies.
+    """
+
+    def __init__(self, name: str, model_dir: PathLike, field: str, role: str, labels: Sequence[str],
+                 batch_size: int = 32, max_length: int = 128):
+        self.name = name
+        self.model_dir = Path(model_dir)
+        self.field = field
+        self.role = role
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.version = model_version(self.model_dir)
+        self.labels = self._label_order(labels)
+        self._model = None
+
+    def _label_order(self, labels: Sequence[str]) -> List[str]:
+        """Labels by output index, from the model's ``label_map.json`` when it has one"""
+        label_map_file = self.model_dir / 'label_map.json'
+        if label_map_file.exists():
+            with open(label_map_file, 'r') as f:
+                label_map = json.load(f)
+            return [label for label, _ in sorted(label_map.items(), key=lambda item: item[1])]
+        return list(labels)
+
+    def _load(self):
+        if self._model is None:
+            from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+            model = AutoModelForSequenceClassification.from_pretrained(str(self.model_dir))
+            model.eval()
+            self._model = (tokenizer, model)
+        return self._model
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """(texts x labels) class probabilities"""
+        import torch
+
+        tokenizer, model = self._load()
+        probabilities = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            inputs = tokenizer(batch, return_tensors='pt', padding=True, truncation=True,
+                               max_length=self.max_length)
+            with torch.inference_mode():
+                logits = model(**inputs).logits
+            probabilities.append(torch.softmax(logits, dim=-1).numpy())
+        if not probabilities:
+            return np.empty((0, len(self.labels)), dtype=np.float32)
+        return np.vstack(probabilities).astype(np.float32)
+
+
+def default_classifiers(models_dir: PathLike = DEFAULT_MODELS_DIR, batch_size: int = 32) -> List[TextClassifier]:
+    """The safety and intent classifiers found under ``models_dir`` (either may be missing)"""
+    models_dir = Path(models_dir)
+    specs = [
+        ('safety_classifier', 'risk_level', 'user', RISK_LEVEL_LABELS),
+        ('intent_classifier', 'intent', 'assistant', INTENT_LABELS),
+    ]
+    classifiers = []
+    for name, field, role, labels in specs:
+        # Training writes models/<name>; deployed copies live in models/<name>/latest
+        for model_dir in (models_dir / name / 'latest', models_dir / name):
+            if (model_dir / 'config.json').exists():
+                classifiers.append(TextClassifier(name, model_dir, field, role, labels, batch_size))
+                break
+    return classifiers
+
+
+def item_text(item: Dict, role: str) -> str:
+    """Text a classifier reads for a labeling item: a dialogue's messages by ``role``, or a message's text"""
+    if 'messages' in item:
+        return '\n'.join(message.get('text') or '' for message in item['messages']
+                         if message.get('role') == role)
+    return item.get('text') or ''
+
+
+class ScoreCache:
+    """Class probabilities of one model version, keyed by the hash of the text scored
+
+    Stored as ``<name>-<version>.npz`` under ``cache_dir``, so a retrained
+    model starts a fresh cache and the old scores are never mixed in.
+    """
+
+    def __init__(self, cache_dir: PathLike, classifier: TextClassifier):
+        self.path = Path(cache_dir) / f"{classifier.name}-{classifier.version[:16]}.npz"
+        self.width = len(classifier.labels)
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.probabilities = np.empty((0, self.width), dtype=np.float32)
+        if self.path.exists():
+            with np.load(self.path) as stored:
+                self.keys = stored['keys'].tolist()
+                self.probabilities = stored['probabilities']
+            self.rows = {key: row for row, key in enumerate(self.keys)}
+
+    def missing(self, keys: Sequence[str]) -> List[str]:
+        """Distinct keys with no cached scores, in first-seen order"""
+        return list(dict.fromkeys(key for key in keys if key not in self.rows))
+
+    def add(self, keys: Sequence[str], probabilities: np.ndarray):
+        for key in keys:
+            self.rows[key] = len(self.keys)
+            self.keys.append(key)
+        self.probabilities = np.vstack([self.probabilities, probabilities.astype(np.float32)])
+
+    def lookup(self, keys: Sequence[str]) -> np.ndarray:
+        return self.probabilities[[self.rows[key] for key in keys]].reshape(len(keys), self.width)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name('.tmp-' + self.path.name)
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=np.array(self.keys, dtype=str), probabilities=self.probabilities)
+        tmp_path.replace(self.path)
+
+
+def score_texts(texts: Sequence[str], classifier: TextClassifier, cache_dir: PathLike) -> Tuple[np.ndarray, int]:
+    """Probabilities of each text under a classifier, and how many texts had to be scored
+
+    Only texts the cache hasn't seen with this model version go through
+    the model, and the cache is saved every ``SCORE_CHUNK`` of them, so an
+    interrupted run keeps what it scored. Everything else is read back.
+    """
+    keys = [text_hash(text) for text in texts]
+    cache = ScoreCache(cache_dir, classifier)
+    missing = cache.missing(keys)
+    if missing:
+        text_of = dict(zip(keys, texts))
+        for start in range(0, len(missing), SCORE_CHUNK):
+            chunk = missing[start:start + SCORE_CHUNK]
+            cache.add(chunk, classifier.predict_proba([text_of[key] for key in chunk]))
+            cache.save()
+    return cache.lookup(keys), len(missing)
+
+
+def uncertainty(probabilities: np.ndarray, measure: str = ENTROPY) -> np.ndarray:
+    """Per-row uncertainty in [0, 1]: normalized entropy, or one minus the top-two margin"""
+    if measure not in UNCERTAINTY_MEASURES:
+        raise ValueError(f"unknown uncertainty measure {measure!r} (expected one of {UNCERTAINTY_MEASURES})")
+    k = probabilities.shape[1]
+    if k < 2:
+        return np.zeros(len(probabilities))
+    if measure == MARGIN:
+        top = np.sort(probabilities, axis=1)[:, -2:]
+        return 1 - (top[:, 1] - top[:, 0])
+    clipped = np.clip(probabilities, 1e-12, 1)
+    return -(probabilities * np.log(clipped)).sum(axis=1) / np.log(k)
+
+
+def diverse_order(scores: np.ndarray, features: np.ndarray, batch_size: int = 10,
+                  window: int = DIVERSITY_WINDOW, head: int = DIVERSE_HEAD) -> np.ndarray:
+    """Row order serving the most uncertain rows first, spread out within each batch
+
+    Each batch is picked greedily (k-center) from the ``batch_size * window``
+    most uncertain rows left: it opens with the most uncertain one, then
+    repeatedly takes the candidate farthest from those already picked,
+    weighted by its uncertainty, so one batch doesn't fill up with items
+    the models find hard for the same reason. Only the first ``head`` rows
+    are picked this way (more than a session labels); the rest follow in
+    uncertainty order, and are diversified when the queue is next ranked.
+    """
+    ranked = np.argsort(-scores, kind='stable')
+    width = batch_size * window
+    # Candidates a batch passed over are at least as uncertain as any row not yet considered
+    pending = ranked[:0]
+    taken = 0
+    order = []
+    while (len(pending) or taken < len(ranked)) and len(order) < head:
+        fresh = ranked[taken:taken + width - len(pending)]
+        taken += len(fresh)
+        candidates = np.concatenate([pending, fresh])
+        points = features[candidates]
+        distance = np.full(len(candidates), np.inf)
+        available = np.ones(len(candidates), dtype=bool)
+        picked = []
+        for _ in range(min(batch_size, len(candidates))):
+            if picked:
+                gain = np.where(available, distance * scores[candidates], -np.inf)
+                choice = int(np.argmax(gain))
+            else:
+                choice = 0
+            picked.append(choice)
+            available[choice] = False
+            distance = np.minimum(distance, np.linalg.norm(points - points[choice], axis=1))
+        order.extend(candidates[picked])
+        pending = candidates[available]
+    return np.concatenate([np.asarray(order, dtype=np.int64), pending, ranked[taken:]]).astype(np.int64)
+
+
+# A classifier's predicted label for an item, with its probability
+Suggestion = Tuple[str, float]
+
+
+class Ranking:
+    """Order to serve a pool of items in, with the classifiers' predictions for each
+
+    ``order`` lists pool positions, most informative first; ``scored``
+    counts the texts each classifier actually had to score.
+    """
+
+    def __init__(self, order: np.ndarray, uncertainty: np.ndarray,
+                 predictions: Dict[str, Tuple[List[str], np.ndarray]], scored: Dict[str, int]):
+        self.order = order
+        self.uncertainty = uncertainty
+        self.predictions = predictions
+        self.scored = scored
+
+    def suggestions(self, item: int) -> Dict[str, Suggestion]:
+        """Most probable label per field for the item at pool position ``item``"""
+        suggested = {}
+        for field, (labels, probabilities) in self.predictions.items():
+            code = int(probabilities[item].argmax())
+            suggested[field] = (labels[code], float(probabilities[item, code]))
+        return suggested
+
+
+def rank_items(items: Iterable[Dict], classifiers: Sequence[TextClassifier], cache_dir: PathLike,
+               measure: str = ENTROPY, batch_size: int = 10, window: int = DIVERSITY_WINDOW) -> Ranking:
+    """Rank a pool of labeling items by how uncertain the classifiers are about them
+
+    Items are read once, keeping only the text each classifier reads. An
+    item's uncertainty is the highest of the classifiers'; the diversity
+    features are all classifiers' probabilities side by side.
+    """
+    roles = list(dict.fromkeys(classifier.role for classifier in classifiers))
+    texts: Dict[str, List[str]] = {role: [] for role in roles}
+    count = 0
+    for item in items:
+        for role in roles:
+            texts[role].append(item_text(item, role))
+        count += 1
+
+    combined = np.zeros(count)
+    columns = [np.zeros((count, 0))]
+    predictions = {}
+    scored = {}
+    for classifier in classifiers:
+        probabilities, scored[classifier.name] = score_texts(texts[classifier.role], classifier, cache_dir)
+        combined = np.maximum(combined, uncertainty(probabilities, measure))
+        columns.append(probabilities)
+        predictions[classifier.field] = (classifier.labels, probabilities)
+
+    order = diverse_order(combined, np.hstack(columns), batch_size, window)
+    return Ranking(order, combined, predictions, scored)
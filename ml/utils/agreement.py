@@ -0,0 +1,256 @@
+"""
+Agreement
+Inter-annotator agreement over an (items x annotators) label code matrix
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import msgspec
+import numpy as np
+
+from .dialogue_model import ABSENT, INTENTS, RISK_LEVELS, SENTIMENTS, Vocabulary
+from .dialogue_store import PathLike
+from .schemas import iter_raw_labels
+
+# Label fields compared between annotators, with their vocabularies
+LABEL_FIELDS: Dict[str, Vocabulary] = {
+    'intent': INTENTS,
+    'sentiment': SENTIMENTS,
+    'risk_level': RISK_LEVELS,
+}
+
+# Rows per step when counting pairwise confusions, bounding temporary memory
+_PAIR_ROWS = 8192
+
+# Bootstrap resamples drawn per matrix product
+_BOOTSTRAP_BATCH = 64
+
+
+class LabelMatrix:
+    """Every annotator's label codes per item, one matrix per label field
+
+    ``codes[field][i, a]`` is annotator ``a``'s code for item ``i``, or
+    ``ABSENT`` where they did not label it (or left the field out). Items
+    any annotator labeled are kept, not only those all of them did.
+    """
+
+    def __init__(self, item_ids: List[str], annotators: List[str], codes: Dict[str, np.ndarray]):
+        self.item_ids = item_ids
+        self.annotators = annotators
+        self.codes = codes
+
+    @classmethod
+    def from_files(cls, label_files: Iterable[PathLike]) -> 'LabelMatrix':
+        """One annotator per labels file; an item labeled twice in a file keeps its last label
+
+        Files are read a label at a time, as ``{"labels": [...]}`` or JSONL.
+        """
+        rows: Dict[str, int] = {}
+        entries = {field: ([], [], []) for field in LABEL_FIELDS}
+        annotators = []
+        for annotator, path in enumerate(label_files):
+            annotators.append(str(path))
+            for raw in iter_raw_labels(path):
+                label = msgspec.json.decode(raw)
+                if not isinstance(label, dict):
+                    continue
+                item_id = label.get('item_id')
+                if not isinstance(item_id, str) or not item_id:
+                    continue
+                row = rows.setdefault(item_id, len(rows))
+                for field, vocab in LABEL_FIELDS.items():
+                    value = label.get(field)
+                    if isinstance(value, str):
+                        item_rows, columns, values = entries[field]
+                        item_rows.append(row)
+                        columns.append(annotator)
+                        values.append(vocab.encode(value))
+        return cls.from_entries(list(rows), annotators, entries)
+
+    @classmethod
+    def from_entries(cls, item_ids: List[str], annotators: List[str],
+                     entries: Dict[str, Tuple[List[int], List[int], List[int]]]) -> 'LabelMatrix':
+        """Build from ``{field: (rows, annotators, codes)}`` triples"""
+        codes = {}
+        for field, (rows, columns, values) in entries.items():
+            matrix = np.full((len(item_ids), len(annotators)), ABSENT, dtype=np.int32)
+            matrix[np.asarray(rows, dtype=np.int64), np.asarray(columns, dtype=np.int64)] = values
+            codes[field] = matrix
+        return cls(item_ids, annotators, codes)
+
+    def annotator_counts(self) -> np.ndarray:
+        """Number of annotators who labeled each item (any field)"""
+        labeled = np.zeros((len(self.item_ids), len(self.annotators)), dtype=bool)
+        for codes in self.codes.values():
+            labeled |= codes != ABSENT
+        return labeled.sum(axis=1)
+
+    def categories(self, field: str) -> int:
+        """Number of distinct codes a field can hold"""
+        return len(LABEL_FIELDS[field])
+
+    def category_counts(self, field: str) -> np.ndarray:
+        """(items x categories) number of annotators giving each label"""
+        codes = self.codes[field]
+        k = self.categories(field)
+        rows, columns = np.nonzero(codes != ABSENT)
+        flat = rows * k + codes[rows, columns]
+        return np.bincount(flat, minlength=len(codes) * k).reshape(len(codes), k)
+
+
+def pairwise_confusion(codes: np.ndarray, categories: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Confusion matrices of every annotator pair over the items both labeled
+
+    Returns the pairs as an (P x 2) array and their (P x K x K) confusions.
+    """
+    annotators = codes.shape[1]
+    pairs = np.array([(a, b) for a in range(annotators) for b in range(a + 1, annotators)],
+                     dtype=np.int64).reshape(-1, 2)
+    k = categories
+    confusion = np.zeros(len(pairs) * k * k, dtype=np.int64)
+    offsets = np.arange(len(pairs), dtype=np.int64) * k * k
+    for start in range(0, len(codes), _PAIR_ROWS):
+        block = codes[start:start + _PAIR_ROWS].astype(np.int64)
+        first, second = block[:, pairs[:, 0]], block[:, pairs[:, 1]]
+        both = (first != ABSENT) & (second != ABSENT)
+        flat = (offsets + first * k + second)[both]
+        confusion += np.bincount(flat, minlength=len(confusion))
+    return pairs, confusion.reshape(len(pairs), k, k)
+
+
+def cohen_kappa(confusion: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Items compared, exact agreement and Cohen's kappa for each (K x K) confusion
+
+    Kappa is NaN where chance agreement is total (e.g. both annotators
+    always gave the same single label), as it is undefined there.
+    """
+    n = confusion.sum(axis=(-2, -1)).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        observed = np.trace(confusion, axis1=-2, axis2=-1) / n
+        expected = (confusion.sum(axis=-1) * confusion.sum(axis=-2)).sum(axis=-1) / (n * n)
+        kappa = (observed - expected) / (1 - expected)
+    kappa[np.isclose(expected, 1)] = np.nan
+    return n.astype(np.int64), observed, kappa
+
+
+def _item_features(counts: np.ndarray) -> np.ndarray:
+    """Per-item terms whose (weighted) sums give Fleiss' kappa and Krippendorff's alpha
+
+    Columns: item has 2+ labels, its pairwise agreement P_i, the agreeing
+    share of its coincidences (the trace of its coincidence matrix), and
+    its label counts (which are also the coincidence matrix' row totals).
+    Items with fewer than two labels contribute nothing.
+    """
+    counts = counts.astype(np.float64)
+    raters = counts.sum(axis=1)
+    usable = raters >= 2
+    matching = (counts ** 2).sum(axis=1) - raters
+    agreement = np.where(usable, matching / np.where(usable, raters * (raters - 1), 1), 0)
+    coinciding = np.where(usable, matching / np.where(usable, raters - 1, 1), 0)
+    return np.hstack([usable[:, None], agreement[:, None], coinciding[:, None], counts * usable[:, None]])
+
+
+def _fleiss_from_sums(sums: np.ndarray) -> np.ndarray:
+    """Fleiss' kappa per row of summed item features"""
+    items, agreement, counts = sums[:, 0], sums[:, 1], sums[:, 3:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        observed = agreement / items
+        shares = counts / counts.sum(axis=1, keepdims=True)
+        expected = (shares ** 2).sum(axis=1)
+        return (observed - expected) / (1 - expected)
+
+
+def _alpha_from_sums(sums: np.ndarray) -> np.ndarray:
+    """Krippendorff's alpha (nominal) per row of summed item features"""
+    coinciding, totals = sums[:, 2], sums[:, 3:]
+    n = totals.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected = (n * n - (totals ** 2).sum(axis=1)) / (n - 1)
+        return 1 - (n - coinciding) / expected
+
+
+def _bootstrap_sums(features: np.ndarray, resamples: int, rng: np.random.Generator) -> np.ndarray:
+    """Feature sums over ``resamples`` bootstrap resamples of the items
+
+    Each resample is a row of item multiplicities, so a batch of them is
+    summed with one matrix product instead of one pass per resample.
+    """
+    n = len(features)
+    sums = []
+    for start in range(0, resamples, _BOOTSTRAP_BATCH):
+        batch = min(_BOOTSTRAP_BATCH, resamples - start)
+        draws = rng.integers(0, n, size=(batch, n), dtype=np.int32)
+        draws += (np.arange(batch, dtype=np.int32) * n)[:, None]
+        weights = np.bincount(draws.ravel(), minlength=batch * n).reshape(batch, n)
+        sums.append(weights.astype(np.float64) @ features)
+    return np.vstack(sums) if sums else np.empty((0, features.shape[1]))
+
+
+def _interval(samples: np.ndarray, confidence: float) -> Optional[Tuple[float, float]]:
+    samples = samples[np.isfinite(samples)]
+    if not len(samples):
+        return None
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.percentile(samples, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def _finite(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def agreement_scores(matrix: LabelMatrix, fields: Iterable[str] = tuple(LABEL_FIELDS), bootstrap: int = 1000,
+                     confidence: float = 0.95, rng: Optional[np.random.Generator] = None) -> Dict[str, Dict]:
+    """Pairwise Cohen's kappa, Fleiss' kappa and Krippendorff's alpha per label field
+
+    Fleiss' kappa allows a varying number of annotators per item; both it
+    and alpha use every item with at least two labels. Confidence intervals
+    are bootstrap percentiles over resampled items (``bootstrap=0`` skips
+    them); every field is scored on the same resamples.
+    """
+    fields = list(fields)
+    features = [_item_features(matrix.category_counts(field)) for field in fields]
+    widths = np.cumsum([0] + [f.shape[1] for f in features])
+
+    resampled = None
+    if bootstrap and len(matrix.item_ids):
+        rng = rng if rng is not None else np.random.default_rng()
+        resampled = _bootstrap_sums(np.hstack(features), bootstrap, rng)
+
+    scores = {}
+    for n, field in enumerate(fields):
+        codes = matrix.codes[field]
+        pairs, confusion = pairwise_confusion(codes, matrix.categories(field))
+        compared, exact, kappa = cohen_kappa(confusion)
+        overlapping = compared > 0
+
+        totals = features[n].sum(axis=0, keepdims=True)
+        fleiss_ci = alpha_ci = None
+        if resampled is not None:
+            sums = resampled[:, widths[n]:widths[n + 1]]
+            fleiss_ci = _interval(_fleiss_from_sums(sums), confidence)
+            alpha_ci = _interval(_alpha_from_sums(sums), confidence)
+
+        scores[field] = {
+            'items': int((codes != ABSENT).any(axis=1).sum()),
+            'items_multiply_labeled': int(totals[0, 0]),
+            'pairwise': [
+                {
+                    'annotator1': int(a) + 1,
+                    'annotator2': int(b) + 1,
+                    'items': int(count),
+                    'exact_agreement': _finite(agreement),
+                    'kappa': _finite(pair_kappa),
+                }
+                for (a, b), count, agreement, pair_kappa in zip(pairs, compared, exact, kappa)
+            ],
+            'average_exact_agreement': _finite(exact[overlapping].mean()) if overlapping.any() else None,
+            'average_kappa': (_finite(np.nanmean(kappa[overlapping]))
+                              if np.isfinite(kappa[overlapping]).any() else None),
+            'fleiss_kappa': _finite(_fleiss_from_sums(totals)[0]),
+            'fleiss_kappa_ci': fleiss_ci,
+            'krippendorff_alpha': _finite(_alpha_from_sums(totals)[0]),
+            'krippendorff_alpha_ci': alpha_ci,
+            'confidence': confidence,
+        }
+    return scores
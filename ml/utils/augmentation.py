@@ -0,0 +1,358 @@
+"""
+Text Augmentation
+Paraphrase strategies and a cached, parallel engine for augmenting training text columns
+"""
+
+import hashlib
+import json
+import random
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, product
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .template_sampler import slot_names
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / '.cache' / 'augmented'
+
+# Unique texts handed to one worker task
+CHUNK_SIZE = 20000
+
+DEFAULT_PARAPHRASE_MODEL = 'humarin/chatgpt_paraphraser_on_T5_base'
+
+# Meaning-preserving swaps for the vocabulary of coaching dialogues
+SYNONYMS = {
+    'really': ['truly', 'very'],
+    'very': ['really', 'so'],
+    'anxious': ['nervous', 'uneasy', 'on edge'],
+    'worried': ['concerned', 'anxious'],
+    'worry': ['fret', 'stress'],
+    'scared': ['afraid', 'frightened'],
+    'afraid': ['scared', 'frightened'],
+    'sad': ['down', 'low', 'unhappy'],
+    'overwhelmed': ['swamped', 'overloaded', 'snowed under'],
+    'overwhelming': ['too much', 'crushing'],
+    'tired': ['exhausted', 'worn out', 'drained'],
+    'exhausted': ['drained', 'worn out'],
+    'hard': ['difficult', 'tough'],
+    'difficult': ['hard', 'tough'],
+    'struggling': ['having a hard time', 'finding it hard'],
+    'lately': ['recently', 'these days'],
+    'recently': ['lately', 'these days'],
+    'always': ['constantly', 'all the time'],
+    'keep': ['continue to', 'can\'t stop'],
+    'feel like': ['feel as if', 'sense that'],
+    'I think': ['I believe', 'I guess'],
+    'maybe': ['perhaps', 'possibly'],
+    'help': ['support', 'assist'],
+    'understand': ['get', 'see'],
+    'share': ['tell me', 'say'],
+    'explore': ['look at', 'unpack'],
+    'notice': ['observe', 'see'],
+    'I\'m': ['I am'],
+    'I am': ['I\'m'],
+    'can\'t': ['cannot', 'can not'],
+    'cannot': ['can\'t'],
+    'don\'t': ['do not'],
+    'do not': ['don\'t'],
+    'it\'s': ['it is'],
+    'that\'s': ['that is'],
+    'I\'ve': ['I have'],
+}
+
+
+def text_rng(text: str, seed: int, salt: str) -> random.Random:
+    """Random stream for one (text, seed, strategy), independent of batching and process"""
+    return random.Random(f"{seed}:{salt}:{text}")
+
+
+class AugmentationStrategy:
+    """Produces up to ``n`` paraphrases per text
+
+    ``augment`` must be a pure function of (text, seed, n) so results can be
+    cached and split across processes freely. Strategies that hold a large
+    model set ``parallel = False`` and batch internally instead.
+    """
+
+    name = 'base'
+    version = 1
+    parallel = True
+
+    def params(self) -> Dict:
+        """Settings that change the output (part of the cache key)"""
+        return {}
+
+    def fingerprint(self) -> str:
+        payload = json.dumps({'name': self.name, 'version': self.version, 'params': self.params()},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def augment(self, texts: List[str], seed: int, n: int) -> List[List[str]]:
+        raise NotImplementedError
+
+
+class LexicalSubstitution(AugmentationStrategy):
+    """Swap words and contractions for synonyms, each match with probability ``rate``"""
+
+    name = 'lexical'
+
+    def __init__(self, synonyms: Optional[Dict[str, List[str]]] = None, rate: float = 0.5):
+        self.synonyms = {key.lower(): values for key, values in (synonyms or SYNONYMS).items()}
+        self.rate = rate
+        # Longest keys first so phrases win over the words inside them
+        keys = sorted(self.synonyms, key=len, reverse=True)
+        self.pattern = re.compile(r"\b(" + "|".join(re.escape(key) for key in keys) + r")\b", re.IGNORECASE)
+
+    def params(self) -> Dict:
+        return {'synonyms': self.synonyms, 'rate': self.rate}
+
+    def _replace(self, text: str, matches: List, rng: random.Random) -> str:
+        forced = rng.randrange(len(matches))
+        pieces = []
+        last = 0
+        for i, match in enumerate(matches):
+            if i != forced and rng.random() >= self.rate:
+                continue
+            original = match.group(0)
+            replacement = rng.choice(self.synonyms[original.lower()])
+            if original[0].isupper():
+                replacement = replacement[0].upper() + replacement[1:]
+            pieces.append(text[last:match.start()])
+            pieces.append(replacement)
+            last = match.end()
+        pieces.append(text[last:])
+        return ''.join(pieces)
+
+    def augment(self, texts: List[str], seed: int, n: int) -> List[List[str]]:
+        results = []
+        for text in texts:
+            matches = list(self.pattern.finditer(text))
+            variants = []
+            if matches:
+                rng = text_rng(text, seed, self.name)
+                for _ in range(3 * n):
+                    variant = self._replace(text, matches, rng)
+                    if variant != text and variant not in variants:
+                        variants.append(variant)
+                        if len(variants) == n:
+                            break
+            results.append(variants)
+        return results
+
+
+class TemplateReslot(AugmentationStrategy):
+    """Re-render template-generated texts with other templates and fillers of the same group
+
+    Every text the tables can produce is indexed once, so recognising a
+    templated message is a dict lookup. A variant keeps the group (the
+    concern or intent it was labelled with) and, half the time, each slot
+    value it shares with the original.
+    """
+
+    name = 'reslot'
+
+    def __init__(self, tables: Sequence[Dict[str, List[str]]], fillers: Dict[str, List[str]]):
+        self.tables = [dict(table) for table in tables]
+        self.fillers = fillers
+        self.slots = {}
+        self.lookup = {}
+        for t, table in enumerate(self.tables):
+            for group, templates in table.items():
+                for template in templates:
+                    names = self.slots.setdefault(template, slot_names(template))
+                    for values in product(*(fillers[name] for name in names)):
+                        filled = dict(zip(names, values))
+                        self.lookup.setdefault(template.format(**filled), (t, group, filled))
+
+    def params(self) -> Dict:
+        return {'tables': self.tables, 'fillers': self.fillers}
+
+    def augment(self, texts: List[str], seed: int, n: int) -> List[List[str]]:
+        results = []
+        for text in texts:
+            match = self.lookup.get(text.strip())
+            variants = []
+            if match is not None:
+                t, group, values = match
+                templates = self.tables[t][group]
+                rng = text_rng(text, seed, self.name)
+                for _ in range(4 * n):
+                    template = rng.choice(templates)
+                    filled = {
+                        name: values[name] if name in values and rng.random() < 0.5 else rng.choice(self.fillers[name])
+                        for name in self.slots[template]
+                    }
+                    variant = template.format(**filled)
+                    if variant != text and variant not in variants:
+                        variants.append(variant)
+                        if len(variants) == n:
+                            break
+            results.append(variants)
+        return results
+
+
+class Seq2SeqParaphraser(AugmentationStrategy):
+    """Paraphrase with a local seq2seq model on CPU, ``batch_size`` texts per forward pass
+
+    Uses diverse beam search, which is deterministic, so a text always gets
+    the same paraphrases no matter which batch it lands in.
+    """
+
+    name = 'seq2seq'
+    parallel = False
+
+    def __init__(self, model_name: str = DEFAULT_PARAPHRASE_MODEL, batch_size: int = 32,
+                 max_length: int = 64, prefix: str = 'paraphrase: ', diversity_penalty: float = 3.0):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.prefix = prefix
+        self.diversity_penalty = diversity_penalty
+        self._model = None
+
+    def params(self) -> Dict:
+        return {'model': self.model_name, 'max_length': self.max_length, 'prefix': self.prefix,
+                'diversity_penalty': self.diversity_penalty}
+
+    def _load(self):
+        if self._model is None:
+            from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
+            model.eval()
+            self._model = (tokenizer, model)
+        return self._model
+
+    def augment(self, texts: List[str], seed: int, n: int) -> List[List[str]]:
+        import torch
+
+        tokenizer, model = self._load()
+        beam_options = {'num_beams': 2 * n, 'num_return_sequences': n}
+        if n > 1:
+            beam_options.update(num_beam_groups=n, diversity_penalty=self.diversity_penalty)
+
+        results = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            inputs = tokenizer([self.prefix + text for text in batch], return_tensors='pt',
+                               padding=True, truncation=True, max_length=self.max_length)
+            with torch.inference_mode():
+                generated = model.generate(**inputs, max_length=self.max_length, **beam_options)
+            decoded = tokenizer.batch_decode(generated, skip_special_tokens=True)
+            for i, text in enumerate(batch):
+                variants = []
+                for variant in decoded[i * n:(i + 1) * n]:
+                    variant = variant.strip()
+                    if variant and variant != text and variant not in variants:
+                        variants.append(variant)
+                results.append(variants)
+        return results
+
+
+def _augment_chunk(task) -> List[List[str]]:
+    strategy, texts, seed, n = task
+    return strategy.augment(texts, seed, n)
+
+
+def _run_strategy(strategy: AugmentationStrategy, texts: List[str], seed: int, n: int,
+                  workers: int, chunk_size: int) -> List[List[str]]:
+    """Augment texts, in chunks across a process pool when the strategy allows it"""
+    if workers <= 1 or not strategy.parallel or len(texts) <= chunk_size:
+        return strategy.augment(texts, seed, n)
+
+    tasks = [(strategy, texts[start:start + chunk_size], seed, n) for start in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(chain.from_iterable(executor.map(_augment_chunk, tasks)))
+
+
+def augment_texts(texts: List[str], strategy: AugmentationStrategy, seed: int = 0, n: int = 3,
+                  workers: int = 1, cache_dir: Optional[Path] = None, use_cache: bool = True,
+                  chunk_size: int = CHUNK_SIZE) -> List[List[str]]:
+    """Paraphrases of each (distinct) text, reusing any cached for this strategy, seed and n
+
+    Results are kept per text hash in a Parquet store for each
+    (strategy settings, seed, n), so reruns and corpus growth only augment
+    texts that haven't been seen before.
+    """
+    if not texts:
+        return []
+    if not use_cache:
+        return _run_strategy(strategy, texts, seed, n, workers, chunk_size)
+
+    store_key = hashlib.sha256(f"{strategy.fingerprint()}:{seed}:{n}".encode('utf-8')).hexdigest()
+    store_path = Path(cache_dir or DEFAULT_CACHE_DIR) / f'{strategy.name}_{store_key[:16]}.parquet'
+    store = pq.read_table(store_path) if store_path.exists() else None
+    positions = {h: i for i, h in enumerate(store['text_hash'].to_pylist())} if store is not None else {}
+
+    hashes = [hashlib.sha256(text.encode('utf-8')).hexdigest() for text in texts]
+    missing = {}
+    for text_hash, text in zip(hashes, texts):
+        if text_hash not in positions and text_hash not in missing:
+            missing[text_hash] = text
+
+    print(f"   Augmentation store ({strategy.name}): {len(texts) - len(missing)} texts reused, "
+          f"{len(missing)} to augment")
+
+    if missing:
+        variants = _run_strategy(strategy, list(missing.values()), seed, n, workers, chunk_size)
+        fresh = pa.table({'text_hash': list(missing), 'variants': pa.array(variants, type=pa.list_(pa.string()))})
+        offset = store.num_rows if store is not None else 0
+        store = fresh if store is None else pa.concat_tables([store, fresh])
+        positions.update({text_hash: offset + i for i, text_hash in enumerate(missing)})
+
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = store_path.with_suffix('.tmp')
+        pq.write_table(store, tmp_path)
+        tmp_path.replace(store_path)
+
+    return store['variants'].take(pa.array([positions[h] for h in hashes])).to_pylist()
+
+
+def augment_frame(df, num_augmentations: int = 3, strategies: Optional[Sequence[AugmentationStrategy]] = None,
+                  text_column: Optional[str] = None, seed: int = 0, workers: int = 1,
+                  cache_dir: Optional[Path] = None, use_cache: bool = True):
+    """Append paraphrased copies of each row, for a DataFrame or message-table Arrow table
+
+    Each strategy adds up to ``num_augmentations`` rows per original row, with
+    every other column copied and an ``augmentation`` column naming the
+    strategy (``original`` for the input rows). Texts are deduplicated first,
+    so repeated (e.g. templated) messages are augmented once.
+    """
+    arrow_input = isinstance(df, pa.Table)
+    frame = df.to_pandas() if arrow_input else df
+    strategies = list(strategies) if strategies is not None else [LexicalSubstitution()]
+    column = text_column or ('text' if 'text' in frame.columns else 'user')
+
+    codes, unique = pd.factorize(frame[column])
+    unique = [str(text) for text in unique]
+    valid = codes >= 0
+    row_ids = np.arange(len(frame))
+
+    parts = [frame.assign(augmentation='original')]
+    if not unique:
+        # No text to paraphrase (e.g. an all-null column): nothing is added
+        strategies = []
+    for strategy in strategies:
+        variants = augment_texts(unique, strategy, seed, num_augmentations, workers, cache_dir, use_cache)
+        counts = np.fromiter(map(len, variants), dtype=np.int64, count=len(variants))
+        flat = np.fromiter(chain.from_iterable(variants), dtype=object, count=int(counts.sum()))
+        offsets = np.cumsum(counts) - counts
+
+        # Row i is repeated once per variant of its text; gather those variants in order
+        row_counts = np.where(valid, counts[codes], 0)
+        rows = np.repeat(row_ids, row_counts)
+        within = np.arange(len(rows)) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+        augmented = frame.iloc[rows].copy()
+        augmented[column] = flat[np.repeat(np.where(valid, offsets[codes], 0), row_counts) + within]
+        augmented['augmentation'] = strategy.name
+        parts.append(augmented)
+
+    result = pd.concat(parts, ignore_index=True)
+    return pa.Table.from_pandas(result, preserve_index=False) if arrow_input else result
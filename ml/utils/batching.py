@@ -0,0 +1,62 @@
+"""
+Batching Utilities
+Dynamic padding helpers and padded-vs-effective token throughput reporting
+"""
+
+from typing import Dict, List
+
+# Column read by Trainer's length-grouped sampler when group_by_length=True
+LENGTH_COLUMN = 'length'
+
+
+def padding_policy(dynamic_padding: bool):
+    """Tokenizer padding argument for the selected batching mode"""
+    return False if dynamic_padding else 'max_length'
+
+
+def add_lengths(encoded: Dict) -> Dict:
+    """Record unpadded sequence lengths so batches can be bucketed by length"""
+    encoded[LENGTH_COLUMN] = [len(ids) for ids in encoded['input_ids']]
+    return encoded
+
+
+class TokenCountingCollator:
+    """Wrap a data collator and count real vs padded tokens per batch
+
+    ``collate`` builds a batch without counting it, for batches (such as
+    evaluation ones) that shouldn't show up in training throughput.
+    """
+
+    def __init__(self, collator):
+        self.collator = collator
+        self.reset()
+
+    def reset(self):
+        self.effective_tokens = 0
+        self.padded_tokens = 0
+        self.batches = 0
+
+    def collate(self, features: List[Dict]):
+        features = [{k: v for k, v in f.items() if k != LENGTH_COLUMN} for f in features]
+        return self.collator(features)
+
+    def __call__(self, features: List[Dict]):
+        batch = self.collate(features)
+        attention_mask = batch['attention_mask']
+        self.effective_tokens += int(attention_mask.sum())
+        self.padded_tokens += attention_mask.numel()
+        self.batches += 1
+        return batch
+
+
+def print_token_throughput(collator: TokenCountingCollator, runtime_seconds: float, label: str = 'Training'):
+    """Report effective (non-pad) vs padded tokens/sec for a run"""
+    if not collator.padded_tokens or not runtime_seconds:
+        return
+
+    efficiency = collator.effective_tokens / collator.padded_tokens
+    print(f"\n📏 {label} token throughput ({collator.batches} batches, {runtime_seconds:.1f}s):")
+    print(f"   Effective tokens/sec: {collator.effective_tokens / runtime_seconds:,.0f}")
+    print(f"   Padded tokens/sec:    {collator.padded_tokens / runtime_seconds:,.0f}")
+    print(f"   Padding efficiency:   {efficiency:.1%} "
+          f"({collator.padded_tokens - collator.effective_tokens:,} pad tokens)")
@@ -0,0 +1,108 @@
+"""
+Bloom Filter
+Fixed-memory membership test over fingerprints of generated dialogues
+"""
+
+import hashlib
+import math
+import re
+from typing import Dict, Sequence
+
+import numpy as np
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def dialogue_fingerprint(dialogue: Dict) -> bytes:
+    """128-bit fingerprint of what makes a dialogue a repeat
+
+    Covers session type, concern and each message's role, intent and text
+    (case- and whitespace-normalized). IDs, timestamps and profile details
+    are left out, so two generated copies of the same conversation match.
+    """
+    parts = [dialogue.get('session_type') or '', (dialogue.get('user_profile') or {}).get('concern') or '']
+    for message in dialogue.get('messages', []):
+        text = WHITESPACE.sub(' ', (message.get('text') or '').strip().lower())
+        parts.append(f"{message.get('role')}|{message.get('intent') or ''}|{text}")
+    return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=16).digest()
+
+
+def fingerprint_array(fingerprints: Sequence[bytes]) -> np.ndarray:
+    """(n, 2) uint64 array from 16-byte fingerprints"""
+    return np.frombuffer(b''.join(fingerprints), dtype=np.uint64).reshape(-1, 2)
+
+
+class BloomFilter:
+    """Bloom filter over 128-bit fingerprints
+
+    Sized for ``capacity`` items at ``error_rate`` false positives, which takes
+    ``-ln(error_rate) / ln(2)**2`` bits per item (about 14.4 at 0.1%) however
+    large the items are. The two halves of a fingerprint give every bit
+    position by double hashing, so no further hashing is needed.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.bits.nbytes
+
+    def false_positive_rate(self) -> float:
+        """Expected false positive rate at the current fill"""
+        return (1.0 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def _positions(self, fingerprints: np.ndarray) -> np.ndarray:
+        h1 = fingerprints[:, :1]
+        h2 = fingerprints[:, 1:] | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)[None, :]
+        with np.errstate(over='ignore'):
+            return (h1 + steps * h2) % np.uint64(self.num_bits)
+
+    def _test(self, positions: np.ndarray) -> np.ndarray:
+        bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        return bool(self.contains(fingerprint_array([fingerprint]))[0])
+
+    def contains(self, fingerprints: np.ndarray) -> np.ndarray:
+        """Whether each fingerprint is (probably) in the filter"""
+        return self._test(self._positions(fingerprints))
+
+    def _set(self, positions: np.ndarray):
+        positions = positions.ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def add(self, fingerprints: np.ndarray):
+        """Insert fingerprints"""
+        self._set(self._positions(fingerprints))
+        self.count += len(fingerprints)
+
+    def add_new(self, fingerprints: np.ndarray) -> np.ndarray:
+        """Insert fingerprints not seen before, in order; returns the mask of those that were new
+
+        A fingerprint counts as seen if it is in the filter or appears earlier
+        in the same batch, so a batch behaves like inserting one at a time.
+        """
+        new = np.zeros(len(fingerprints), dtype=bool)
+        if not len(fingerprints):
+            return new
+        keys = np.ascontiguousarray(fingerprints).view([('hi', np.uint64), ('lo', np.uint64)]).ravel()
+        _, first = np.unique(keys, return_index=True)
+        positions = self._positions(fingerprints[first])
+        fresh = ~self._test(positions)
+        new[first[fresh]] = True
+        self._set(positions[fresh])
+        self.count += int(fresh.sum())
+        return new
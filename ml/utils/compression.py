@@ -0,0 +1,168 @@
+"""
+Compressed File I/O
+Transparent gzip/zstd handling for corpus, label and review files
+"""
+
+import gzip
+import io
+import json
+import queue
+import threading
+from pathlib import Path
+from typing import BinaryIO, Optional, TextIO, Union
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+PathLike = Union[str, Path]
+
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+MAGIC_BYTES = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd'}
+
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+
+# Decompressed chunks buffered ahead of the reader
+PREFETCH_CHUNK = 1 << 20
+PREFETCH_DEPTH = 8
+
+
+def compression_for_suffix(file_path: PathLike) -> Optional[str]:
+    """Compression implied by a path's extension ('gzip', 'zstd' or None)"""
+    return COMPRESSION_SUFFIXES.get(Path(file_path).suffix.lower())
+
+
+def detect_compression(file_path: PathLike) -> Optional[str]:
+    """Compression of an existing file, sniffed from its magic bytes"""
+    with open(file_path, 'rb') as f:
+        head = f.read(4)
+    for magic, compression in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def strip_compression_suffix(file_path: PathLike) -> Path:
+    """``corpus.jsonl.zst`` -> ``corpus.jsonl``"""
+    path = Path(file_path)
+    return path.with_suffix('') if compression_for_suffix(path) else path
+
+
+def _require_zstd():
+    if not ZSTD_AVAILABLE:
+        raise ImportError("zstandard is required for .zst files (pip install zstandard)")
+
+
+class _PrefetchReader(io.RawIOBase):
+    """Decompress on a background thread so it overlaps with JSON decoding
+
+    zlib and zstd release the GIL while decompressing, so the consumer
+    parses one chunk while the next is being inflated.
+    """
+
+    def __init__(self, source: BinaryIO):
+        self._source = source
+        self._queue = queue.Queue(maxsize=PREFETCH_DEPTH)
+        self._buffer = memoryview(b'')
+        self._stopped = threading.Event()
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        try:
+            while not self._stopped.is_set():
+                chunk = self._source.read(PREFETCH_CHUNK)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:  # surfaced to the reader
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and not self._eof:
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+            self._buffer = memoryview(item)
+        n = min(len(buffer), len(self._buffer))
+        buffer[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
+
+
+def open_binary(file_path: PathLike) -> BinaryIO:
+    """Open a file for reading, decompressing gzip/zstd content transparently"""
+    compression = detect_compression(file_path)
+    if compression is None:
+        return open(file_path, 'rb')
+
+    if compression == 'gzip':
+        source = gzip.open(file_path, 'rb')
+    else:
+        _require_zstd()
+        source = zstandard.ZstdDecompressor().stream_reader(
+            open(file_path, 'rb'), read_across_frames=True, closefd=True)
+    return io.BufferedReader(_PrefetchReader(source), buffer_size=PREFETCH_CHUNK)
+
+
+def open_text(file_path: PathLike, mode: str = 'r') -> TextIO:
+    """Open a UTF-8 text file; compression is sniffed on read and taken from
+    the extension (.gz/.zst) on write"""
+    if mode == 'r':
+        return io.TextIOWrapper(open_binary(file_path), encoding='utf-8', newline='')
+    if mode != 'w':
+        raise ValueError(f"Unsupported mode: {mode}")
+
+    compression = compression_for_suffix(file_path)
+    if compression == 'gzip':
+        return gzip.open(file_path, 'wt', encoding='utf-8', compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        _require_zstd()
+        raw = open(file_path, 'wb')
+        # threads=-1 compresses on one worker per core
+        writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8')
+    return open(file_path, 'w', encoding='utf-8')
+
+
+def load_json(file_path: PathLike):
+    """Load a (possibly compressed) JSON document"""
+    with open_text(file_path) as f:
+        return json.load(f)
+
+
+def dump_json(data, file_path: PathLike, indent: Optional[int] = 2):
+    """Write a JSON document; compressed outputs skip pretty-printing"""
+    path = Path(file_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    compact = compression_for_suffix(path) is not None
+    with open_text(path, 'w') as f:
+        if compact:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        else:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
@@ -0,0 +1,298 @@
+"""
+Corpus Statistics
+Vectorized, mergeable label/length distributions cached next to each corpus
+"""
+
+import json
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+
+from .dialogue_model import (
+    ABSENT, MISSING, Dialogue, Label, Vocabulary,
+    INTENTS, SENTIMENTS, RISK_LEVELS, SESSION_TYPE_VOCAB, ROLE_VOCAB, CONCERNS, TECHNIQUES,
+)
+from .dialogue_store import PathLike, corpus_hash, iter_dialogues
+
+# Bump when the stored layout changes so stale caches are recomputed
+STATS_VERSION = 1
+
+DIALOGUE_FIELDS = {
+    'session_type': SESSION_TYPE_VOCAB,
+    'concern': CONCERNS,
+    'primary_intent': INTENTS,
+    'max_risk_level': RISK_LEVELS,
+    'therapeutic_technique': TECHNIQUES,
+}
+
+MESSAGE_FIELDS = {
+    'role': ROLE_VOCAB,
+    'intent': INTENTS,
+    'sentiment': SENTIMENTS,
+    'risk_level': RISK_LEVELS,
+}
+
+VOCABULARIES = {**DIALOGUE_FIELDS, **MESSAGE_FIELDS}
+
+REPORT_KEYS = {
+    'session_type': 'session_types',
+    'concern': 'concerns',
+    'primary_intent': 'primary_intent_distribution',
+    'max_risk_level': 'max_risk_level_distribution',
+    'therapeutic_technique': 'therapeutic_techniques',
+    'role': 'role_distribution',
+    'intent': 'intent_distribution',
+    'sentiment': 'sentiment_distribution',
+    'risk_level': 'risk_level_distribution',
+}
+
+# Lower edges of the message text length (characters) histogram buckets
+TEXT_LENGTH_BINS = [0, 25, 50, 100, 200, 400, 800]
+
+Record = Union[Dict, Dialogue]
+
+
+def _bincount(codes: array, vocab: Vocabulary) -> np.ndarray:
+    """Count codes, with slot 0 holding ABSENT and slot ``code + 1`` each label"""
+    values = np.frombuffer(codes, dtype=np.int64) + 1 if len(codes) else np.zeros(0, dtype=np.int64)
+    return np.bincount(values, minlength=len(vocab) + 1)
+
+
+def _combine(a: np.ndarray, b: np.ndarray, sign: int) -> np.ndarray:
+    """Add (or subtract) count arrays of possibly different lengths"""
+    result = np.zeros(max(len(a), len(b)), dtype=np.int64)
+    result[:len(a)] += a
+    result[:len(b)] += sign * b
+    return result
+
+
+def _bucket_label(i: int) -> str:
+    if i + 1 < len(TEXT_LENGTH_BINS):
+        return f"{TEXT_LENGTH_BINS[i]}-{TEXT_LENGTH_BINS[i + 1] - 1}"
+    return f"{TEXT_LENGTH_BINS[i]}+"
+
+
+class CorpusStats:
+    """Distribution counts for a corpus (or a shard of one)
+
+    Label counts are NumPy arrays indexed by vocabulary code, so stats of two
+    shards merge by array addition and a corpus never has to be rescanned to
+    update them.
+    """
+
+    def __init__(self, kind: str = 'dialogues', total: int = 0, total_messages: int = 0,
+                 counts: Optional[Dict[str, np.ndarray]] = None,
+                 turn_counts: Optional[np.ndarray] = None,
+                 text_lengths: Optional[np.ndarray] = None, text_chars: int = 0):
+        self.kind = kind
+        self.total = total
+        self.total_messages = total_messages
+        self.counts = counts or {}
+        self.turn_counts = turn_counts if turn_counts is not None else np.zeros(0, dtype=np.int64)
+        self.text_lengths = text_lengths if text_lengths is not None else np.zeros(len(TEXT_LENGTH_BINS), dtype=np.int64)
+        self.text_chars = text_chars
+
+    @classmethod
+    def from_dialogues(cls, dialogues: Iterable[Record]) -> 'CorpusStats':
+        """Compute stats in one pass over dialogues (dicts or compact records)"""
+        codes = {name: array('q') for name in VOCABULARIES}
+        turns = array('q')
+        lengths = array('q')
+
+        for dialogue in dialogues:
+            if not isinstance(dialogue, Dialogue):
+                dialogue = Dialogue.from_dict(dialogue)
+            labels = dialogue.labels
+            codes['session_type'].append(dialogue.session_type_code)
+            codes['concern'].append(dialogue.concern_code)
+            codes['primary_intent'].append(labels.intent_code if labels is not None else ABSENT)
+            codes['max_risk_level'].append(labels.risk_code if labels is not None else ABSENT)
+            codes['therapeutic_technique'].append(labels.technique_code if labels is not None else ABSENT)
+
+            messages = dialogue.messages or ()
+            turns.append(len(messages))
+            for msg in messages:
+                codes['role'].append(msg.role_code)
+                codes['intent'].append(msg.intent_code)
+                codes['sentiment'].append(msg.sentiment_code)
+                codes['risk_level'].append(msg.risk_code)
+                if msg.text is not MISSING:
+                    lengths.append(len(msg.text))
+
+        lengths = np.frombuffer(lengths, dtype=np.int64) if len(lengths) else np.zeros(0, dtype=np.int64)
+        buckets = np.searchsorted(TEXT_LENGTH_BINS, lengths, side='right') - 1
+        return cls(
+            kind='dialogues',
+            total=len(turns),
+            total_messages=len(codes['role']),
+            counts={name: _bincount(codes[name], vocab) for name, vocab in VOCABULARIES.items()},
+            turn_counts=np.bincount(np.frombuffer(turns, dtype=np.int64)) if len(turns) else None,
+            text_lengths=np.bincount(buckets, minlength=len(TEXT_LENGTH_BINS)),
+            text_chars=int(lengths.sum()),
+        )
+
+    @classmethod
+    def from_labels(cls, labels: Iterable[Union[Dict, Label]]) -> 'CorpusStats':
+        """Compute intent/sentiment/risk distributions of annotator labels"""
+        codes = {name: array('q') for name in ('intent', 'sentiment', 'risk_level')}
+        for label in labels:
+            if not isinstance(label, Label):
+                label = Label.from_dict(label)
+            codes['intent'].append(label.intent_code)
+            codes['sentiment'].append(label.sentiment_code)
+            codes['risk_level'].append(label.risk_code)
+
+        return cls(
+            kind='labels',
+            total=len(codes['intent']),
+            counts={name: _bincount(values, MESSAGE_FIELDS[name]) for name, values in codes.items()},
+        )
+
+    def _merge(self, other: 'CorpusStats', sign: int) -> 'CorpusStats':
+        if other.kind != self.kind:
+            raise ValueError(f"Cannot merge {other.kind} stats into {self.kind} stats")
+        empty = np.zeros(0, dtype=np.int64)
+        return CorpusStats(
+            kind=self.kind,
+            total=self.total + sign * other.total,
+            total_messages=self.total_messages + sign * other.total_messages,
+            counts={name: _combine(self.counts.get(name, empty), other.counts.get(name, empty), sign)
+                    for name in {**self.counts, **other.counts}},
+            turn_counts=_combine(self.turn_counts, other.turn_counts, sign),
+            text_lengths=_combine(self.text_lengths, other.text_lengths, sign),
+            text_chars=self.text_chars + sign * other.text_chars,
+        )
+
+    def __add__(self, other: 'CorpusStats') -> 'CorpusStats':
+        """Stats of two shards combined"""
+        return self._merge(other, 1)
+
+    def __sub__(self, other: 'CorpusStats') -> 'CorpusStats':
+        """Stats with a subset of records (e.g. dropped duplicates) taken out"""
+        return self._merge(other, -1)
+
+    def distribution(self, field: str, include_missing: bool = False) -> Dict[Optional[str], int]:
+        """Per-label counts for a field, most common first"""
+        counts = self.counts.get(field)
+        if counts is None:
+            return {}
+        vocab = VOCABULARIES[field]
+        order = np.argsort(-counts, kind='stable')
+        return {
+            vocab.decode(int(slot) - 1): int(counts[slot])
+            for slot in order
+            if counts[slot] and (slot or include_missing)
+        }
+
+    def to_dict(self) -> Dict:
+        """Report format stored as ``statistics`` in corpus headers"""
+        report = {'total_dialogues' if self.kind == 'dialogues' else 'total': self.total}
+        for field in self.counts:
+            # Message labels are only set on some turns, so absence isn't interesting there
+            include_missing = not (self.kind == 'dialogues' and field in MESSAGE_FIELDS)
+            report[REPORT_KEYS[field]] = self.distribution(field, include_missing)
+
+        if self.kind == 'dialogues':
+            report['total_messages'] = self.total_messages
+            report['avg_messages_per_dialogue'] = self.total_messages / self.total if self.total else 0
+            report['avg_text_length'] = self.text_chars / self.total_messages if self.total_messages else 0
+            report['turn_length_distribution'] = {
+                str(turns): int(count) for turns, count in enumerate(self.turn_counts) if count
+            }
+            report['text_length_distribution'] = {
+                _bucket_label(i): int(count) for i, count in enumerate(self.text_lengths)
+            }
+        return report
+
+    def _state(self) -> Dict:
+        """Raw counts keyed by label rather than code, so vocab order can change"""
+        return {
+            'kind': self.kind,
+            'total': self.total,
+            'total_messages': self.total_messages,
+            'text_chars': self.text_chars,
+            'text_length_bins': TEXT_LENGTH_BINS,
+            'turn_counts': self.turn_counts.tolist(),
+            'text_lengths': self.text_lengths.tolist(),
+            'counts': {
+                field: [[VOCABULARIES[field].decode(slot - 1), int(count)]
+                        for slot, count in enumerate(counts) if count]
+                for field, counts in self.counts.items()
+            },
+        }
+
+    @classmethod
+    def _from_state(cls, data: Dict) -> 'CorpusStats':
+        counts = {}
+        for field, pairs in data['counts'].items():
+            vocab = VOCABULARIES[field]
+            slots = [vocab.encode(label) + 1 if label is not None else 0 for label, _ in pairs]
+            counts[field] = np.zeros(len(vocab) + 1, dtype=np.int64)
+            np.add.at(counts[field], slots, [count for _, count in pairs])
+
+        return cls(
+            kind=data['kind'],
+            total=data['total'],
+            total_messages=data['total_messages'],
+            counts=counts,
+            turn_counts=np.array(data['turn_counts'], dtype=np.int64),
+            text_lengths=np.array(data['text_lengths'], dtype=np.int64),
+            text_chars=data['text_chars'],
+        )
+
+    def __getstate__(self) -> Dict:
+        # Codes for labels outside the schema are assigned per process, so
+        # stats cross process boundaries (e.g. from pool workers) by label
+        return self._state()
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(self._from_state(state).__dict__)
+
+    def save(self, path: PathLike, source_hash: Optional[str] = None):
+        """Persist raw counts (labels rather than codes, so vocab order can change)"""
+        path = Path(path)
+        data = {'version': STATS_VERSION, 'source_hash': source_hash, **self._state()}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: PathLike, source_hash: Optional[str] = None) -> Optional['CorpusStats']:
+        """Load persisted stats, or None if missing, stale or incompatible"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != STATS_VERSION or data.get('text_length_bins') != TEXT_LENGTH_BINS:
+            return None
+        if source_hash is not None and data.get('source_hash') != source_hash:
+            return None
+        return cls._from_state(data)
+
+
+def stats_path(file_path: PathLike, cache_dir: Optional[PathLike] = None) -> Path:
+    """Cache location for a corpus' statistics"""
+    source = Path(file_path)
+    cache_dir = Path(cache_dir) if cache_dir else source.parent / '.cache'
+    return cache_dir / f"{source.name}.stats.json"
+
+
+def corpus_stats(file_path: PathLike, cache_dir: Optional[PathLike] = None) -> CorpusStats:
+    """Statistics for a corpus file, computed once and reused until it changes"""
+    source_hash = corpus_hash(file_path)
+    path = stats_path(file_path, cache_dir)
+    stats = CorpusStats.load(path, source_hash)
+    if stats is None:
+        stats = CorpusStats.from_dialogues(iter_dialogues(file_path))
+        stats.save(path, source_hash)
+    return stats
+
+
+def record_corpus_stats(stats: CorpusStats, file_path: PathLike, cache_dir: Optional[PathLike] = None):
+    """Store already-known stats for a corpus file that was just written"""
+    stats.save(stats_path(file_path, cache_dir), corpus_hash(file_path))
@@ -3,15 +3,16 @@ Data Preprocessing Utilities
 Process seed dialogues for training
 """
 
-import json
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence
+
+from .augmentation import AugmentationStrategy, augment_frame
+from .dialogue_store import iter_dialogues
+from .message_table import load_message_table
 
 def load_seed_dialogues(file_path: str = '../SEED_DIALOGUES.json') -> List[Dict]:
-    """Load seed dialogues from JSON file"""
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    return data.get('dialogues', [])
+    """Load seed dialogues from a JSONL or legacy JSON corpus"""
+    return list(iter_dialogues(file_path))
 
 def extract_conversations(dialogues: List[Dict]) -> List[Dict]:
     """Extract user-assistant conversation pairs"""
@@ -35,16 +36,42 @@ def extract_conversations(dialogues: List[Dict]) -> List[Dict]:
     
     return conversations
 
+def load_conversations(file_path: str = '../SEED_DIALOGUES.json') -> List[Dict]:
+    """Extract conversation pairs from a corpus via its cached message table"""
+    columns = ['dialogue_index', 'role', 'text', 'intent', 'sentiment', 'risk_level']
+    df = load_message_table(file_path, columns=columns).to_pandas()
+    for col in ['role', 'intent', 'sentiment', 'risk_level']:
+        df[col] = df[col].astype(object)
+    
+    # Pair the k-th user message of each dialogue with its k-th assistant message
+    user = df[df['role'] == 'user'].copy()
+    assistant = df[df['role'] == 'assistant'].copy()
+    user['pair'] = user.groupby('dialogue_index').cumcount()
+    assistant['pair'] = assistant.groupby('dialogue_index').cumcount()
+    
+    pairs = user.merge(assistant, on=['dialogue_index', 'pair'], suffixes=('_user', '_assistant'))
+    pairs = pairs.sort_values(['dialogue_index', 'pair'])
+    
+    return pd.DataFrame({
+        'user': pairs['text_user'],
+        'assistant': pairs['text_assistant'],
+        'intent': pairs['intent_assistant'].fillna('other'),
+        'sentiment': pairs['sentiment_user'].fillna('neutral'),
+        'risk_level': pairs['risk_level_user'].fillna('none'),
+    }).to_dict('records')
+
 def prepare_training_pairs(conversations: List[Dict]) -> pd.DataFrame:
     """Prepare training pairs for fine-tuning"""
     df = pd.DataFrame(conversations)
     return df
 
-def augment_data(df: pd.DataFrame, num_augmentations: int = 3) -> pd.DataFrame:
-    """Augment data with paraphrasing (placeholder - would use LLM in production)"""
-    # In production, use LLM to generate paraphrases
-    # For now, return original data
-    return df
+def augment_data(df: pd.DataFrame, num_augmentations: int = 3,
+                 strategies: Optional[Sequence[AugmentationStrategy]] = None,
+                 text_column: Optional[str] = None, seed: int = 0, workers: int = 1,
+                 use_cache: bool = True) -> pd.DataFrame:
+    """Augment data with paraphrasing (lexical substitution unless other strategies are given)"""
+    return augment_frame(df, num_augmentations, strategies, text_column=text_column,
+                         seed=seed, workers=workers, use_cache=use_cache)
 
 def split_train_test(df: pd.DataFrame, test_size: float = 0.2):
     """Split data into train and test sets"""
@@ -0,0 +1,324 @@
+"""
+Dialogue Index
+Byte-offset sidecar index for random access to dialogues by id or label
+"""
+
+import codecs
+import json
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .compression import detect_compression, open_binary
+from .dialogue_store import PathLike, corpus_hash, is_jsonl_corpus
+
+# Bump when the index layout changes so stale indexes are rebuilt
+INDEX_VERSION = 1
+
+# Fields with a secondary index, mapped to their location in a dialogue
+SECONDARY_FIELDS = {
+    'concern': ('user_profile', 'concern'),
+    'session_type': (None, 'session_type'),
+    'max_risk_level': ('labels', 'max_risk_level'),
+}
+
+INDEX_SCHEMA = pa.schema([
+    ('dialogue_id', pa.string()),
+    ('offset', pa.int64()),
+    ('length', pa.int64()),
+] + [(name, pa.dictionary(pa.int32(), pa.string())) for name in SECONDARY_FIELDS])
+
+_decoder = json.JSONDecoder()
+
+
+def index_path(file_path: PathLike, cache_dir: Optional[PathLike] = None) -> Path:
+    """Cache location for a corpus' dialogue index"""
+    source = Path(file_path)
+    cache_dir = Path(cache_dir) if cache_dir else source.parent / '.cache'
+    return cache_dir / f"{source.name}.v{INDEX_VERSION}.index.parquet"
+
+
+def _dialogue_id(dialogue: Dict) -> Optional[str]:
+    """A dialogue's id, or None where it is missing or not a string"""
+    value = dialogue.get('dialogue_id') if isinstance(dialogue, dict) else None
+    return value if isinstance(value, str) else None
+
+
+def _secondary_values(dialogue: Dict) -> List[Optional[str]]:
+    if not isinstance(dialogue, dict):
+        return [None] * len(SECONDARY_FIELDS)
+    values = []
+    for parent, key in SECONDARY_FIELDS.values():
+        container = dialogue.get(parent) if parent else dialogue
+        value = container.get(key) if isinstance(container, dict) else None
+        values.append(value if isinstance(value, str) else None)
+    return values
+
+
+def _skip_whitespace(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def _expect(text: str, pos: int, char: str) -> int:
+    pos = _skip_whitespace(text, pos)
+    if text[pos:pos + 1] != char:
+        raise ValueError(f"expected {char!r} at character {pos}")
+    return pos + 1
+
+
+def _scan_legacy(text: str) -> Iterator[Tuple[int, int, Dict]]:
+    """Yield (start, end, dialogue) character spans of a legacy corpus' dialogues"""
+    pos = _expect(text, 0, '{')
+    while True:
+        pos = _skip_whitespace(text, pos)
+        if text[pos:pos + 1] == '}':
+            raise ValueError("corpus has no 'dialogues' array")
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _expect(text, pos, ':')
+        pos = _skip_whitespace(text, pos)
+
+        if key != 'dialogues':
+            _, pos = _decoder.raw_decode(text, pos)
+            pos = _skip_whitespace(text, pos)
+            if text[pos:pos + 1] == ',':
+                pos += 1
+            continue
+
+        pos = _expect(text, pos, '[')
+        while True:
+            pos = _skip_whitespace(text, pos)
+            if text[pos:pos + 1] == ']':
+                return
+            dialogue, end = _decoder.raw_decode(text, pos)
+            yield pos, end, dialogue
+            pos = _skip_whitespace(text, end)
+            if text[pos:pos + 1] == ',':
+                pos += 1
+
+
+def _scan_spans(path: Path) -> Iterator[Tuple[int, int, Dict]]:
+    """Yield (byte offset, byte length, dialogue) for every dialogue in a corpus
+
+    Offsets of compressed corpora refer to the decompressed stream.
+    """
+    if is_jsonl_corpus(path):
+        offset = 0
+        with open_binary(path) as f:
+            for line in f:
+                stripped = line.strip()
+                if stripped:
+                    yield offset + line.index(stripped[:1]), len(stripped), json.loads(stripped)
+                offset += len(line)
+        return
+
+    with open_binary(path) as f:
+        raw = f.read()
+
+    # Decode without newline translation so character spans map back to bytes
+    bom = len(codecs.BOM_UTF8) if raw.startswith(codecs.BOM_UTF8) else 0
+    text = raw[bom:].decode('utf-8')
+    del raw
+
+    # Convert character spans to byte spans by encoding the gaps between them
+    char_pos, byte_pos = 0, bom
+    for start, end, dialogue in _scan_legacy(text):
+        byte_pos += len(text[char_pos:start].encode('utf-8'))
+        length = len(text[start:end].encode('utf-8'))
+        yield byte_pos, length, dialogue
+        byte_pos += length
+        char_pos = end
+
+
+def build_index(file_path: PathLike, cache_dir: Optional[PathLike] = None) -> Path:
+    """Scan a corpus once and write its offset/secondary index"""
+    source = Path(file_path)
+    path = index_path(source, cache_dir)
+    columns = {field.name: [] for field in INDEX_SCHEMA}
+
+    for offset, length, dialogue in _scan_spans(source):
+        columns['dialogue_id'].append(_dialogue_id(dialogue))
+        columns['offset'].append(offset)
+        columns['length'].append(length)
+        for name, value in zip(SECONDARY_FIELDS, _secondary_values(dialogue)):
+            columns[name].append(value)
+
+    arrays = [
+        pa.array(columns[field.name], type=pa.string()).dictionary_encode()
+        if pa.types.is_dictionary(field.type) else pa.array(columns[field.name], type=field.type)
+        for field in INDEX_SCHEMA
+    ]
+    stat = source.stat()
+    table = pa.Table.from_arrays(arrays, schema=INDEX_SCHEMA).replace_schema_metadata({
+        'source_hash': corpus_hash(source),
+        'source_size': str(stat.st_size),
+        'source_mtime_ns': str(stat.st_mtime_ns),
+    })
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(path)
+    return path
+
+
+def _is_current(table_path: Path, source: Path) -> bool:
+    """Check an index against its corpus, hashing only if size/mtime moved"""
+    if not table_path.exists():
+        return False
+    metadata = pq.read_schema(table_path).metadata or {}
+    stat = source.stat()
+    if (metadata.get(b'source_size') == str(stat.st_size).encode()
+            and metadata.get(b'source_mtime_ns') == str(stat.st_mtime_ns).encode()):
+        return True
+    return metadata.get(b'source_hash') == corpus_hash(source).encode()
+
+
+class DialogueIndex:
+    """Random access to a corpus' dialogues without loading the whole file
+
+    Behaves as a read-only sequence of dialogue dicts in corpus order; only
+    the dialogues actually accessed are read from disk and decoded.
+    """
+
+    def __init__(self, file_path: PathLike, table: pa.Table):
+        self.file_path = Path(file_path)
+        self.table = table
+        self.offsets = table['offset'].to_pylist()
+        self.lengths = table['length'].to_pylist()
+        self._positions = None
+        self._file = None
+        self._compressed = detect_compression(self.file_path) is not None
+        self._stream_pos = 0
+
+    @classmethod
+    def open(cls, file_path: PathLike, cache_dir: Optional[PathLike] = None,
+             rebuild: bool = False) -> 'DialogueIndex':
+        """Load the index for a corpus, building it if missing or stale"""
+        source = Path(file_path)
+        path = index_path(source, cache_dir)
+        if rebuild or not _is_current(path, source):
+            print(f"🗂️  Indexing {source.name}...")
+            build_index(source, cache_dir)
+        return cls(source, pq.read_table(path))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, position: int) -> Dict:
+        return json.loads(self.raw(position))
+
+    def raw(self, position: int) -> bytes:
+        """Undecoded JSON bytes of the dialogue at a position"""
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('dialogue index out of range')
+        return self._read_span(self.offsets[position], self.lengths[position])
+
+    def _read_span(self, offset: int, length: int) -> bytes:
+        if not self._compressed:
+            if self._file is None:
+                self._file = open(self.file_path, 'rb')
+            self._file.seek(offset)
+            return self._file.read(length)
+
+        # Compressed streams only read forward; restart when stepping back
+        if self._file is None or offset < self._stream_pos:
+            self.close()
+            self._file = open_binary(self.file_path)
+            self._stream_pos = 0
+        while self._stream_pos < offset:
+            skipped = len(self._file.read(min(offset - self._stream_pos, 1 << 20)))
+            if not skipped:
+                raise EOFError(f"{self.file_path} is shorter than its index")
+            self._stream_pos += skipped
+        data = self._file.read(length)
+        self._stream_pos += len(data)
+        return data
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def ids(self) -> List[Optional[str]]:
+        return self.table['dialogue_id'].to_pylist()
+
+    def position(self, dialogue_id: str) -> Optional[int]:
+        """Corpus position of a dialogue id (first occurrence), or None"""
+        if self._positions is None:
+            self._positions = {}
+            for position, value in enumerate(self.ids):
+                self._positions.setdefault(value, position)
+        return self._positions.get(dialogue_id)
+
+    def get(self, dialogue_id: str) -> Optional[Dict]:
+        """Read a single dialogue by id"""
+        position = self.position(dialogue_id)
+        return self[position] if position is not None else None
+
+    def lookup(self, **criteria: str) -> List[int]:
+        """Positions of dialogues matching every given secondary field value
+
+        e.g. ``index.lookup(concern='anxiety', max_risk_level='high')``.
+        """
+        mask = None
+        for name, value in criteria.items():
+            if name not in SECONDARY_FIELDS:
+                raise ValueError(f"No secondary index on '{name}' (have: {', '.join(SECONDARY_FIELDS)})")
+            match = pc.fill_null(pc.equal(self.table[name].cast(pa.string()), value), False)
+            mask = match if mask is None else pc.and_(mask, match)
+        if mask is None:
+            return list(range(len(self)))
+        return pc.indices_nonzero(mask).to_pylist()
+
+    def values(self, name: str) -> Dict[str, int]:
+        """Distinct values of a secondary field with their dialogue counts"""
+        counts = pc.value_counts(self.table[name].cast(pa.string()))
+        return {item['values']: item['counts'] for item in counts.to_pylist() if item['values'] is not None}
+
+    def strata(self, *names: str) -> Dict[Tuple[Optional[str], ...], List[int]]:
+        """Positions grouped by their combination of secondary field values"""
+        for name in names:
+            if name not in SECONDARY_FIELDS:
+                raise ValueError(f"No secondary index on '{name}' (have: {', '.join(SECONDARY_FIELDS)})")
+        columns = [self.table[name].cast(pa.string()).to_pylist() for name in names]
+        groups = defaultdict(list)
+        for position, key in enumerate(zip(*columns) if columns else [()] * len(self)):
+            groups[key].append(position)
+        return dict(groups)
+
+
+class IndexedView:
+    """Sequence over a subset of an index's positions"""
+
+    def __init__(self, index: DialogueIndex, positions: List[int]):
+        self.index = index
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i: int) -> Dict:
+        return self.index[self.positions[i]]
+
+    def __iter__(self) -> Iterator[Dict]:
+        for position in self.positions:
+            yield self.index[position]
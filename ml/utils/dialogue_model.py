@@ -0,0 +1,387 @@
+"""
+Dialogue Model
+Compact slotted records for dialogues, messages and labels
+
+Label fields are stored as small-integer codes against shared vocabularies,
+message texts are interned, and anything outside the known schema is kept
+verbatim in an ``extra`` dict, so ``from_dict(d).to_dict() == d``.
+"""
+
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .dialogue_store import PathLike, iter_dialogues
+
+INTENT_LABELS = [
+    'validate', 'probe_story', 'probe_root', 'reframe',
+    'suggest_experiment', 'offer_mindfulness', 'safety_check',
+    'emergency', 'close', 'other'
+]
+
+SENTIMENT_LABELS = ['very_negative', 'negative', 'neutral', 'positive']
+RISK_LEVEL_LABELS = ['none', 'low', 'medium', 'high']
+SESSION_TYPES = ['check-in', 'gentle_deep', 'micro_practice']
+ROLES = ['user', 'assistant']
+
+# Code for a label field that is absent from the record
+ABSENT = -1
+
+
+class _Missing:
+    """Marker for absent non-label fields (distinct from an explicit null)"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __bool__(self):
+        return False
+
+
+MISSING = _Missing()
+
+
+class Vocabulary:
+    """Label <-> small-int code mapping
+
+    Codes below ``base_size`` are the schema's valid labels. Unknown labels
+    still get a code (appended) so records round-trip without loss.
+    """
+
+    __slots__ = ('labels', 'codes', 'base_size')
+
+    def __init__(self, labels: Iterable[str]):
+        self.labels = list(labels)
+        self.codes = {label: code for code, label in enumerate(self.labels)}
+        self.base_size = len(self.labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def encode(self, label: str) -> int:
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.labels.append(label)
+            self.codes[label] = code
+        return code
+
+    def decode(self, code: int) -> Optional[str]:
+        return self.labels[code] if code != ABSENT else None
+
+    def is_valid(self, code: int) -> bool:
+        return 0 <= code < self.base_size
+
+
+INTENTS = Vocabulary(INTENT_LABELS)
+SENTIMENTS = Vocabulary(SENTIMENT_LABELS)
+RISK_LEVELS = Vocabulary(RISK_LEVEL_LABELS)
+SESSION_TYPE_VOCAB = Vocabulary(SESSION_TYPES)
+ROLE_VOCAB = Vocabulary(ROLES)
+CONCERNS = Vocabulary([])
+TECHNIQUES = Vocabulary([])
+
+
+def _take_code(source: Dict, key: str, vocab: Vocabulary, extra: Dict) -> int:
+    """Encode a label field; non-string values are kept verbatim in ``extra``"""
+    if key not in source:
+        return ABSENT
+    value = source[key]
+    if isinstance(value, str):
+        return vocab.encode(value)
+    extra[key] = value
+    return ABSENT
+
+
+def _take_str(source: Dict, key: str, extra: Dict, intern: bool = False):
+    """Read a string field; non-string values are kept verbatim in ``extra``"""
+    if key not in source:
+        return MISSING
+    value = source[key]
+    if isinstance(value, str):
+        return sys.intern(value) if intern else value
+    extra[key] = value
+    return MISSING
+
+
+def _remaining(source: Dict, known: tuple, extra: Dict) -> Optional[Dict]:
+    """Collect fields outside the known schema; None when there are none"""
+    for key, value in source.items():
+        if key not in known:
+            extra[key] = value
+    return extra or None
+
+
+class Message:
+    """A single dialogue turn"""
+
+    __slots__ = ('role_code', 'text', 'timestamp', 'intent_code', 'sentiment_code', 'risk_code', 'extra')
+
+    FIELDS = ('role', 'text', 'timestamp', 'intent', 'sentiment', 'risk_level')
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Message':
+        msg = cls.__new__(cls)
+        extra = {}
+        msg.role_code = _take_code(data, 'role', ROLE_VOCAB, extra)
+        msg.text = _take_str(data, 'text', extra, intern=True)
+        msg.timestamp = _take_str(data, 'timestamp', extra)
+        msg.intent_code = _take_code(data, 'intent', INTENTS, extra)
+        msg.sentiment_code = _take_code(data, 'sentiment', SENTIMENTS, extra)
+        msg.risk_code = _take_code(data, 'risk_level', RISK_LEVELS, extra)
+        msg.extra = _remaining(data, cls.FIELDS, extra)
+        return msg
+
+    def to_dict(self) -> Dict:
+        data = {}
+        if self.role_code != ABSENT:
+            data['role'] = ROLE_VOCAB.labels[self.role_code]
+        if self.text is not MISSING:
+            data['text'] = self.text
+        if self.timestamp is not MISSING:
+            data['timestamp'] = self.timestamp
+        if self.intent_code != ABSENT:
+            data['intent'] = INTENTS.labels[self.intent_code]
+        if self.sentiment_code != ABSENT:
+            data['sentiment'] = SENTIMENTS.labels[self.sentiment_code]
+        if self.risk_code != ABSENT:
+            data['risk_level'] = RISK_LEVELS.labels[self.risk_code]
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def role(self) -> Optional[str]:
+        return ROLE_VOCAB.decode(self.role_code)
+
+    @property
+    def intent(self) -> Optional[str]:
+        return INTENTS.decode(self.intent_code)
+
+    @property
+    def sentiment(self) -> Optional[str]:
+        return SENTIMENTS.decode(self.sentiment_code)
+
+    @property
+    def risk_level(self) -> Optional[str]:
+        return RISK_LEVELS.decode(self.risk_code)
+
+
+class UserProfile:
+    """The ``user_profile`` block of a dialogue"""
+
+    __slots__ = ('age_range', 'concern_code', 'mood_score', 'extra')
+
+    FIELDS = ('age_range', 'concern', 'mood_score')
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'UserProfile':
+        profile = cls.__new__(cls)
+        extra = {}
+        profile.age_range = _take_str(data, 'age_range', extra, intern=True)
+        profile.concern_code = _take_code(data, 'concern', CONCERNS, extra)
+        profile.mood_score = data.get('mood_score', MISSING)
+        profile.extra = _remaining(data, cls.FIELDS, extra)
+        return profile
+
+    def to_dict(self) -> Dict:
+        data = {}
+        if self.age_range is not MISSING:
+            data['age_range'] = self.age_range
+        if self.concern_code != ABSENT:
+            data['concern'] = CONCERNS.labels[self.concern_code]
+        if self.mood_score is not MISSING:
+            data['mood_score'] = self.mood_score
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def concern(self) -> Optional[str]:
+        return CONCERNS.decode(self.concern_code)
+
+
+class DialogueLabels:
+    """The dialogue-level ``labels`` block"""
+
+    __slots__ = ('intent_code', 'sentiment_code', 'risk_code', 'technique_code', 'extra')
+
+    FIELDS = ('primary_intent', 'overall_sentiment', 'max_risk_level', 'therapeutic_technique')
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DialogueLabels':
+        labels = cls.__new__(cls)
+        extra = {}
+        labels.intent_code = _take_code(data, 'primary_intent', INTENTS, extra)
+        labels.sentiment_code = _take_code(data, 'overall_sentiment', SENTIMENTS, extra)
+        labels.risk_code = _take_code(data, 'max_risk_level', RISK_LEVELS, extra)
+        labels.technique_code = _take_code(data, 'therapeutic_technique', TECHNIQUES, extra)
+        labels.extra = _remaining(data, cls.FIELDS, extra)
+        return labels
+
+    def to_dict(self) -> Dict:
+        data = {}
+        if self.intent_code != ABSENT:
+            data['primary_intent'] = INTENTS.labels[self.intent_code]
+        if self.sentiment_code != ABSENT:
+            data['overall_sentiment'] = SENTIMENTS.labels[self.sentiment_code]
+        if self.risk_code != ABSENT:
+            data['max_risk_level'] = RISK_LEVELS.labels[self.risk_code]
+        if self.technique_code != ABSENT:
+            data['therapeutic_technique'] = TECHNIQUES.labels[self.technique_code]
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def set_extra(self, key: str, value):
+        """Attach a free-form label (e.g. review status)"""
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    @property
+    def primary_intent(self) -> Optional[str]:
+        return INTENTS.decode(self.intent_code)
+
+    @property
+    def max_risk_level(self) -> Optional[str]:
+        return RISK_LEVELS.decode(self.risk_code)
+
+    @property
+    def therapeutic_technique(self) -> Optional[str]:
+        return TECHNIQUES.decode(self.technique_code)
+
+
+class Dialogue:
+    """A full dialogue with profile, messages and labels"""
+
+    __slots__ = ('dialogue_id', 'session_type_code', 'profile', 'messages', 'labels', 'extra')
+
+    FIELDS = ('dialogue_id', 'session_type', 'user_profile', 'messages', 'labels')
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Dialogue':
+        dialogue = cls.__new__(cls)
+        extra = {}
+        dialogue.dialogue_id = _take_str(data, 'dialogue_id', extra)
+        dialogue.session_type_code = _take_code(data, 'session_type', SESSION_TYPE_VOCAB, extra)
+
+        profile = data.get('user_profile', MISSING)
+        if isinstance(profile, dict):
+            dialogue.profile = UserProfile.from_dict(profile)
+        else:
+            dialogue.profile = None
+            if profile is not MISSING:
+                extra['user_profile'] = profile
+
+        messages = data.get('messages', MISSING)
+        if isinstance(messages, list) and all(isinstance(m, dict) for m in messages):
+            dialogue.messages = tuple(Message.from_dict(m) for m in messages)
+        else:
+            dialogue.messages = None
+            if messages is not MISSING:
+                extra['messages'] = messages
+
+        labels = data.get('labels', MISSING)
+        if isinstance(labels, dict):
+            dialogue.labels = DialogueLabels.from_dict(labels)
+        else:
+            dialogue.labels = None
+            if labels is not MISSING:
+                extra['labels'] = labels
+
+        dialogue.extra = _remaining(data, cls.FIELDS, extra)
+        return dialogue
+
+    def to_dict(self) -> Dict:
+        data = {}
+        if self.dialogue_id is not MISSING:
+            data['dialogue_id'] = self.dialogue_id
+        if self.session_type_code != ABSENT:
+            data['session_type'] = SESSION_TYPE_VOCAB.labels[self.session_type_code]
+        if self.profile is not None:
+            data['user_profile'] = self.profile.to_dict()
+        if self.messages is not None:
+            data['messages'] = [m.to_dict() for m in self.messages]
+        if self.labels is not None:
+            data['labels'] = self.labels.to_dict()
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def session_type(self) -> Optional[str]:
+        return SESSION_TYPE_VOCAB.decode(self.session_type_code)
+
+    @property
+    def concern(self) -> Optional[str]:
+        return self.profile.concern if self.profile is not None else None
+
+    @property
+    def concern_code(self) -> int:
+        return self.profile.concern_code if self.profile is not None else ABSENT
+
+
+class Label:
+    """One annotator label from a labeling-tool output file"""
+
+    __slots__ = ('item_id', 'intent_code', 'sentiment_code', 'risk_code', 'extra')
+
+    FIELDS = ('item_id', 'intent', 'sentiment', 'risk_level')
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Label':
+        label = cls.__new__(cls)
+        extra = {}
+        label.item_id = _take_str(data, 'item_id', extra)
+        label.intent_code = _take_code(data, 'intent', INTENTS, extra)
+        label.sentiment_code = _take_code(data, 'sentiment', SENTIMENTS, extra)
+        label.risk_code = _take_code(data, 'risk_level', RISK_LEVELS, extra)
+        label.extra = _remaining(data, cls.FIELDS, extra)
+        return label
+
+    def to_dict(self) -> Dict:
+        data = {}
+        if self.item_id is not MISSING:
+            data['item_id'] = self.item_id
+        if self.intent_code != ABSENT:
+            data['intent'] = INTENTS.labels[self.intent_code]
+        if self.sentiment_code != ABSENT:
+            data['sentiment'] = SENTIMENTS.labels[self.sentiment_code]
+        if self.risk_code != ABSENT:
+            data['risk_level'] = RISK_LEVELS.labels[self.risk_code]
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def get_extra(self, key: str, default=None):
+        return self.extra.get(key, default) if self.extra else default
+
+    @property
+    def intent(self) -> Optional[str]:
+        return INTENTS.decode(self.intent_code)
+
+    @property
+    def sentiment(self) -> Optional[str]:
+        return SENTIMENTS.decode(self.sentiment_code)
+
+    @property
+    def risk_level(self) -> Optional[str]:
+        return RISK_LEVELS.decode(self.risk_code)
+
+
+def decode_counts(counts: Dict[int, int], vocab: Vocabulary) -> Dict[Optional[str], int]:
+    """Turn per-code counts back into per-label counts (ABSENT becomes None)"""
+    return {vocab.decode(code): count for code, count in counts.items()}
+
+
+def iter_compact_dialogues(file_path: PathLike) -> Iterator[Dialogue]:
+    """Stream a corpus as compact Dialogue records"""
+    for data in iter_dialogues(file_path):
+        yield Dialogue.from_dict(data)
+
+
+def load_compact_dialogues(file_path: PathLike) -> List[Dialogue]:
+    """Load a whole corpus as compact Dialogue records"""
+    return list(iter_compact_dialogues(file_path))
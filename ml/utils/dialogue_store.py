@@ -0,0 +1,215 @@
+"""
+Dialogue Store
+Streaming reader/writer for dialogue corpora (JSONL with legacy JSON fallback)
+"""
+
+import hashlib
+import json
+import textwrap
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from .compression import PathLike, load_json, open_text, strip_compression_suffix
+
+JSONL_SUFFIXES = ('.jsonl',)
+SIDECAR_SUFFIX = '.meta.json'
+
+
+def is_jsonl_corpus(file_path: PathLike) -> bool:
+    """Check whether a corpus path uses the line-delimited format (.jsonl, .jsonl.gz, .jsonl.zst)"""
+    return strip_compression_suffix(file_path).suffix.lower() in JSONL_SUFFIXES
+
+
+def sidecar_path(file_path: PathLike) -> Path:
+    """Path of the header/statistics sidecar for a JSONL corpus"""
+    path = strip_compression_suffix(file_path)
+    return path.with_name(path.stem + SIDECAR_SUFFIX)
+
+
+def corpus_hash(file_path: PathLike, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a corpus file's contents, used to key derived caches"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_dialogues(file_path: PathLike) -> Iterator[Dict]:
+    """Yield dialogues one at a time from a JSONL or legacy JSON corpus"""
+    path = Path(file_path)
+
+    if not is_jsonl_corpus(path):
+        # Legacy {"dialogues": [...]} document has to be parsed in one go
+        yield from load_json(path).get('dialogues', [])
+        return
+
+    with open_text(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid dialogue record ({e})") from e
+
+
+def read_header(file_path: PathLike) -> Dict:
+    """Read corpus metadata (everything except the dialogues themselves)"""
+    path = Path(file_path)
+
+    if is_jsonl_corpus(path):
+        meta_path = sidecar_path(path)
+        if not meta_path.exists():
+            return {}
+        return load_json(meta_path)
+
+    data = load_json(path)
+    return {k: v for k, v in data.items() if k != 'dialogues'}
+
+
+class DialogueWriter:
+    """Write dialogues to disk one at a time
+
+    JSONL outputs get one dialogue per line plus a ``.meta.json`` sidecar
+    holding the header and statistics. Any other suffix is written in the
+    legacy ``{"dialogues": [...]}`` layout, still without buffering the corpus.
+    A ``.gz``/``.zst`` suffix compresses the output as it is streamed.
+
+    Records go to a temporary file beside the output, which only replaces
+    it once ``close`` succeeds: a run that fails part-way (leaving the
+    ``with`` block on an exception) deletes it and leaves any previous
+    output untouched.
+    """
+
+    # Array holding the records in the legacy layout, and the key of their count
+    RECORDS_KEY = 'dialogues'
+    COUNT_KEY = 'total_dialogues'
+
+    def __init__(self, output_file: PathLike, header: Optional[Dict] = None):
+        self.output_path = Path(output_file)
+        self.header = dict(header or {})
+        self.jsonl = is_jsonl_corpus(self.output_path)
+        self.count = 0
+        self.closed = False
+
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        # Same suffix as the output, so it is compressed the same way
+        self._tmp_path = self.output_path.with_name('.tmp-' + self.output_path.name)
+        self._file = open_text(self._tmp_path, 'w')
+
+        if not self.jsonl:
+            self._write_legacy_open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+    def write(self, dialogue: Dict):
+        """Append a single dialogue"""
+        if self.jsonl:
+            self._file.write(json.dumps(dialogue, ensure_ascii=False))
+            self._file.write('\n')
+        else:
+            if self.count:
+                self._file.write(',\n')
+            body = json.dumps(dialogue, indent=2, ensure_ascii=False)
+            self._file.write(textwrap.indent(body, '    '))
+        self.count += 1
+
+    def write_encoded(self, line: str):
+        """Append a dialogue that is already a JSONL record (copied as-is to JSONL outputs)"""
+        if not self.jsonl:
+            self.write(json.loads(line))
+            return
+        self._file.write(line)
+        self._file.write('\n')
+        self.count += 1
+
+    def write_all(self, dialogues: Iterable[Dict]) -> int:
+        """Append every dialogue from an iterable, returning the number written"""
+        for dialogue in dialogues:
+            self.write(dialogue)
+        return self.count
+
+    def close(self, statistics: Optional[Dict] = None):
+        """Finish the corpus and write trailing metadata"""
+        if self.closed:
+            return
+        self.closed = True
+
+        if statistics is not None:
+            self.header['statistics'] = statistics
+
+        if self.jsonl:
+            self._file.close()
+            self._tmp_path.replace(self.output_path)
+            meta = {'format': 'jsonl', **self.header, self.COUNT_KEY: self.count}
+            meta_path = sidecar_path(self.output_path)
+            tmp_meta_path = meta_path.with_name('.tmp-' + meta_path.name)
+            with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2, ensure_ascii=False)
+            tmp_meta_path.replace(meta_path)
+        else:
+            self._write_legacy_close()
+            self._file.close()
+            self._tmp_path.replace(self.output_path)
+
+    def discard(self):
+        """Abandon the output: delete what was written so far, keeping any previous output"""
+        if self.closed:
+            return
+        self.closed = True
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+    def _write_legacy_open(self):
+        """Write header fields and open the records array"""
+        self._file.write('{\n')
+        for key, value in self.header.items():
+            if key == 'statistics':
+                continue
+            self._write_legacy_field(key, value)
+            self._file.write(',\n')
+        self._file.write(f'  {json.dumps(self.RECORDS_KEY)}: [\n')
+
+    def _write_legacy_close(self):
+        """Close the records array and write trailing fields"""
+        self._file.write('\n  ]' if self.count else '  ]')
+        for key, value in self._trailer().items():
+            self._file.write(',\n')
+            self._write_legacy_field(key, value)
+        self._file.write('\n}\n')
+
+    def _trailer(self) -> Dict:
+        """Fields written after the records array (only known once it is complete)"""
+        return {'statistics': self.header['statistics']} if 'statistics' in self.header else {}
+
+    def _write_legacy_field(self, key: str, value):
+        body = json.dumps(value, indent=2, ensure_ascii=False)
+        self._file.write(f'  {json.dumps(key)}: ' + textwrap.indent(body, '  ').lstrip())
+
+
+class LabelWriter(DialogueWriter):
+    """Write labels one at a time, in the ``{"labels": [...]}`` layout or as JSONL"""
+
+    RECORDS_KEY = 'labels'
+    COUNT_KEY = 'total_labels'
+
+    def _trailer(self) -> Dict:
+        return {**super()._trailer(), self.COUNT_KEY: self.count}
+
+
+def save_dialogues(dialogues: Iterable[Dict], output_file: PathLike,
+                   header: Optional[Dict] = None, statistics: Optional[Dict] = None) -> int:
+    """Stream dialogues to a corpus file, returning the number written"""
+    with DialogueWriter(output_file, header) as writer:
+        writer.write_all(dialogues)
+        writer.close(statistics)
+    return writer.count
@@ -0,0 +1,100 @@
+"""
+External Sort
+Sort keyed records that may not fit in memory, spilling sorted runs to disk
+"""
+
+import heapq
+import struct
+import tempfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import msgspec
+
+from .dialogue_store import PathLike
+
+# Records held in memory before a sorted run is written out
+DEFAULT_BUFFER_SIZE = 200000
+
+_LENGTH = struct.Struct('<I')
+
+Record = Tuple[tuple, bytes]
+
+
+class ExternalSorter:
+    """Records ``(key, payload)`` in key order, with at most ``buffer_size`` held in memory
+
+    Keys are tuples of strings and numbers; payloads are bytes. Records
+    are buffered, and each full buffer is sorted and written to a run file
+    under ``tmp_dir`` (the system temp directory by default). Iterating
+    k-way merges the runs, reading one record per run at a time. Equal
+    keys keep the order they were added in.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, tmp_dir: Optional[PathLike] = None):
+        self.buffer_size = max(1, buffer_size)
+        self.tmp_dir = tmp_dir
+        self.count = 0
+        self._buffer: List[Record] = []
+        self._runs: List[Path] = []
+        self._dir: Optional[tempfile.TemporaryDirectory] = None
+        self._encoder = msgspec.msgpack.Encoder()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def runs(self) -> int:
+        """Number of runs spilled to disk so far"""
+        return len(self._runs)
+
+    def add(self, key: tuple, payload: bytes = b''):
+        self._buffer.append((key, payload))
+        self.count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self._spill()
+
+    def _spill(self):
+        """Write the buffer as one sorted run"""
+        if self._dir is None:
+            if self.tmp_dir is not None:
+                Path(self.tmp_dir).mkdir(parents=True, exist_ok=True)
+            self._dir = tempfile.TemporaryDirectory(prefix='sort-', dir=self.tmp_dir)
+        path = Path(self._dir.name) / f'run-{len(self._runs):05d}'
+        self._buffer.sort(key=lambda record: record[0])
+        with open(path, 'wb') as f:
+            for key, payload in self._buffer:
+                frame = self._encoder.encode((key, payload))
+                f.write(_LENGTH.pack(len(frame)))
+                f.write(frame)
+        self._runs.append(path)
+        self._buffer = []
+
+    @staticmethod
+    def _read_run(path: Path) -> Iterator[Record]:
+        decoder = msgspec.msgpack.Decoder(Tuple[tuple, bytes])
+        with open(path, 'rb', buffering=1 << 20) as f:
+            while header := f.read(_LENGTH.size):
+                yield decoder.decode(f.read(_LENGTH.unpack(header)[0]))
+
+    def __iter__(self) -> Iterator[Record]:
+        if not self._runs:
+            # Everything fit in memory: no files involved
+            self._buffer.sort(key=lambda record: record[0])
+            yield from self._buffer
+            return
+        if self._buffer:
+            self._spill()
+        # Runs are merged in the order they were written, so ties stay stable
+        yield from heapq.merge(*(self._read_run(path) for path in self._runs), key=lambda record: record[0])
+
+    def close(self):
+        """Delete the run files"""
+        self._buffer = []
+        self._runs = []
+        if self._dir is not None:
+            self._dir.cleanup()
+            self._dir = None
@@ -0,0 +1,95 @@
+"""
+Journal
+Append-only JSONL write-ahead log for interactive labeling and review sessions
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from .compression import dump_json, strip_compression_suffix
+from .dialogue_store import PathLike
+
+JOURNAL_SUFFIX = '.journal.jsonl'
+
+
+def journal_path(output_file: PathLike) -> Path:
+    """Journal kept next to a session's output file (e.g. ``labels.json.journal.jsonl``)"""
+    path = strip_compression_suffix(output_file)
+    return path.with_name(path.name + JOURNAL_SUFFIX)
+
+
+class Journal:
+    """Records of a session, one JSON object per line, each synced to disk as it is written
+
+    Appending costs the same however long the session gets, and a crash
+    loses at most the record being written: a torn last line is dropped
+    when the journal is replayed. ``compact`` folds the session into its
+    output file and starts the journal afresh.
+    """
+
+    def __init__(self, path: PathLike, sync: bool = True):
+        self.path = Path(path)
+        self.sync = sync
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def replay(self) -> List[Dict]:
+        """Records written so far, in order"""
+        if not self.path.exists():
+            return []
+        records = []
+        complete = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+                complete += len(line)
+        # Cut a record torn by a crash, so new records start on a fresh line
+        if complete < self.path.stat().st_size:
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+        return records
+
+    def append(self, record: Dict):
+        """Write one record; it is on disk when this returns"""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'ab')
+        self._file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def compact(self, output_file: PathLike, document: Dict):
+        """Replace ``output_file`` with ``document`` and empty the journal
+
+        The output is written beside the old one and swapped in atomically;
+        the journal is only removed once the new output is safely on disk.
+        """
+        path = Path(output_file)
+        tmp_path = path.with_name('.tmp-' + path.name)
+        dump_json(document, tmp_path)
+        if self.sync:
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+        tmp_path.replace(path)
+
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,178 @@
+"""
+Label Merge
+K-way merge of item-sorted label files and Dawid-Skene label aggregation
+"""
+
+import heapq
+import json
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import msgspec
+import numpy as np
+
+from .dialogue_model import Label, Vocabulary
+from .dialogue_store import PathLike
+from .external_sort import DEFAULT_BUFFER_SIZE, ExternalSorter
+from .schemas import iter_raw_labels
+
+# Posterior probabilities below this are left out of merged labels
+MIN_PROBABILITY = 1e-4
+
+
+class _ItemKey(msgspec.Struct):
+    item_id: Any = None
+
+
+_KEY_DECODER = msgspec.json.Decoder(_ItemKey)
+
+
+def _item_id(raw: bytes) -> Optional[str]:
+    item_id = _KEY_DECODER.decode(raw).item_id
+    return item_id if isinstance(item_id, str) and item_id else None
+
+
+def labels_sorted(file_path: PathLike) -> bool:
+    """Whether a labels file lists its labels in ``item_id`` order (repeats allowed)"""
+    previous = None
+    for raw in iter_raw_labels(file_path):
+        item_id = _item_id(raw)
+        if item_id is None:
+            continue
+        if previous is not None and item_id < previous:
+            return False
+        previous = item_id
+    return True
+
+
+def iter_item_sorted_labels(file_path: PathLike, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                            tmp_dir: Optional[PathLike] = None) -> Iterator[Label]:
+    """A file's labels in ``item_id`` order; where an item repeats, its last label
+
+    Sorted files (e.g. JSONL written in item order) are streamed one label
+    at a time. Any other file is externally sorted first, holding at most
+    ``buffer_size`` labels in memory.
+    """
+    if labels_sorted(file_path):
+        yield from _last_per_item(iter_raw_labels(file_path))
+        return
+
+    with ExternalSorter(buffer_size, tmp_dir) as sorter:
+        for raw in iter_raw_labels(file_path):
+            item_id = _item_id(raw)
+            if item_id is not None:
+                sorter.add((item_id,), raw)
+        # Stable, so repeats keep their file order and the last one still wins
+        yield from _last_per_item(raw for _, raw in sorter)
+
+
+def _last_per_item(raws: Iterator[bytes]) -> Iterator[Label]:
+    """The last label of each run of labels with the same ``item_id``"""
+    previous = None
+    for raw in raws:
+        label = Label.from_dict(json.loads(raw))
+        if not label.item_id:
+            continue
+        if previous is not None and previous.item_id != label.item_id:
+            yield previous
+        previous = label
+    if previous is not None:
+        yield previous
+
+
+def _tagged(annotator: int, file_path: PathLike) -> Iterator[Tuple[str, int, Label]]:
+    for label in iter_item_sorted_labels(file_path):
+        yield label.item_id, annotator, label
+
+
+def merge_label_streams(label_files: Sequence[PathLike]) -> Iterator[Tuple[str, List[Tuple[int, Label]]]]:
+    """Every item once, in ``item_id`` order, with ``(file index, label)`` from each file labeling it
+
+    Only one label per file is held at a time, whatever the file sizes.
+    """
+    streams = [_tagged(annotator, path) for annotator, path in enumerate(label_files)]
+    merged = heapq.merge(*streams, key=lambda entry: entry[0])
+    for item_id, entries in groupby(merged, key=lambda entry: entry[0]):
+        yield item_id, [(annotator, label) for _, annotator, label in entries]
+
+
+class DawidSkene:
+    """True-label posteriors and per-annotator confusion matrices for one label field
+
+    Fit with EM over an (items x annotators) code matrix (``ABSENT`` where an
+    annotator gave no label). ``confusion[a, k, l]`` is the estimated
+    probability that annotator ``a`` says ``l`` when the true label is ``k``.
+    Items nobody labeled have NaN posteriors.
+    """
+
+    def __init__(self, priors: np.ndarray, confusion: np.ndarray, posterior: np.ndarray,
+                 iterations: int, log_likelihood: float):
+        self.priors = priors
+        self.confusion = confusion
+        self.posterior = posterior
+        self.iterations = iterations
+        self.log_likelihood = log_likelihood
+        labeled = ~np.isnan(posterior[:, 0]) if len(posterior) else np.zeros(0, dtype=bool)
+        self.labels = np.where(labeled, np.argmax(np.nan_to_num(posterior, nan=-1), axis=1), -1)
+
+    @classmethod
+    def fit(cls, codes: np.ndarray, categories: int, max_iterations: int = 50, tolerance: float = 1e-6,
+            smoothing: float = 0.01) -> 'DawidSkene':
+        """EM from majority-vote initial posteriors until the log-likelihood settles
+
+        ``smoothing`` is a pseudo-count added to every prior and confusion
+        cell, so a label an annotator never used still has some probability.
+        """
+        items, annotators = codes.shape
+        k = categories
+        # Row-major order, so each item's labels are contiguous
+        rows, columns = np.nonzero(codes >= 0)
+        values = codes[rows, columns].astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.zeros(0, np.int64)
+        labeled = rows[starts]
+
+        votes = np.bincount(rows * k + values, minlength=items * k).reshape(items, k)[labeled]
+        posterior = votes / votes.sum(axis=1, keepdims=True)
+
+        log_likelihood = -np.inf
+        iterations = 0
+        priors = np.full(k, 1 / k)
+        confusion = np.full((annotators, k, k), 1 / k)
+        for iterations in range(1, max_iterations + 1):
+            # M-step: class priors and each annotator's confusion matrix
+            priors = (posterior.sum(axis=0) + smoothing) / (len(labeled) + k * smoothing)
+            weights = np.repeat(posterior, np.diff(np.r_[starts, len(rows)]), axis=0)
+            confusion = np.stack([
+                np.bincount(columns * k + values, weights=weights[:, true], minlength=annotators * k)
+                for true in range(k)
+            ]).reshape(k, annotators, k).transpose(1, 0, 2) + smoothing
+            confusion /= confusion.sum(axis=2, keepdims=True)
+
+            # E-step: posterior of each item's true label given all of its labels
+            evidence = np.log(confusion)[columns, :, values]
+            log_joint = np.log(priors) + (np.add.reduceat(evidence, starts, axis=0) if len(rows) else evidence)
+            peak = log_joint.max(axis=1, keepdims=True)
+            log_evidence = peak[:, 0] + np.log(np.exp(log_joint - peak).sum(axis=1))
+            posterior = np.exp(log_joint - log_evidence[:, None])
+
+            previous, log_likelihood = log_likelihood, float(log_evidence.sum())
+            if abs(log_likelihood - previous) <= tolerance * abs(log_likelihood):
+                break
+
+        full = np.full((items, k), np.nan)
+        full[labeled] = posterior
+        return cls(priors, confusion, full, iterations, log_likelihood)
+
+    def accuracy(self) -> np.ndarray:
+        """Estimated share of each annotator's labels that match the true label"""
+        return np.einsum('k,akk->a', self.priors, self.confusion)
+
+    def label(self, item: int, vocab: Vocabulary) -> Tuple[Optional[str], Optional[Dict[str, float]]]:
+        """Most probable label of an item and its label probabilities (None if unlabeled)"""
+        code = int(self.labels[item])
+        if code < 0:
+            return None, None
+        row = self.posterior[item]
+        probabilities = {vocab.labels[c]: round(float(row[c]), 4)
+                         for c in np.argsort(-row) if row[c] >= MIN_PROBABILITY}
+        return vocab.labels[code], probabilities
@@ -0,0 +1,251 @@
+"""
+LLM Dialogue Generation
+Concurrent, rate-limited, cached generation of dialogues from an OpenAI-compatible API
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import msgspec
+
+from .compression import PathLike
+from .schemas import DIALOGUE_DECODER, GENERATED_DIALOGUE_DECODER
+
+DEFAULT_MODEL = 'gpt-3.5-turbo'
+
+SYSTEM_PROMPT = """You are generating a therapeutic dialogue for training an AI coach.
+Generate a brief conversation (2-4 messages) where:
+1. User expresses a concern about: {concern}
+2. Assistant responds with compassion and validation
+3. Assistant uses therapeutic techniques (validation, probing, reframing)
+4. Keep responses brief (2-4 sentences)
+5. Use gentle, non-judgmental language
+
+Return only a JSON object of the form:
+{{"messages": [{{"role": "user", "text": "..."}},
+               {{"role": "assistant", "text": "...", "intent": "...", "sentiment": "...", "risk_level": "..."}}],
+  "labels": {{"primary_intent": "...", "overall_sentiment": "...", "max_risk_level": "...", "therapeutic_technique": "..."}}}}
+intent is one of validate, probe_story, probe_root, reframe, suggest_experiment, offer_mindfulness, safety_check, emergency, close, other.
+sentiment is one of very_negative, negative, neutral, positive. risk_level is one of none, low, medium, high."""
+
+USER_PROMPT = "Generate a {session_type} session dialogue about {concern}. Include 2-4 messages total."
+
+
+class GenerationError(Exception):
+    """A response that can't be turned into a valid dialogue"""
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` requests/sec on average, bursts up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                # Holding the lock while sleeping keeps waiters first-come first-served
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ResponseCache:
+    """Content-addressed prompt -> response store on disk
+
+    The key is the SHA-256 of the full request payload (model, prompts,
+    sampling parameters and seed), so a rerun or resumed job reuses every
+    response it already paid for. Only responses that parsed are stored.
+    """
+
+    def __init__(self, cache_dir: PathLike):
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def key(request: Dict) -> str:
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['response']
+
+    def put(self, key: str, request: Dict, response: str):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'request': request, 'response': response}, f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+
+def parse_dialogue(content: str, dialogue_id: str, concern: str, session_type: str) -> Dict:
+    """Strictly decode a model response into a dialogue record
+
+    The response must match ``GeneratedDialogue`` (typed messages, enum labels);
+    the assembled record is then checked against the full ``Dialogue`` schema.
+    """
+    try:
+        generated = GENERATED_DIALOGUE_DECODER.decode(content)
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
+        raise GenerationError(f"Invalid dialogue JSON: {e}") from e
+
+    dialogue = {
+        'dialogue_id': dialogue_id,
+        'session_type': session_type,
+        'user_profile': {'concern': concern},
+        'messages': msgspec.to_builtins(generated.messages),
+        'labels': {**msgspec.to_builtins(generated.labels), 'synthetic': True, 'generated_by': 'llm'},
+    }
+    try:
+        DIALOGUE_DECODER.decode(msgspec.json.encode(dialogue))
+    except msgspec.ValidationError as e:
+        raise GenerationError(f"Dialogue does not match schema: {e}") from e
+    return dialogue
+
+
+class AsyncDialogueGenerator:
+    """Generate dialogues with many requests in flight
+
+    Up to ``concurrency`` requests run at once, started no faster than the
+    token bucket allows, so throughput grows with the concurrency limit
+    instead of being bound by round-trip latency. Failed or malformed
+    responses are retried with exponential backoff and full jitter.
+    """
+
+    def __init__(self, client=None, model: str = DEFAULT_MODEL, concurrency: int = 8,
+                 requests_per_second: float = 5.0, burst: Optional[float] = None,
+                 max_retries: int = 4, backoff_base: float = 0.5, backoff_cap: float = 30.0,
+                 cache_dir: Optional[PathLike] = None, temperature: float = 0.7, max_tokens: int = 500,
+                 base_url: Optional[str] = None, timeout: float = 60.0):
+        # Imported here so the rest of utils doesn't pay for the SDK import
+        try:
+            import openai
+        except ImportError as e:
+            raise ImportError("openai>=1.0 is required for LLM generation (pip install openai)") from e
+        self.retryable = (openai.APIConnectionError, openai.APITimeoutError,
+                          openai.RateLimitError, openai.InternalServerError)
+        self.status_error = openai.APIStatusError
+        if client is None:
+            # Retries are handled here (with jitter and the cache), not by the SDK
+            client = openai.AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY') or ('unused' if base_url else None),
+                                 base_url=base_url, max_retries=0, timeout=timeout)
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.stats = {'requests': 0, 'cache_hits': 0, 'retries': 0, 'failed': 0}
+
+    def build_request(self, concern: str, session_type: str, variant: int) -> Dict:
+        """Chat completion payload; ``variant`` seeds sampling so each item differs"""
+        return {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': SYSTEM_PROMPT.format(concern=concern)},
+                {'role': 'user', 'content': USER_PROMPT.format(session_type=session_type, concern=concern)},
+            ],
+            'temperature': self.temperature,
+            'max_tokens': self.max_tokens,
+            'seed': variant,
+            'response_format': {'type': 'json_object'},
+        }
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when given"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if isinstance(error, self.status_error):
+            retry_after = error.response.headers.get('retry-after')
+            try:
+                delay = max(delay, float(retry_after))
+            except (TypeError, ValueError):
+                pass
+        return delay
+
+    async def _complete(self, request: Dict, bucket: TokenBucket) -> str:
+        await bucket.acquire()
+        self.stats['requests'] += 1
+        response = await self.client.chat.completions.create(**request)
+        return response.choices[0].message.content or ''
+
+    async def generate_one(self, dialogue_id: str, concern: str, session_type: str, variant: int,
+                           semaphore: asyncio.Semaphore, bucket: TokenBucket) -> Optional[Dict]:
+        """One dialogue, from the cache or the API; None once retries run out"""
+        request = self.build_request(concern, session_type, variant)
+        key = ResponseCache.key(request)
+
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                try:
+                    dialogue = parse_dialogue(cached, dialogue_id, concern, session_type)
+                    self.stats['cache_hits'] += 1
+                    return dialogue
+                except GenerationError:
+                    pass  # written by an older schema; fetch again
+
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    content = await self._complete(request, bucket)
+                    dialogue = parse_dialogue(content, dialogue_id, concern, session_type)
+                except (GenerationError,) + self.retryable as e:
+                    if attempt == self.max_retries:
+                        self.stats['failed'] += 1
+                        print(f"⚠️  LLM generation failed for {dialogue_id}: {e}")
+                        return None
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(self._backoff(attempt, e))
+                    continue
+
+                if self.cache is not None:
+                    self.cache.put(key, request, content)
+                return dialogue
+
+    async def generate_many(self, specs: Sequence[Tuple[str, str, str, int]]) -> List[Optional[Dict]]:
+        """Generate ``(dialogue_id, concern, session_type, variant)`` specs concurrently, in order"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.requests_per_second, self.burst)
+        return await asyncio.gather(*(
+            self.generate_one(dialogue_id, concern, session_type, variant, semaphore, bucket)
+            for dialogue_id, concern, session_type, variant in specs
+        ))
+
+    def generate(self, specs: Sequence[Tuple[str, str, str, int]]) -> List[Optional[Dict]]:
+        """Blocking wrapper around ``generate_many``"""
+        return asyncio.run(self._run(specs))
+
+    async def _run(self, specs):
+        try:
+            return await self.generate_many(specs)
+        finally:
+            close = getattr(self.client, 'close', None)
+            if close is not None:
+                await close()
@@ -0,0 +1,103 @@
+"""
+Corpus Manifests
+Per-dialogue content hashes used to patch derived artifacts incrementally
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from .dialogue_store import PathLike
+
+MANIFEST_VERSION = 1
+
+
+def dialogue_content_hash(dialogue: Dict) -> str:
+    """Stable hash of a dialogue's full content (key order independent)"""
+    payload = json.dumps(dialogue, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def manifest_path(artifact_path: PathLike) -> Path:
+    """Manifest location for a derived artifact"""
+    path = Path(artifact_path)
+    return path.with_name(path.name + '.manifest.json')
+
+
+class ManifestDelta:
+    """Dialogue ids added, changed, removed and unchanged since the last build"""
+
+    def __init__(self, added: Iterable[str], changed: Iterable[str],
+                 removed: Iterable[str], unchanged: Iterable[str]):
+        self.added = set(added)
+        self.changed = set(changed)
+        self.removed = set(removed)
+        self.unchanged = set(unchanged)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+    @property
+    def dirty(self) -> set:
+        """Ids whose derived data has to be (re)computed"""
+        return self.added | self.changed
+
+    def summary(self) -> str:
+        return (f"+{len(self.added)} added, ~{len(self.changed)} changed, "
+                f"-{len(self.removed)} removed, {len(self.unchanged)} unchanged")
+
+
+class CorpusManifest:
+    """Content hash per dialogue_id for one derived artifact"""
+
+    def __init__(self, path: PathLike, artifact: str, source_hash: Optional[str] = None,
+                 entries: Optional[Dict[str, str]] = None):
+        self.path = Path(path)
+        self.artifact = artifact
+        self.source_hash = source_hash
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, path: PathLike, artifact: str) -> 'CorpusManifest':
+        """Load a manifest, or return an empty one if missing or incompatible"""
+        path = Path(path)
+        if not path.exists():
+            return cls(path, artifact)
+
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        if data.get('version') != MANIFEST_VERSION or data.get('artifact') != artifact:
+            return cls(path, artifact)
+
+        return cls(path, artifact, data.get('source_hash'), data.get('entries', {}))
+
+    def save(self):
+        """Write the manifest next to its artifact"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'artifact': self.artifact,
+                'source_hash': self.source_hash,
+                'entries': self.entries,
+            }, f)
+        tmp_path.replace(self.path)
+
+    def diff(self, current: Dict[str, str]) -> ManifestDelta:
+        """Compare current dialogue hashes against the recorded ones"""
+        added, changed, unchanged = [], [], []
+        for dialogue_id, content_hash in current.items():
+            previous = self.entries.get(dialogue_id)
+            if previous is None:
+                added.append(dialogue_id)
+            elif previous != content_hash:
+                changed.append(dialogue_id)
+            else:
+                unchanged.append(dialogue_id)
+
+        removed = [dialogue_id for dialogue_id in self.entries if dialogue_id not in current]
+        return ManifestDelta(added, changed, removed, unchanged)
@@ -0,0 +1,169 @@
+"""
+Message Table
+Flat, columnar (Parquet) view of every message in a dialogue corpus
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .dialogue_store import PathLike, corpus_hash, iter_dialogues
+from .manifest import CorpusManifest, ManifestDelta, dialogue_content_hash, manifest_path
+
+# Bump when the table layout changes so stale caches are rebuilt
+TABLE_VERSION = 1
+
+CATEGORICAL_COLUMNS = ['role', 'intent', 'sentiment', 'risk_level', 'session_type', 'concern']
+
+MESSAGE_SCHEMA = pa.schema([
+    ('dialogue_index', pa.int32()),
+    ('dialogue_id', pa.string()),
+    ('turn', pa.int16()),
+    ('text', pa.string()),
+] + [(name, pa.dictionary(pa.int32(), pa.string())) for name in CATEGORICAL_COLUMNS])
+
+BATCH_ROWS = 65536
+
+Filters = Optional[List[tuple]]
+
+
+def _empty_columns() -> Dict[str, list]:
+    return {field.name: [] for field in MESSAGE_SCHEMA}
+
+
+def _to_batch(columns: Dict[str, list]) -> pa.RecordBatch:
+    """Build a record batch, dictionary-encoding the label columns"""
+    arrays = []
+    for field in MESSAGE_SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(columns[field.name], type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=MESSAGE_SCHEMA)
+
+
+def iter_message_batches(dialogues: Iterable[Dict], batch_rows: int = BATCH_ROWS) -> Iterable[pa.RecordBatch]:
+    """Flatten dialogues into record batches of at most ``batch_rows`` messages"""
+    columns = _empty_columns()
+    rows = 0
+
+    for dialogue_index, dialogue in enumerate(dialogues):
+        profile = dialogue.get('user_profile', {})
+        for turn, message in enumerate(dialogue.get('messages', [])):
+            columns['dialogue_index'].append(dialogue_index)
+            columns['dialogue_id'].append(dialogue.get('dialogue_id'))
+            columns['turn'].append(turn)
+            columns['text'].append(message.get('text'))
+            columns['role'].append(message.get('role'))
+            columns['intent'].append(message.get('intent'))
+            columns['sentiment'].append(message.get('sentiment'))
+            columns['risk_level'].append(message.get('risk_level'))
+            columns['session_type'].append(dialogue.get('session_type'))
+            columns['concern'].append(profile.get('concern'))
+            rows += 1
+
+            if rows >= batch_rows:
+                yield _to_batch(columns)
+                columns = _empty_columns()
+                rows = 0
+
+    if rows:
+        yield _to_batch(columns)
+
+
+def message_table_path(file_path: PathLike, cache_dir: Optional[PathLike] = None) -> Path:
+    """Cache location for a corpus' message table"""
+    source = Path(file_path)
+    cache_dir = Path(cache_dir) if cache_dir else source.parent / '.cache'
+    return cache_dir / f"{source.name}.v{TABLE_VERSION}.messages.parquet"
+
+
+def materialize_message_table(file_path: PathLike, cache_dir: Optional[PathLike] = None,
+                              force: bool = False) -> Path:
+    """Build or patch the message table for a corpus
+
+    The table is reused as long as the corpus' content hash matches its
+    manifest. When the corpus changes, only added/changed dialogues are
+    flattened again; rows of unchanged dialogues are carried over from the
+    previous table.
+    """
+    source = Path(file_path)
+    table_path = message_table_path(source, cache_dir)
+    manifest = CorpusManifest.load(manifest_path(table_path), artifact='message_table')
+    source_hash = corpus_hash(source)
+
+    if not force and table_path.exists() and manifest.source_hash == source_hash:
+        return table_path
+
+    table_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Hash each dialogue, keeping only those the old table doesn't cover
+    current = {}
+    dirty_dialogues = []
+    patchable = not force and table_path.exists() and bool(manifest.entries)
+    for dialogue in iter_dialogues(source):
+        dialogue_id = dialogue.get('dialogue_id')
+        if not dialogue_id or dialogue_id in current:
+            # Rows can only be matched up by unique ids
+            current = None
+            break
+        current[dialogue_id] = dialogue_content_hash(dialogue)
+        if patchable and manifest.entries.get(dialogue_id) != current[dialogue_id]:
+            dirty_dialogues.append(dialogue)
+
+    if current is not None and patchable:
+        delta = manifest.diff(current)
+        print(f"🔄 Patching message table for {source.name}: {delta.summary()}")
+        table = _patch_table(pq.read_table(table_path), delta, dirty_dialogues, list(current))
+    else:
+        table = None
+
+    tmp_path = table_path.with_suffix('.tmp')
+    if table is not None:
+        pq.write_table(table, tmp_path)
+    else:
+        with pq.ParquetWriter(tmp_path, MESSAGE_SCHEMA) as writer:
+            for batch in iter_message_batches(iter_dialogues(source)):
+                writer.write_batch(batch)
+    tmp_path.replace(table_path)
+
+    manifest.source_hash = source_hash
+    manifest.entries = current or {}
+    manifest.save()
+
+    return table_path
+
+
+def _patch_table(old: pa.Table, delta: ManifestDelta, dirty_dialogues: List[Dict],
+                 order: List[str]) -> pa.Table:
+    """Replace rows of changed dialogues and re-sort into corpus order"""
+    kept = old.filter(pc.is_in(old['dialogue_id'], value_set=pa.array(list(delta.unchanged), pa.string())))
+    fresh = pa.Table.from_batches(list(iter_message_batches(dirty_dialogues)), schema=MESSAGE_SCHEMA)
+    table = pa.concat_tables([kept, fresh])
+
+    # Positions in the current corpus become the new dialogue_index
+    dialogue_index = pc.index_in(table['dialogue_id'], value_set=pa.array(order, pa.string())).cast(pa.int32())
+    table = table.set_column(table.schema.get_field_index('dialogue_index'), 'dialogue_index', dialogue_index)
+    return table.sort_by([('dialogue_index', 'ascending'), ('turn', 'ascending')])
+
+
+def load_message_table(file_path: PathLike, columns: Optional[List[str]] = None,
+                       filters: Filters = None, cache_dir: Optional[PathLike] = None) -> pa.Table:
+    """Load a column projection / filtered view of a corpus' messages
+
+    ``filters`` uses the pyarrow predicate syntax, e.g.
+    ``[('role', '==', 'user')]``.
+    """
+    table_path = materialize_message_table(file_path, cache_dir)
+    return pq.read_table(table_path, columns=columns, filters=filters)
+
+
+def load_messages(file_path: PathLike, role: Optional[str] = None,
+                  columns: Optional[List[str]] = None,
+                  cache_dir: Optional[PathLike] = None) -> List[Dict]:
+    """Load messages (optionally only one role) as a list of row dicts"""
+    filters = [('role', '==', role)] if role else None
+    return load_message_table(file_path, columns, filters, cache_dir).to_pylist()
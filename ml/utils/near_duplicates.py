@@ -0,0 +1,216 @@
+"""
+Near-Duplicate Detection
+Streaming MinHash/LSH index for finding near-identical dialogues
+"""
+
+import hashlib
+import re
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Hash permutations are computed modulo this prime, so a * x + b fits in uint64
+MERSENNE_PRIME = (1 << 31) - 1
+
+TOKEN_PATTERN = re.compile(r"\w+(?:'\w+)?")
+
+# Line shingles are memoized until the memo reaches this many lines, then it's reset
+SHINGLE_MEMO_SIZE = 1 << 20
+
+# Shingles hashed against every permutation in one NumPy operation
+BLOCK_SHINGLES = 1 << 14
+
+
+def dialogue_text(dialogue: Dict) -> str:
+    """Full text of a dialogue, one message per line"""
+    return '\n'.join(message.get('text') or '' for message in dialogue.get('messages', []))
+
+
+def optimal_bands(threshold: float, num_perm: int, false_positive_weight: float = 0.5) -> Tuple[int, int]:
+    """LSH (bands, rows) that best separate pairs around the Jaccard threshold
+
+    A pair with similarity s becomes a candidate with probability
+    ``1 - (1 - s**rows)**bands``. This picks the split minimising the weighted
+    area of that curve below the threshold plus the area missing above it.
+    """
+    grid = np.linspace(0.0, 1.0, 1001)
+    step = grid[1] - grid[0]
+    below = grid < threshold
+    best, best_error = (1, num_perm), float('inf')
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        candidate = 1.0 - (1.0 - grid ** rows) ** bands
+        false_positive = candidate[below].sum() * step
+        false_negative = (1.0 - candidate[~below]).sum() * step
+        error = false_positive_weight * false_positive + (1.0 - false_positive_weight) * false_negative
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """Word-shingle MinHash signatures, computed for many texts at once"""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self._memo = {}
+
+    def _line_shingles(self, line: str) -> np.ndarray:
+        """Hashed word n-grams of one message line (the whole line if it is shorter), memoized"""
+        hashes = self._memo.get(line)
+        if hashes is None:
+            tokens = TOKEN_PATTERN.findall(line.lower())
+            k = self.shingle_size
+            grams = [' '.join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)] or [' '.join(tokens)]
+            hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams),
+                                 dtype=np.uint64, count=len(grams)) % MERSENNE_PRIME
+            if len(self._memo) >= SHINGLE_MEMO_SIZE:
+                self._memo.clear()
+            self._memo[line] = hashes
+        return hashes
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Distinct shingle hashes of a text, taken line by line"""
+        return np.unique(np.concatenate([self._line_shingles(line) for line in text.split('\n')]))
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), num_perm) uint32 signature matrix
+
+        Shingles are taken within each line (message), so a repeated message
+        is tokenized once. Repeated shingles don't change a minimum and are
+        not removed.
+        """
+        parts = [[self._line_shingles(line) for line in text.split('\n')] for text in texts]
+        lengths = np.fromiter((sum(len(p) for p in text_parts) for text_parts in parts),
+                              dtype=np.int64, count=len(parts))
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+
+        # Group whole texts into blocks of about BLOCK_SHINGLES shingles
+        start = 0
+        cumulative = np.cumsum(lengths)
+        while start < len(texts):
+            base = cumulative[start] - lengths[start]
+            end = max(int(np.searchsorted(cumulative, base + BLOCK_SHINGLES, side='right')), start + 1)
+            flat = np.concatenate([p for text_parts in parts[start:end] for p in text_parts])
+            permuted = (self.a * flat + self.b) % MERSENNE_PRIME
+            offsets = cumulative[start:end] - lengths[start:end] - base
+            result[start:end] = np.minimum.reduceat(permuted, offsets, axis=1).T
+            start = end
+        return result
+
+
+class NearDuplicateIndex:
+    """Streaming near-duplicate filter over texts
+
+    Texts are added in order; each one is either kept as a new cluster
+    representative or matched to an earlier representative whose estimated
+    Jaccard similarity is at least ``threshold``. Only representatives are
+    indexed, in one hash table per LSH band, so a lookup touches a handful
+    of buckets rather than every earlier text. Exact repeats skip MinHash.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3,
+                 seed: int = 1, bands: Optional[int] = None):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        if bands is None:
+            self.bands, self.rows = optimal_bands(threshold, num_perm)
+        else:
+            self.bands, self.rows = bands, num_perm // bands
+        self.buckets = [{} for _ in range(self.bands)]
+        self.exact = {}
+        self.keys = []
+        self.duplicates = {}
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _store(self, key: str, signature: np.ndarray) -> int:
+        rep = len(self.keys)
+        if rep == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+        self._signatures[rep] = signature
+        self.keys.append(key)
+        return rep
+
+    def _match(self, signature: np.ndarray, band_keys: List[bytes]) -> Optional[int]:
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, band_keys):
+            candidates.update(bucket.get(band_key, ()))
+        if not candidates:
+            return None
+        candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._signatures[candidates] == signature).mean(axis=1)
+        best = int(similarity.argmax())
+        return int(candidates[best]) if similarity[best] >= self.threshold else None
+
+    def add_batch(self, keys: Sequence[str], texts: Sequence[str]) -> List[Optional[str]]:
+        """Add texts in order; return for each the key it duplicates, or None if it was kept"""
+        digests = [hashlib.blake2b(text.lower().encode('utf-8'), digest_size=16).digest() for text in texts]
+
+        # Signatures only for texts that aren't exact repeats (of the index or earlier in the batch)
+        pending = {}
+        pending_texts = []
+        for digest, text in zip(digests, texts):
+            if digest not in self.exact and digest not in pending:
+                pending[digest] = len(pending_texts)
+                pending_texts.append(text)
+        signatures = self.hasher.signatures(pending_texts)
+
+        rows = self.rows
+        results = []
+        for key, digest in zip(keys, digests):
+            rep = self.exact.get(digest)
+            if rep is None:
+                signature = signatures[pending[digest]]
+                band_keys = [signature[i * rows:(i + 1) * rows].tobytes() for i in range(self.bands)]
+                rep = self._match(signature, band_keys)
+                if rep is None:
+                    rep = self._store(key, signature)
+                    self.exact[digest] = rep
+                    for bucket, band_key in zip(self.buckets, band_keys):
+                        bucket.setdefault(band_key, []).append(rep)
+                    results.append(None)
+                    continue
+                self.exact[digest] = rep
+            self.duplicates.setdefault(rep, []).append(key)
+            results.append(self.keys[rep])
+        return results
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        """Add one text; return the key it duplicates, or None if it was kept"""
+        return self.add_batch([key], [text])[0]
+
+    def report(self, top: int = 20, sample: int = 10) -> Dict:
+        """Summary of duplicate clusters, largest first"""
+        clusters = sorted(self.duplicates.items(), key=lambda item: len(item[1]), reverse=True)
+        dropped = sum(len(members) for members in self.duplicates.values())
+        return {
+            'threshold': self.threshold,
+            'num_perm': self.hasher.num_perm,
+            'bands': self.bands,
+            'rows': self.rows,
+            'kept': len(self.keys),
+            'duplicates': dropped,
+            'duplicate_rate': dropped / max(len(self.keys) + dropped, 1),
+            'clusters': len(clusters),
+            'largest_clusters': [
+                {'representative': self.keys[rep], 'size': len(members) + 1, 'duplicates': members[:sample]}
+                for rep, members in clusters[:top]
+            ],
+        }
+
+
+def print_near_duplicate_report(report: Dict, top: int = 5):
+    """Print the headline numbers of a near-duplicate report"""
+    print(f"   Near-duplicates (Jaccard ≥ {report['threshold']}, {report['bands']} bands × {report['rows']} rows): "
+          f"{report['duplicates']} dropped in {report['clusters']} clusters, {report['kept']} kept "
+          f"({report['duplicate_rate']:.1%})")
+    for cluster in report['largest_clusters'][:top]:
+        print(f"   - {cluster['representative']}: {cluster['size']} dialogues")
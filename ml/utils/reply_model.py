@@ -0,0 +1,235 @@
+"""
+Reply Model
+Word n-gram model of user replies, conditioned on the assistant intent and concern
+"""
+
+import hashlib
+import json
+import random
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .dialogue_store import PathLike
+from .template_sampler import AliasTable
+
+# Bump when the saved layout changes
+REPLY_MODEL_VERSION = 1
+
+# Padding token before the first word of a reply
+START = '<s>'
+
+# Outcome token ending a reply
+END = -1
+
+# Context key meaning "any intent" or "any concern"
+ANY = '*'
+
+
+def reply_examples(dialogue: Dict) -> Iterator[Tuple[str, Optional[str], str]]:
+    """``(assistant intent, concern, user reply)`` for each user turn answering an assistant turn
+
+    Dialogues a clinician reviewed and did not approve are skipped.
+    """
+    labels = dialogue.get('labels') or {}
+    if labels.get('clinician_reviewed') and not labels.get('clinician_approved'):
+        return
+    concern = (dialogue.get('user_profile') or {}).get('concern')
+    previous = None
+    for message in dialogue.get('messages', []):
+        if message.get('role') == 'user' and previous and (message.get('text') or '').strip():
+            yield previous, concern, message['text']
+        previous = message.get('intent') if message.get('role') == 'assistant' else None
+
+
+class ReplyModel:
+    """Markov chain over words, one chain per (intent, concern) context
+
+    Each context is trained on its own replies plus, down-weighted by
+    ``backoff``, replies sharing only its intent or only its concern and, by
+    ``backoff ** 2``, every other reply. Sparse contexts therefore still have
+    somewhere to go at each word, which is where new replies come from.
+
+    Every state (context plus the last ``order - 1`` words) owns a group in an
+    alias table, so each word costs one O(1) draw. ``sample`` advances a
+    whole batch of replies one word per step.
+    """
+
+    def __init__(self, order: int, max_tokens: int, tokens: List[str], contexts: List[Tuple[str, str]],
+                 start_state: np.ndarray, table: AliasTable, outcome_token: np.ndarray,
+                 outcome_next: np.ndarray):
+        self.order = order
+        self.max_tokens = max_tokens
+        self.tokens = tokens
+        self.contexts = contexts
+        self.context_codes = {context: code for code, context in enumerate(contexts)}
+        self.start_state = start_state
+        self.table = table
+        self.outcome_token = outcome_token
+        self.outcome_next = outcome_next
+        self.token_objects = np.array(tokens, dtype=object)
+        self._texts = {}
+
+    @classmethod
+    def train(cls, examples: Iterable[Tuple[str, Optional[str], str]], order: int = 3,
+              backoff: float = 0.1, max_tokens: int = 40) -> 'ReplyModel':
+        """Fit from ``(intent, concern, text)`` examples; concern may be None"""
+        # N-gram counts per (intent, concern) group, counted once
+        start = (START,) * (order - 1)
+        vocab = {}
+        group_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        for intent, concern, text in examples:
+            history = start
+            for word in text.split() + [None]:
+                token = END if word is None else vocab.setdefault(word, len(vocab))
+                group_counts[(intent, concern)][history][token] += 1.0
+                if order > 1:
+                    history = history[1:] + (word,)
+        if not group_counts:
+            raise ValueError("No user replies to train on")
+
+        contexts = [(ANY, ANY)]
+        contexts += sorted({(intent, ANY) for intent, _ in group_counts})
+        contexts += sorted({(intent, concern) for intent, concern in group_counts if concern is not None})
+
+        # Each context mixes every group, weighted by how far the group is from it
+        states = {}
+        counts = []
+        start_state = []
+        for context in contexts:
+            context_intent, context_concern = context
+            start_state.append(cls._state(states, counts, context, start))
+            for (intent, concern), histories in group_counts.items():
+                mismatches = (context_intent not in (ANY, intent)) + (context_concern not in (ANY, concern))
+                weight = backoff ** mismatches
+                if not weight:
+                    continue
+                for history, following in histories.items():
+                    state_counts = counts[cls._state(states, counts, context, history)]
+                    for token, count in following.items():
+                        state_counts[token] += weight * count
+
+        # One alias group per state; each outcome also records the state it leads to
+        tokens = list(vocab)
+        groups, outcome_token, outcome_next = [], [], []
+        for (context, history), state in states.items():
+            groups.append(list(counts[state].values()))
+            for token in counts[state]:
+                outcome_token.append(token)
+                if token == END:
+                    outcome_next.append(-1)
+                else:
+                    following = history[1:] + (tokens[token],) if order > 1 else history
+                    outcome_next.append(states[(context, following)])
+
+        return cls(order, max_tokens, tokens, contexts, np.array(start_state, dtype=np.int64),
+                   AliasTable(groups), np.array(outcome_token, dtype=np.int64),
+                   np.array(outcome_next, dtype=np.int64))
+
+    @staticmethod
+    def _state(states: Dict, counts: List, context: Tuple[str, str], history: Tuple) -> int:
+        key = (context, history)
+        state = states.get(key)
+        if state is None:
+            state = states[key] = len(counts)
+            counts.append(defaultdict(float))
+        return state
+
+    def context(self, intent: Optional[str], concern: Optional[str]) -> int:
+        """Most specific trained context for an intent and concern"""
+        for key in ((intent, concern), (intent, ANY), (ANY, ANY)):
+            code = self.context_codes.get(key)
+            if code is not None:
+                return code
+        return 0
+
+    def sample(self, rng: np.random.Generator, contexts: Sequence[int]) -> List[str]:
+        """One reply per context code, all advanced together a word at a time"""
+        contexts = np.asarray(contexts, dtype=np.int64)
+        n = len(contexts)
+        words = np.full((n, self.max_tokens), END, dtype=np.int64)
+        state = self.start_state[contexts]
+        active = np.arange(n)
+        for step in range(self.max_tokens):
+            if not len(active):
+                break
+            k = self.table.sample(rng, state[active])
+            words[active, step] = self.outcome_token[k]
+            state[active] = self.outcome_next[k]
+            active = active[state[active] >= 0]
+        return [self._text(row) for row in words]
+
+    def _text(self, row: np.ndarray) -> str:
+        """Reply text for a row of word codes, shared between identical replies"""
+        key = row.tobytes()
+        text = self._texts.get(key)
+        if text is None:
+            text = self._texts[key] = ' '.join(self.token_objects[row[row != END]].tolist())
+        return text
+
+    def generate(self, rng: random.Random, intent: Optional[str], concern: Optional[str]) -> str:
+        """One reply drawn word by word from a ``random.Random`` (reference for ``sample``)"""
+        state = int(self.start_state[self.context(intent, concern)])
+        words = []
+        for _ in range(self.max_tokens):
+            size = int(self.table.sizes[state])
+            k = int(self.table.offsets[state]) + int(rng.random() * size)
+            if rng.random() >= self.table.prob[k]:
+                k = int(self.table.alias[k])
+            token = int(self.outcome_token[k])
+            state = int(self.outcome_next[k])
+            if token == END:
+                break
+            words.append(self.tokens[token])
+        return ' '.join(words)
+
+    def _meta(self) -> Dict:
+        return {
+            'version': REPLY_MODEL_VERSION,
+            'order': self.order,
+            'max_tokens': self.max_tokens,
+            'tokens': self.tokens,
+            'contexts': [list(context) for context in self.contexts],
+        }
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'start_state': self.start_state,
+            'sizes': self.table.sizes,
+            'prob': self.table.prob,
+            'alias': self.table.alias,
+            'outcome_token': self.outcome_token,
+            'outcome_next': self.outcome_next,
+        }
+
+    @property
+    def digest(self) -> str:
+        """Content hash, recorded with corpora generated from this model"""
+        digest = hashlib.sha256(json.dumps(self._meta(), ensure_ascii=False).encode('utf-8'))
+        for name, values in self._arrays().items():
+            digest.update(name.encode('utf-8'))
+            digest.update(np.ascontiguousarray(values).tobytes())
+        return digest.hexdigest()[:16]
+
+    def save(self, path: PathLike):
+        """Write the model as one ``.npz`` file; loading it needs no retraining"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(self._meta(), ensure_ascii=False)), **self._arrays())
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: PathLike) -> 'ReplyModel':
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != REPLY_MODEL_VERSION:
+                raise ValueError(f"{path}: reply model version {meta.get('version')}, "
+                                 f"expected {REPLY_MODEL_VERSION}; retrain it")
+            return cls(meta['order'], meta['max_tokens'], meta['tokens'],
+                       [tuple(context) for context in meta['contexts']], data['start_state'],
+                       AliasTable.from_arrays(data['sizes'], data['prob'], data['alias']),
+                       data['outcome_token'], data['outcome_next'])
@@ -0,0 +1,162 @@
+"""
+Review Join
+Out-of-core join of a dialogue corpus with any number of clinician review files
+"""
+
+import json
+from itertools import groupby
+from typing import Dict, Iterator, Mapping, Optional, Sequence, Tuple
+
+import msgspec
+from msgspec import UNSET
+
+from .dialogue_model import Dialogue, DialogueLabels
+from .dialogue_store import PathLike
+from .external_sort import DEFAULT_BUFFER_SIZE, ExternalSorter
+from .schemas import REVIEW_DECODER, REVIEW_STATUSES, Review, iter_raw_dialogues, iter_reviews
+
+# How the review kept for a dialogue reviewed more than once is chosen
+LATEST = 'latest'
+PRIORITY = 'priority'
+RESOLUTIONS = [LATEST, PRIORITY]
+
+UNREVIEWED = 'unreviewed'
+PARTITIONS = REVIEW_STATUSES + [UNREVIEWED]
+
+
+class _DialogueKey(msgspec.Struct):
+    dialogue_id: object = None
+
+
+_KEY_DECODER = msgspec.json.Decoder(_DialogueKey)
+
+
+def _dialogue_id(raw: bytes) -> str:
+    dialogue_id = _KEY_DECODER.decode(raw).dialogue_id
+    return dialogue_id if isinstance(dialogue_id, str) else ''
+
+
+def review_rank(review: Review, source: int, sequence: int, resolution: str = LATEST,
+                reviewer_priority: Sequence[str] = ()) -> tuple:
+    """Sort key of a review among others of the same dialogue; the highest one is kept
+
+    ``latest`` keeps the most recent ``reviewed_at`` (undated reviews count
+    as oldest). ``priority`` keeps the review by the reviewer listed first
+    in ``reviewer_priority`` (unlisted reviewers last), then the most recent.
+    Remaining ties go to the later file, then the later review in it.
+    """
+    reviewed_at = review.reviewed_at if review.reviewed_at is not UNSET else ''
+    if resolution == PRIORITY:
+        reviewer = review.reviewer if review.reviewer is not UNSET else None
+        priority = (len(reviewer_priority) - list(reviewer_priority).index(reviewer)
+                    if reviewer in reviewer_priority else 0)
+        return priority, reviewed_at, source, sequence
+    return reviewed_at, source, sequence
+
+
+def resolved_reviews(review_files: Sequence[PathLike], resolution: str = LATEST,
+                     reviewer_priority: Sequence[str] = (), buffer_size: int = DEFAULT_BUFFER_SIZE,
+                     tmp_dir: Optional[PathLike] = None) -> Iterator[Tuple[str, bytes]]:
+    """One ``(dialogue_id, review JSON)`` per reviewed dialogue, in ``dialogue_id`` order
+
+    Reviews of every file are externally sorted by dialogue and rank, so
+    the review set may be larger than memory; the last review of each
+    dialogue's run is the one kept.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"unknown resolution {resolution!r} (expected one of {RESOLUTIONS})")
+    with ExternalSorter(buffer_size, tmp_dir) as sorter:
+        for source, path in enumerate(review_files):
+            for sequence, (raw, review) in enumerate(iter_reviews(path)):
+                rank = review_rank(review, source, sequence, resolution, reviewer_priority)
+                sorter.add((review.dialogue_id, *rank), raw)
+        for dialogue_id, records in groupby(sorter, key=lambda record: record[0][0]):
+            *_, (_, raw) = records
+            yield dialogue_id, raw
+
+
+def _copy(writer, raw: bytes):
+    """Write a dialogue's raw JSON unchanged (re-encoded if it spans lines, as in legacy corpora)"""
+    if b'\n' in raw:
+        writer.write(json.loads(raw))
+    else:
+        writer.write_encoded(raw.decode('utf-8'))
+
+
+def mark_reviewed(dialogue: Dialogue, review: Review):
+    """Record a review's outcome in a dialogue's labels"""
+    if dialogue.labels is None:
+        dialogue.labels = DialogueLabels.from_dict({})
+    labels = dialogue.labels
+    labels.set_extra('clinician_reviewed', True)
+    labels.set_extra('clinician_approved', review.status == 'approved')
+    labels.set_extra('review_status', review.status)
+    if review.reviewed_at is not UNSET:
+        labels.set_extra('reviewed_at', review.reviewed_at)
+
+
+def join_reviews(corpus_file: PathLike, review_files: Sequence[PathLike], outputs: Mapping[str, object],
+                 resolution: str = LATEST, reviewer_priority: Sequence[str] = (),
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, tmp_dir: Optional[PathLike] = None) -> Dict[str, int]:
+    """Route every dialogue of a corpus to the output of its review status, in corpus order
+
+    ``outputs`` maps partitions (``approved``, ``needs_revision``,
+    ``rejected``, ``unreviewed``) to ``DialogueWriter``s; a partition left
+    out is only counted, and one writer may take several partitions.
+    Reviewed dialogues are marked in their labels (rejected ones are
+    written as they are), unreviewed ones are copied unchanged.
+
+    Nothing grows with the corpus or the review set: reviews are resolved
+    with an external sort by ``dialogue_id``, merge-joined against the
+    corpus' sorted ids, and the matches sorted back into corpus order, so
+    the corpus is streamed twice and each dialogue is read once per pass.
+    Returns the size of each partition plus ``orphaned``, the number of
+    reviewed dialogues missing from the corpus.
+    """
+    counts = {partition: 0 for partition in PARTITIONS}
+    counts['orphaned'] = 0
+
+    with ExternalSorter(buffer_size, tmp_dir) as corpus_ids, ExternalSorter(buffer_size, tmp_dir) as matches:
+        for position, raw in enumerate(iter_raw_dialogues(corpus_file)):
+            corpus_ids.add((_dialogue_id(raw), position))
+
+        # Merge join: both sides in dialogue_id order; a repeated id gets the review on every copy
+        dialogues = iter(corpus_ids)
+        current = next(dialogues, None)
+        for dialogue_id, review in resolved_reviews(review_files, resolution, reviewer_priority,
+                                                    buffer_size, tmp_dir):
+            while current is not None and current[0][0] < dialogue_id:
+                current = next(dialogues, None)
+            if current is None or current[0][0] != dialogue_id:
+                counts['orphaned'] += 1
+                continue
+            while current is not None and current[0][0] == dialogue_id:
+                matches.add((current[0][1],), review)
+                current = next(dialogues, None)
+        dialogues.close()
+        corpus_ids.close()
+
+        reviewed = iter(matches)
+        match = next(reviewed, None)
+        for position, raw in enumerate(iter_raw_dialogues(corpus_file)):
+            if match is None or match[0][0] != position:
+                counts[UNREVIEWED] += 1
+                writer = outputs.get(UNREVIEWED)
+                if writer is not None:
+                    _copy(writer, raw)
+                continue
+
+            review = REVIEW_DECODER.decode(match[1])
+            match = next(reviewed, None)
+            counts[review.status] += 1
+            writer = outputs.get(review.status)
+            if writer is None:
+                continue
+            if review.status == 'rejected':
+                _copy(writer, raw)
+                continue
+            dialogue = Dialogue.from_dict(json.loads(raw))
+            mark_reviewed(dialogue, review)
+            writer.write(dialogue.to_dict())
+
+    return counts
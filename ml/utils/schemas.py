@@ -0,0 +1,260 @@
+"""
+Record Schemas
+Typed msgspec structs for dialogues, messages, labels and reviews, validated while decoding
+"""
+
+from pathlib import Path
+from typing import Annotated, Iterator, List, Literal, Optional, Tuple, Union
+
+import msgspec
+from msgspec import UNSET, Meta, Raw, Struct, UnsetType
+
+from .compression import open_binary
+from .dialogue_model import INTENT_LABELS, RISK_LEVEL_LABELS, SENTIMENT_LABELS, SESSION_TYPES
+from .dialogue_store import PathLike, is_jsonl_corpus
+
+REVIEW_STATUSES = ['approved', 'needs_revision', 'rejected']
+
+Intent = Literal[tuple(INTENT_LABELS)]
+Sentiment = Literal[tuple(SENTIMENT_LABELS)]
+RiskLevel = Literal[tuple(RISK_LEVEL_LABELS)]
+SessionType = Literal[tuple(SESSION_TYPES)]
+ReviewStatus = Literal[tuple(REVIEW_STATUSES)]
+
+NonBlank = Annotated[str, Meta(pattern=r'\S')]
+MoodScore = Union[Annotated[int, Meta(ge=1, le=10)], Annotated[float, Meta(ge=1, le=10)]]
+
+
+class SchemaError(ValueError):
+    """A record that doesn't match its schema; ``path`` locates the bad field"""
+
+    def __init__(self, source: str, index: Optional[int], error: msgspec.ValidationError):
+        self.source = source
+        self.index = index
+        self.detail = str(error)
+        where = f"{source}[{index}]" if index is not None else source
+        super().__init__(f"{where}: {self.detail}")
+
+    @property
+    def path(self) -> Optional[str]:
+        """JSON path of the offending field, e.g. ``$.messages[1].intent``"""
+        marker = ' - at `'
+        if marker not in self.detail:
+            return None
+        return self.detail.split(marker, 1)[1].rstrip('`')
+
+
+class UserMessage(Struct, tag_field='role', tag='user'):
+    text: NonBlank
+    timestamp: Union[str, UnsetType] = UNSET
+    intent: Union[str, UnsetType] = UNSET
+    sentiment: Union[str, UnsetType] = UNSET
+    risk_level: Union[str, UnsetType] = UNSET
+
+
+class AssistantMessage(Struct, tag_field='role', tag='assistant'):
+    text: NonBlank
+    timestamp: Union[str, UnsetType] = UNSET
+    intent: Union[Intent, UnsetType] = UNSET
+    sentiment: Union[Sentiment, UnsetType] = UNSET
+    risk_level: Union[RiskLevel, UnsetType] = UNSET
+
+
+Message = Union[UserMessage, AssistantMessage]
+
+
+class UserProfile(Struct):
+    concern: str
+    age_range: Union[str, UnsetType] = UNSET
+    mood_score: Union[MoodScore, UnsetType] = UNSET
+
+
+class DialogueLabels(Struct):
+    primary_intent: Union[Intent, UnsetType] = UNSET
+    overall_sentiment: Union[str, UnsetType] = UNSET
+    max_risk_level: Union[str, UnsetType] = UNSET
+    therapeutic_technique: Union[str, UnsetType] = UNSET
+
+
+class Dialogue(Struct):
+    dialogue_id: str
+    session_type: SessionType
+    messages: Annotated[List[Message], Meta(min_length=2)]
+    user_profile: UserProfile
+    labels: Union[DialogueLabels, UnsetType] = UNSET
+
+
+class GeneratedDialogue(Struct):
+    """What an LLM is asked to return; ids and the user profile are added locally"""
+    messages: Annotated[List[Message], Meta(min_length=2)]
+    labels: DialogueLabels
+
+
+class Label(Struct):
+    intent: Intent
+    sentiment: Sentiment
+    risk_level: RiskLevel
+    item_id: Union[str, UnsetType] = UNSET
+    text: Union[str, UnsetType] = UNSET
+    labeled_at: Union[str, UnsetType] = UNSET
+    notes: Union[str, UnsetType] = UNSET
+
+
+class ReviewNote(Struct):
+    note: str
+    timestamp: Union[str, UnsetType] = UNSET
+
+
+class Review(Struct):
+    dialogue_id: str
+    status: ReviewStatus
+    reviewed_at: Union[str, UnsetType] = UNSET
+    reviewer: Union[str, UnsetType] = UNSET
+    feedback: Union[str, UnsetType] = UNSET
+    notes: Union[List[ReviewNote], UnsetType] = UNSET
+
+
+class _CorpusDocument(Struct):
+    dialogues: List[Raw] = []
+
+
+class _LabelsDocument(Struct):
+    labels: List[Raw] = []
+
+
+class _ReviewsDocument(Struct):
+    reviews: List[Review] = []
+
+
+class _RawReviewsDocument(Struct):
+    reviews: List[Raw] = []
+
+
+DIALOGUE_DECODER = msgspec.json.Decoder(Dialogue)
+LABEL_DECODER = msgspec.json.Decoder(Label)
+REVIEW_DECODER = msgspec.json.Decoder(Review)
+GENERATED_DIALOGUE_DECODER = msgspec.json.Decoder(GeneratedDialogue)
+
+Checked = Tuple[bytes, Optional[Struct], Optional[msgspec.ValidationError]]
+
+
+def _check(raw: bytes, decoder: msgspec.json.Decoder) -> Checked:
+    try:
+        return raw, decoder.decode(raw), None
+    except msgspec.ValidationError as e:
+        return raw, None, e
+
+
+def _read(file_path: PathLike) -> bytes:
+    with open_binary(file_path) as f:
+        return f.read()
+
+
+def iter_raw_dialogues(file_path: PathLike) -> Iterator[bytes]:
+    """Raw JSON of every dialogue in a corpus, undecoded
+
+    Lines of a JSONL corpus are only split, not parsed, so records can be
+    handed to worker processes that decode them.
+    """
+    if is_jsonl_corpus(file_path):
+        with open_binary(file_path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        return
+
+    document = msgspec.json.decode(_read(file_path), type=_CorpusDocument)
+    for raw in document.dialogues:
+        yield bytes(raw)
+
+
+def check_dialogue(raw: bytes) -> Checked:
+    """Decode and validate one dialogue's raw JSON"""
+    try:
+        return _check(raw, DIALOGUE_DECODER)
+    except msgspec.DecodeError as e:
+        raise ValueError(f"invalid dialogue record ({e})") from e
+
+
+def iter_checked_dialogues(file_path: PathLike) -> Iterator[Checked]:
+    """Decode and validate every dialogue of a corpus in one pass
+
+    Yields ``(raw_json, dialogue, error)``: a typed ``Dialogue`` when the
+    record is valid, otherwise the schema error (with its JSON path). Raw
+    bytes are kept so invalid records can still be inspected.
+    """
+    if is_jsonl_corpus(file_path):
+        with open_binary(file_path) as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield _check(line, DIALOGUE_DECODER)
+                except msgspec.DecodeError as e:
+                    raise ValueError(f"{file_path}:{line_number}: invalid dialogue record ({e})") from e
+        return
+
+    for raw in iter_raw_dialogues(file_path):
+        yield _check(raw, DIALOGUE_DECODER)
+
+
+def iter_raw_labels(file_path: PathLike) -> Iterator[bytes]:
+    """Raw JSON of every label in a labels file (``{"labels": [...]}`` or JSONL), undecoded"""
+    if is_jsonl_corpus(file_path):
+        with open_binary(file_path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        return
+
+    document = msgspec.json.decode(_read(file_path), type=_LabelsDocument)
+    for raw in document.labels:
+        yield bytes(raw)
+
+
+def check_label(raw: bytes) -> Checked:
+    """Decode and validate one label's raw JSON"""
+    return _check(raw, LABEL_DECODER)
+
+
+def iter_checked_labels(file_path: PathLike) -> Iterator[Checked]:
+    """Decode and validate every label of a labels file in one pass"""
+    for raw in iter_raw_labels(file_path):
+        yield check_label(raw)
+
+
+def load_reviews(file_path: PathLike) -> List[Review]:
+    """Load a reviews file as typed records, rejecting malformed reviews"""
+    if is_jsonl_corpus(file_path):
+        return [review for _, review in iter_reviews(file_path)]
+    try:
+        return msgspec.json.decode(_read(file_path), type=_ReviewsDocument).reviews
+    except msgspec.ValidationError as e:
+        raise SchemaError(Path(file_path).name, None, e) from e
+
+
+def iter_raw_reviews(file_path: PathLike) -> Iterator[bytes]:
+    """Raw JSON of every review in a reviews file (``{"reviews": [...]}`` or JSONL), undecoded"""
+    if is_jsonl_corpus(file_path):
+        with open_binary(file_path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        return
+
+    document = msgspec.json.decode(_read(file_path), type=_RawReviewsDocument)
+    for raw in document.reviews:
+        yield bytes(raw)
+
+
+def iter_reviews(file_path: PathLike) -> Iterator[Tuple[bytes, Review]]:
+    """Every review of a reviews file with its raw JSON, one at a time, rejecting malformed reviews"""
+    for index, raw in enumerate(iter_raw_reviews(file_path)):
+        try:
+            yield raw, REVIEW_DECODER.decode(raw)
+        except msgspec.ValidationError as e:
+            raise SchemaError(Path(file_path).name, index, e) from e
@@ -0,0 +1,154 @@
+"""
+Template Sampler
+Alias tables and pre-rendered slot tables for drawing synthetic texts in batches
+"""
+
+import gc
+import sys
+from contextlib import contextmanager
+from itertools import product
+from string import Formatter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class AliasTable:
+    """Walker/Vose alias tables for one or more categorical distributions
+
+    Each group is a separate distribution; its entries get consecutive global
+    indices. Drawing is O(1) per sample and vectorized over any mix of groups.
+    """
+
+    def __init__(self, groups: Sequence[Sequence[float]]):
+        sizes = [len(weights) for weights in groups]
+        if not sizes or min(sizes) == 0:
+            raise ValueError("Every group needs at least one weight")
+
+        self.sizes = np.array(sizes, dtype=np.int64)
+        self.offsets = np.cumsum(self.sizes) - self.sizes
+        self.prob = np.ones(int(self.sizes.sum()))
+        self.alias = np.arange(int(self.sizes.sum()), dtype=np.int64)
+        for offset, weights in zip(self.offsets.tolist(), groups):
+            self._build(offset, np.asarray(weights, dtype=float))
+
+    def _build(self, offset: int, weights: np.ndarray):
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError("Weights must sum to a positive value")
+        scaled = (weights * len(weights) / total).tolist()
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[offset + s] = scaled[s]
+            self.alias[offset + s] = offset + l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Whatever is left only misses 1.0 by rounding error, so keeps prob 1
+
+    @classmethod
+    def single(cls, weights: Sequence[float]) -> 'AliasTable':
+        return cls([weights])
+
+    @classmethod
+    def from_arrays(cls, sizes: np.ndarray, prob: np.ndarray, alias: np.ndarray) -> 'AliasTable':
+        """Rebuild saved tables without recomputing them"""
+        table = cls.__new__(cls)
+        table.sizes = np.asarray(sizes, dtype=np.int64)
+        table.offsets = np.cumsum(table.sizes) - table.sizes
+        table.prob = np.asarray(prob, dtype=float)
+        table.alias = np.asarray(alias, dtype=np.int64)
+        return table
+
+    def sample(self, rng: np.random.Generator, groups) -> np.ndarray:
+        """Draw one global entry index per element of ``groups``"""
+        groups = np.asarray(groups, dtype=np.int64)
+        k = self.offsets[groups] + (rng.random(groups.shape) * self.sizes[groups]).astype(np.int64)
+        return np.where(rng.random(groups.shape) < self.prob[k], k, self.alias[k])
+
+    def sample_one(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Draw ``size`` indices from the first group (local == global there)"""
+        return self.sample(rng, np.zeros(size, dtype=np.int64))
+
+
+def slot_names(template: str) -> List[str]:
+    """Distinct ``{slot}`` names used by a format template, in order"""
+    names = []
+    for _, name, _, _ in Formatter().parse(template):
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def render_variants(template: str, fillers: Optional[Dict[str, List[str]]] = None) -> List[str]:
+    """Every text a template can produce, one per combination of its slot fillers"""
+    names = slot_names(template)
+    if not names:
+        return [template.format()]
+    fillers = fillers or {}
+    return [
+        template.format(**dict(zip(names, values)))
+        for values in product(*(fillers[name] for name in names))
+    ]
+
+
+class SlotTable:
+    """Templates grouped by key, pre-rendered against their slot fillers
+
+    Drawing a uniform template and then a uniform filler for each slot is the
+    same as drawing one rendered text with weight ``1 / templates / variants``,
+    so a whole batch of texts takes a single alias-table draw. Texts are
+    interned and shared between every dialogue that uses them.
+    """
+
+    def __init__(self, templates: Dict[str, List[str]], fillers: Optional[Dict[str, List[str]]] = None,
+                 fallback: Optional[str] = None):
+        self.keys = list(templates)
+        self.codes = {key: code for code, key in enumerate(self.keys)}
+        self.fallback = self.codes[fallback] if fallback is not None else None
+        self.texts = []
+        groups = []
+        for key in self.keys:
+            weights = []
+            for template in templates[key]:
+                variants = render_variants(template, fillers)
+                for text in variants:
+                    self.texts.append(sys.intern(text))
+                    weights.append(1.0 / len(templates[key]) / len(variants))
+            groups.append(weights)
+        self.table = AliasTable(groups)
+        # Object array view of the texts for gathering a batch with one index
+        self.objects = np.array(self.texts, dtype=object)
+
+    def code(self, key: str) -> int:
+        """Group for a key; unknown keys use the fallback group"""
+        code = self.codes.get(key, self.fallback)
+        if code is None:
+            raise KeyError(key)
+        return code
+
+    def sample(self, rng: np.random.Generator, codes) -> np.ndarray:
+        """Draw one text index (into ``texts``) per group code"""
+        return self.table.sample(rng, codes)
+
+
+def object_array(items: List) -> np.ndarray:
+    """1-d object array of the given items (dicts included, which np.array would inspect)"""
+    return np.fromiter(items, dtype=object, count=len(items))
+
+
+@contextmanager
+def gc_paused():
+    """Suspend cyclic garbage collection while building many acyclic containers
+
+    A batch of dialogues allocates ~10 dicts/lists per dialogue; without this,
+    every generation-0 collection rescans them though none can form a cycle.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
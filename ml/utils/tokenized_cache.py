@@ -0,0 +1,165 @@
+"""
+Tokenized Dataset Cache
+Content-addressed on-disk cache of tokenized train/test splits
+"""
+
+import hashlib
+import json
+import re
+import shutil
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / '.cache' / 'tokenized'
+
+# Marker written last so half-written cache entries are never reused
+COMPLETE_MARKER = 'cache_info.json'
+
+
+def examples_hash(examples: List[Dict], fields: List[str]) -> str:
+    """Hash the fields of the examples that feed tokenization and splitting"""
+    digest = hashlib.sha256()
+    for example in examples:
+        digest.update(json.dumps([example.get(f) for f in fields], ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def resolve_revision(model_name: str, revision: str) -> str:
+    """Commit sha a Hub revision (a branch or tag such as ``main``) currently points to
+
+    Branches move, so keys are built from the commit instead. The Hub is
+    asked first; offline, the ref recorded in the local Hub cache is used.
+    A revision that already is a commit sha is returned unchanged.
+    """
+    if re.fullmatch(r'[0-9a-f]{40}', revision):
+        return revision
+
+    from huggingface_hub import HfApi, constants
+
+    try:
+        return HfApi().model_info(model_name, revision=revision).sha
+    except OSError:
+        ref = Path(constants.HF_HUB_CACHE) / f"models--{model_name.replace('/', '--')}" / 'refs' / revision
+        if ref.exists():
+            return ref.read_text().strip()
+        raise
+
+
+def tokenization_settings_key(tokenizer_name: str, tokenizer_revision: str,
+                              max_length: int, truncation: bool, padding) -> str:
+    """Key covering everything that changes how a single text is tokenized"""
+    payload = json.dumps({
+        'tokenizer': tokenizer_name,
+        'revision': tokenizer_revision,
+        'max_length': max_length,
+        'truncation': truncation,
+        'padding': padding,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def tokenized_cache_key(corpus_digest: str, settings_key: str,
+                        split_seed: int, test_size: float, label_map: Optional[Dict] = None) -> str:
+    """Cache key covering everything that changes the tokenized splits
+
+    ``label_map`` maps label names to the ids stored in the splits' label column.
+    """
+    payload = json.dumps({
+        'corpus': corpus_digest,
+        'settings': settings_key,
+        'labels': label_map,
+        'split_seed': split_seed,
+        'test_size': test_size,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def tokenize_incremental(texts: List[str], tokenize_batch: Callable[[List[str]], Dict],
+                         settings_key: str, cache_dir: Optional[Path] = None) -> Dict[str, list]:
+    """Tokenize texts, running the tokenizer only on texts it hasn't seen
+
+    Encodings are kept per text hash in a Parquet store for each set of
+    tokenization settings, so a corpus change only costs tokenizing the
+    added or edited messages. Returns encoded columns aligned with ``texts``.
+    """
+    if not texts:
+        return {}
+
+    store_path = Path(cache_dir or DEFAULT_CACHE_DIR) / 'texts' / f'{settings_key}.parquet'
+    store = pq.read_table(store_path) if store_path.exists() else None
+    positions = {h: i for i, h in enumerate(store['text_hash'].to_pylist())} if store is not None else {}
+
+    hashes = [hashlib.sha256(text.encode('utf-8')).hexdigest() for text in texts]
+    missing = {}
+    for text_hash, text in zip(hashes, texts):
+        if text_hash not in positions and text_hash not in missing:
+            missing[text_hash] = text
+
+    print(f"   Token store: {len(texts) - len(missing)} texts reused, {len(missing)} to tokenize")
+
+    dirty = bool(missing)
+    if missing:
+        encoded = tokenize_batch(list(missing.values()))
+        fresh = pa.table({'text_hash': list(missing), **{k: list(v) for k, v in encoded.items()}})
+        offset = store.num_rows if store is not None else 0
+        store = fresh if store is None else pa.concat_tables([store, fresh.cast(store.schema)])
+        positions.update({text_hash: offset + i for i, text_hash in enumerate(missing)})
+
+    rows = store.take([positions[h] for h in hashes])
+
+    # Drop encodings of texts that left the corpus once they dominate the store
+    in_use = sorted({positions[h] for h in hashes})
+    if store.num_rows > 2 * len(in_use):
+        store = store.take(in_use)
+        dirty = True
+
+    if dirty:
+        store_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = store_path.with_suffix('.tmp')
+        pq.write_table(store, tmp_path)
+        tmp_path.replace(store_path)
+
+    return rows.drop(['text_hash']).to_pydict()
+
+
+def load_tokenized_splits(cache_key: str, cache_dir: Optional[Path] = None) -> Optional[Tuple]:
+    """Return memory-mapped (train, test) datasets for a key, or None on a miss"""
+    entry = Path(cache_dir or DEFAULT_CACHE_DIR) / cache_key
+    if not (entry / COMPLETE_MARKER).exists():
+        return None
+
+    from datasets import load_from_disk
+
+    splits = load_from_disk(str(entry / 'splits'))
+    return splits['train'], splits['test']
+
+
+def save_tokenized_splits(cache_key: str, train_dataset, test_dataset,
+                          cache_dir: Optional[Path] = None, metadata: Optional[Dict] = None) -> Path:
+    """Store tokenized splits as Arrow shards under the cache key"""
+    from datasets import DatasetDict
+
+    entry = Path(cache_dir or DEFAULT_CACHE_DIR) / cache_key
+    if entry.exists():
+        shutil.rmtree(entry)
+    entry.mkdir(parents=True)
+
+    DatasetDict({'train': train_dataset, 'test': test_dataset}).save_to_disk(str(entry / 'splits'))
+
+    with open(entry / COMPLETE_MARKER, 'w', encoding='utf-8') as f:
+        json.dump({
+            'cache_key': cache_key,
+            'created_at': datetime.now().isoformat(),
+            'train_rows': len(train_dataset),
+            'test_rows': len(test_dataset),
+            **(metadata or {}),
+        }, f, indent=2)
+
+    return entry
@@ -0,0 +1,510 @@
+"""
+Validation
+Chunked, multi-process record validation with streamed, capped diagnostics
+"""
+
+import hashlib
+import inspect
+import json
+import math
+import random
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from statistics import NormalDist
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .dialogue_store import PathLike
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# (severity, rule, record index or None for file-level checks, message)
+# Messages don't name the record, so the same result holds wherever it sits
+Diagnostic = Tuple[str, str, Optional[int], str]
+
+# Records validated per task handed to a worker
+DEFAULT_CHUNK_SIZE = 20000
+
+# Bump when the validation cache layout changes
+CACHE_VERSION = 1
+
+# Rule results of one record: (severity, rule, message) for each diagnostic
+RecordResult = List[Tuple[str, str, str]]
+
+
+class RuleReport:
+    """Diagnostics raised by validation rules over one chunk of records
+
+    Every diagnostic is counted per (severity, rule); only the first
+    ``keep`` of each severity are retained, so a chunk of broken records
+    stays small. ``start`` is the index of the chunk's first record.
+    """
+
+    def __init__(self, keep: Optional[int] = None, start: int = 0):
+        self.keep = keep
+        self.start = start
+        self.diagnostics: List[Diagnostic] = []
+        self.counts: Counter = Counter()
+        self.kept: Counter = Counter()
+
+    def error(self, rule: str, index: Optional[int], message: str):
+        self._add(ERROR, rule, index, message)
+
+    def warning(self, rule: str, index: Optional[int], message: str):
+        self._add(WARNING, rule, index, message)
+
+    def _add(self, severity: str, rule: str, index: Optional[int], message: str):
+        self.counts[(severity, rule)] += 1
+        if self.keep is None or self.kept[severity] < self.keep:
+            self.kept[severity] += 1
+            self.diagnostics.append((severity, rule, index, message))
+
+    def error_count(self) -> int:
+        return sum(count for (severity, _), count in self.counts.items() if severity == ERROR)
+
+    def mark(self) -> Tuple[int, Counter]:
+        """Point to roll back to with ``drop_since``"""
+        return len(self.diagnostics), self.counts.copy()
+
+    def drop_since(self, mark: Tuple[int, Counter]):
+        """Forget diagnostics raised after ``mark()``"""
+        kept, counts = mark
+        del self.diagnostics[kept:]
+        self.counts = counts
+        self.kept = Counter(severity for severity, _, _, _ in self.diagnostics)
+
+    def clear(self):
+        self.diagnostics.clear()
+        self.counts.clear()
+        self.kept.clear()
+
+
+class DiagnosticSink:
+    """Streams diagnostics as JSONL, up to a cap, and counts all of them per rule
+
+    Messages are prefixed with the record they belong to (e.g. ``Dialogue 12:``).
+    The first ``report_errors``/``report_warnings`` are also kept in memory
+    for the printed report; nothing else is, however many there are.
+    """
+
+    def __init__(self, path: Optional[PathLike] = None, cap: Optional[int] = None,
+                 report_errors: int = 20, report_warnings: int = 10, record_name: str = 'Record'):
+        self.path = Path(path) if path else None
+        self.cap = cap
+        self.record_name = record_name
+        self.report_limits = {ERROR: report_errors, WARNING: report_warnings}
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.counts: Counter = Counter()
+        self.written = 0
+        self._file = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'w', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def add_report(self, report: RuleReport):
+        """Take in a chunk's diagnostics (counts include any it did not retain)"""
+        self.counts.update(report.counts)
+        for diagnostic in report.diagnostics:
+            self._emit(*diagnostic)
+
+    def add(self, severity: str, rule: str, index: Optional[int], message: str):
+        self.counts[(severity, rule)] += 1
+        self._emit(severity, rule, index, message)
+
+    def error(self, rule: str, index: Optional[int], message: str):
+        self.add(ERROR, rule, index, message)
+
+    def warning(self, rule: str, index: Optional[int], message: str):
+        self.add(WARNING, rule, index, message)
+
+    def _emit(self, severity: str, rule: str, index: Optional[int], message: str):
+        if index is not None:
+            message = f"{self.record_name} {index}: {message}"
+        kept = self.errors if severity == ERROR else self.warnings
+        if len(kept) < self.report_limits[severity]:
+            kept.append(message)
+        if self._file is not None and (self.cap is None or self.written < self.cap):
+            self._file.write(json.dumps({'severity': severity, 'rule': rule, 'record': index,
+                                         'message': message}, ensure_ascii=False) + '\n')
+            self.written += 1
+
+    def retained_per_chunk(self) -> Optional[int]:
+        """Diagnostics of each severity a chunk must keep for this sink (None: all)"""
+        if self._file is not None and self.cap is None:
+            return None
+        return max(self.cap or 0, *self.report_limits.values())
+
+    @property
+    def error_count(self) -> int:
+        return sum(count for (severity, _), count in self.counts.items() if severity == ERROR)
+
+    @property
+    def warning_count(self) -> int:
+        return sum(count for (severity, _), count in self.counts.items() if severity == WARNING)
+
+    def rule_counts(self) -> Dict[str, Dict[str, int]]:
+        """``{severity: {rule: count}}``, most frequent rule first"""
+        summary = {ERROR: {}, WARNING: {}}
+        for (severity, rule), count in self.counts.most_common():
+            summary[severity][rule] = count
+        return summary
+
+
+def chunked(records: Iterable, size: int) -> Iterator[Tuple[int, List]]:
+    """``(index of the first record, records)`` for consecutive chunks"""
+    chunk, start = [], 0
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield start, chunk
+            start += size
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def map_chunks(fn: Callable, chunks: Iterable, workers: int = 1) -> Iterator:
+    """``fn`` over each chunk, in order, across a process pool
+
+    Only ``2 * workers`` chunks are read ahead of the one being returned, so
+    a corpus of any size is validated in bounded memory.
+    """
+    if workers <= 1:
+        yield from map(fn, chunks)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(fn, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def print_diagnostics(sink: DiagnosticSink):
+    """Errors and warnings section of a validation report"""
+    counts = sink.rule_counts()
+    for severity, kept, total, heading, clear in (
+            (ERROR, sink.errors, sink.error_count, '❌ ERRORS', '✅ No errors found'),
+            (WARNING, sink.warnings, sink.warning_count, '⚠️  WARNINGS', '✅ No warnings')):
+        if not total:
+            print(f"\n{clear}")
+            continue
+        print(f"\n{heading} ({total}):")
+        for message in kept:
+            print(f"  - {message}")
+        if total > len(kept):
+            print(f"  ... and {total - len(kept)} more {severity}s")
+        print("  By rule: " + ", ".join(f"{rule} {count}" for rule, count in counts[severity].items()))
+
+    if sink.path is not None:
+        capped = f" (capped at {sink.cap})" if sink.cap is not None and sink.written >= sink.cap else ""
+        print(f"\n📝 {sink.written} diagnostics written to: {sink.path}{capped}")
+
+
+def record_hash(raw: bytes) -> str:
+    """Content hash of one record's raw JSON"""
+    return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+
+def rules_version(*sources) -> str:
+    """Hash of the source code of rule classes and the modules they depend on
+
+    Editing any of them changes the version, which invalidates cached results.
+    """
+    digest = hashlib.sha256()
+    for source in sources:
+        digest.update(inspect.getsource(source).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def validation_cache_path(file_path: PathLike, cache_dir: Optional[PathLike] = None) -> Path:
+    """Cache location for a corpus' per-record validation results"""
+    source = Path(file_path)
+    cache_dir = Path(cache_dir) if cache_dir else source.parent / '.cache'
+    return cache_dir / f"{source.name}.validation.json"
+
+
+class ValidationCache:
+    """Rule results per record content hash, for one rules version
+
+    Results don't depend on a record's position, so a record that only moved
+    is not validated again. Saving keeps only the records seen in this run.
+    """
+
+    def __init__(self, path: PathLike, rules_version: str, entries: Optional[Dict[str, RecordResult]] = None):
+        self.path = Path(path)
+        self.rules_version = rules_version
+        self.entries = entries or {}
+        self.current: Dict[str, RecordResult] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: PathLike, rules_version: str) -> 'ValidationCache':
+        """Load cached results, or start empty if missing or from other rules"""
+        path = Path(path)
+        if not path.exists():
+            return cls(path, rules_version)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != CACHE_VERSION or data.get('rules_version') != rules_version:
+            return cls(path, rules_version)
+        return cls(path, rules_version, data.get('entries', {}))
+
+    def lookup(self, key: str) -> Optional[RecordResult]:
+        result = self.entries.get(key)
+        if result is not None:
+            self.current[key] = result
+            self.hits += 1
+        return result
+
+    def store(self, key: str, result: RecordResult):
+        self.current[key] = result
+        self.misses += 1
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CACHE_VERSION,
+                'rules_version': self.rules_version,
+                'entries': self.current,
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        tmp_path.replace(self.path)
+
+
+def validate_records(records: Iterable[bytes], check_chunk: Callable, sink: DiagnosticSink,
+                     stats=None, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     cache: Optional[ValidationCache] = None):
+    """Validate raw records in chunks, streaming diagnostics to ``sink`` in record order
+
+    ``check_chunk`` runs in the workers. It takes ``(start, records, keep,
+    check, with_stats)`` and returns ``(stats, RuleReport)``. It runs the rules
+    only on the offsets in ``check`` (all when None), and decodes the rest only
+    for stats. Partial stats are added to ``stats``, which is returned; pass
+    None to skip them. With a cache, records whose content was validated
+    before reuse their results, and only the rest are checked.
+    """
+    keep = sink.retained_per_chunk() if cache is None else None
+    with_stats = stats is not None
+    # Per-chunk record hashes and cached results, consumed in step with the results
+    pending = deque()
+
+    def tasks():
+        for start, chunk in chunked(records, chunk_size):
+            if cache is None:
+                yield start, chunk, keep, None, with_stats
+                continue
+            keys = [record_hash(raw) for raw in chunk]
+            cached = [cache.lookup(key) for key in keys]
+            check = {offset for offset, result in enumerate(cached) if result is None}
+            pending.append((keys, cached))
+            if not with_stats:
+                # Workers only need the records they check
+                chunk = [raw if offset in check else b'' for offset, raw in enumerate(chunk)]
+            yield start, chunk, keep, check, with_stats
+
+    for chunk_stats, report in map_chunks(check_chunk, tasks(), workers):
+        if with_stats:
+            stats += chunk_stats
+        if cache is None:
+            sink.add_report(report)
+            continue
+
+        keys, cached = pending.popleft()
+        fresh = defaultdict(list)
+        for severity, rule, index, message in report.diagnostics:
+            fresh[index].append((severity, rule, message))
+        for offset, (key, result) in enumerate(zip(keys, cached)):
+            index = report.start + offset
+            if result is None:
+                result = fresh.get(index, [])
+                cache.store(key, result)
+            for severity, rule, message in result:
+                sink.add(severity, rule, index, message)
+    return stats
+
+
+def allocate_sample(sizes: Dict, size: int) -> Dict:
+    """Sample size per stratum, proportional to stratum size (at least one each)"""
+    population = sum(sizes.values())
+    if size >= population:
+        return dict(sizes)
+    return {key: min(count, max(1, round(size * count / population))) for key, count in sizes.items()}
+
+
+def draw_sample(strata: Dict[object, Sequence[int]], size: int, rng: random.Random) -> Dict[object, List[int]]:
+    """Positions drawn without replacement from each stratum, in proportion to its size"""
+    allocation = allocate_sample({key: len(positions) for key, positions in strata.items()}, size)
+    return {key: sorted(strata[key][i] for i in rng.sample(range(len(strata[key])), allocation[key]))
+            for key in strata}
+
+
+def reservoir_sample(records: Iterable, size: int, rng: random.Random) -> Tuple[Dict[int, object], int]:
+    """``size`` records drawn uniformly from a stream read once, by position, and the stream's length
+
+    Only the sample is held in memory, however long the stream is.
+    """
+    sample: Dict[int, object] = {}
+    slots: List[int] = []
+    total = 0
+    for position, record in enumerate(records):
+        total += 1
+        if len(slots) < size:
+            slots.append(position)
+            sample[position] = record
+            continue
+        slot = rng.randrange(position + 1)
+        if slot < size:
+            del sample[slots[slot]]
+            slots[slot] = position
+            sample[position] = record
+    return sample, total
+
+
+class ErrorRateEstimate:
+    """Share of records with at least one error, estimated from a sample"""
+
+    def __init__(self, population: int, sampled: int, bad: int, rate: float, low: float, high: float,
+                 confidence: float, strata: int = 1):
+        self.population = population
+        self.sampled = sampled
+        self.bad = bad
+        self.rate = rate
+        self.low = low
+        self.high = high
+        self.confidence = confidence
+        self.strata = strata
+
+    @property
+    def max_bad_records(self) -> int:
+        """Upper bound on the number of records with errors"""
+        return math.ceil(self.high * self.population - 1e-9)
+
+    def to_dict(self) -> Dict:
+        return {
+            'population': self.population,
+            'sampled': self.sampled,
+            'strata': self.strata,
+            'bad_in_sample': self.bad,
+            'error_rate': self.rate,
+            'confidence': self.confidence,
+            'error_rate_low': self.low,
+            'error_rate_high': self.high,
+            'max_bad_records': self.max_bad_records,
+        }
+
+
+def _finite_population_correction(population: int, sampled: int) -> float:
+    return (population - sampled) / (population - 1) if population > 1 else 0.0
+
+
+def wilson_interval(bad: int, sampled: int, population: int, z: float) -> Tuple[float, float]:
+    """Wilson score interval for a proportion, narrowed for sampling without replacement"""
+    if not sampled:
+        return 0.0, 1.0
+    fpc = _finite_population_correction(population, sampled)
+    if not fpc:
+        rate = bad / sampled
+        return rate, rate
+    # Sampling without replacement has the variance of a larger sample with replacement
+    n = sampled / fpc
+    p = bad / sampled
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def estimate_error_rate(strata: Dict[object, Tuple[int, int, int]], confidence: float = 0.95) -> ErrorRateEstimate:
+    """Error rate with a two-sided confidence interval from ``{stratum: (population, sampled, bad)}``
+
+    One stratum uses the Wilson interval. Several are combined as a
+    stratified estimate, weighting each by its share of the population.
+    Stratum variances use Agresti-Coull adjusted proportions, so a stratum
+    with no errors in its sample still adds uncertainty.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    population = sum(n for n, _, _ in strata.values())
+    sampled = sum(s for _, s, _ in strata.values())
+    bad = sum(b for _, _, b in strata.values())
+
+    if not sampled:
+        return ErrorRateEstimate(population, 0, 0, 0.0, 0.0, 1.0, confidence, len(strata))
+    if len(strata) == 1:
+        rate = bad / sampled
+        low, high = wilson_interval(bad, sampled, population, z)
+    else:
+        rate = variance = 0.0
+        for stratum_population, stratum_sampled, stratum_bad in strata.values():
+            if not stratum_sampled:
+                continue
+            weight = stratum_population / population
+            rate += weight * stratum_bad / stratum_sampled
+            adjusted = (stratum_bad + 2) / (stratum_sampled + 4)
+            variance += (weight ** 2 * adjusted * (1 - adjusted) / (stratum_sampled + 4)
+                         * _finite_population_correction(stratum_population, stratum_sampled))
+        half = z * math.sqrt(variance)
+        low, high = max(0.0, rate - half), min(1.0, rate + half)
+
+    # What the sample showed holds for certain, whatever the interval says
+    if population:
+        low = max(low, bad / population)
+        high = min(high, 1 - (sampled - bad) / population)
+    return ErrorRateEstimate(population, sampled, bad, rate, low, high, confidence, len(strata))
+
+
+def print_error_rate_estimate(estimate: ErrorRateEstimate, record_name: str = 'records'):
+    """Sampling section of a validation report"""
+    print(f"\n🎲 SAMPLE: {estimate.sampled} of {estimate.population} {record_name}"
+          + (f" in {estimate.strata} strata" if estimate.strata > 1 else ""))
+    print(f"  With errors in sample: {estimate.bad}")
+    print(f"  Estimated error rate: {estimate.rate:.3%} "
+          f"({estimate.confidence:.0%} CI {estimate.low:.3%} - {estimate.high:.3%})")
+    print(f"  At most {estimate.max_bad_records} {record_name} with errors ({estimate.confidence:.0%} confidence)")
+
+
+def validate_sample(strata: Dict[object, Sequence[int]], size: int, read: Callable[[int], bytes], rules,
+                    sink: DiagnosticSink, rng: random.Random, confidence: float = 0.95) -> ErrorRateEstimate:
+    """Validate a sample of records and estimate the error rate of all of them
+
+    ``strata`` maps each stratum to the positions of its records, ``read``
+    returns the raw record at a position, and ``rules.check(raw, position)``
+    reports to ``rules.report``. A record counts as bad if it raised any error.
+    """
+    sample = draw_sample(strata, size, rng)
+    return validate_drawn_sample(sample, {key: len(positions) for key, positions in strata.items()},
+                                 read, rules, sink, confidence)
+
+
+def validate_drawn_sample(sample: Dict[object, Sequence[int]], population: Dict[object, int],
+                          read: Callable[[int], bytes], rules, sink: DiagnosticSink,
+                          confidence: float = 0.95) -> ErrorRateEstimate:
+    """Validate records already sampled (positions per stratum) out of ``population`` records per stratum"""
+    stratum_of = {position: key for key, positions in sample.items() for position in positions}
+    bad = Counter()
+    # Corpus order, so a compressed file is read forward once
+    for position in sorted(stratum_of):
+        errors_before = rules.report.error_count()
+        rules.check(read(position), position)
+        if rules.report.error_count() > errors_before:
+            bad[stratum_of[position]] += 1
+    sink.add_report(rules.report)
+    return estimate_error_rate({key: (population[key], len(sample[key]), bad[key]) for key in population},
+                               confidence)